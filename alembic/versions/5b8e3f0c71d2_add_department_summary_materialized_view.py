@@ -0,0 +1,53 @@
+"""Add department_summary materialized view
+
+Revision ID: 5b8e3f0c71d2
+Revises: c41d7e9f2a68
+Create Date: 2026-10-19 17:21:47.330562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e3f0c71d2'
+down_revision: Union[str, Sequence[str], None] = 'c41d7e9f2a68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Тот же запрос, что и в data/summary.py CREATE_VIEW
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW department_summary AS
+        WITH RECURSIVE tree AS (
+            SELECT id, name, parent_id, ARRAY[id] AS path_ids, name::text AS path, 0 AS depth,
+                direct_employee_count, subtree_employee_count, subtree_department_count
+            FROM departments
+            WHERE parent_id IS NULL
+            UNION ALL
+            SELECT departments.id, departments.name, departments.parent_id,
+                tree.path_ids || departments.id, tree.path || ' / ' || departments.name,
+                tree.depth + 1, departments.direct_employee_count,
+                departments.subtree_employee_count, departments.subtree_department_count
+            FROM departments JOIN tree ON departments.parent_id = tree.id
+        )
+        SELECT id, name, parent_id, path, path_ids, depth,
+            direct_employee_count AS headcount,
+            subtree_employee_count AS subtree_headcount,
+            subtree_department_count AS subtree_size
+        FROM tree
+        """
+    )
+    # REFRESH ... CONCURRENTLY требует уникальный индекс
+    op.create_index('ix_department_summary_id', 'department_summary', ['id'], unique=True)
+    op.create_index('ix_department_summary_path_ids', 'department_summary', ['path_ids'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW department_summary")
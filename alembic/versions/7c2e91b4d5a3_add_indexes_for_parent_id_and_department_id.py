@@ -0,0 +1,35 @@
+"""Add indexes for parent_id and department_id FK fields
+
+Revision ID: 7c2e91b4d5a3
+Revises: 4dcf8d673b00
+Create Date: 2026-10-19 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e91b4d5a3'
+down_revision: Union[str, Sequence[str], None] = '4dcf8d673b00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_departments_parent_id', 'departments', ['parent_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_departments_parent_id_name', 'departments', ['parent_id', 'name'], unique=True, postgresql_concurrently=True)
+        op.create_index('ix_employees_department_id_full_name', 'employees', ['department_id', 'full_name'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_employees_department_id_full_name', table_name='employees', postgresql_concurrently=True)
+        op.drop_index('ix_departments_parent_id_name', table_name='departments', postgresql_concurrently=True)
+        op.drop_index('ix_departments_parent_id', table_name='departments', postgresql_concurrently=True)
@@ -0,0 +1,39 @@
+"""Enforce unique sibling names and forbid self parent in Department model
+
+Revision ID: a94f0d6b3e18
+Revises: 7c2e91b4d5a3
+Create Date: 2026-10-19 11:03:17.240965
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a94f0d6b3e18'
+down_revision: Union[str, Sequence[str], None] = '7c2e91b4d5a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('uq_departments_parent_id_name', 'departments', ['parent_id', 'name'], unique=True, postgresql_concurrently=True, postgresql_nulls_not_distinct=True)
+        # Ограничение на основе уже построенного индекса не требует повторного сканирования таблицы
+        op.execute('ALTER TABLE departments ADD CONSTRAINT uq_departments_parent_id_name UNIQUE USING INDEX uq_departments_parent_id_name')
+        op.drop_index('ix_departments_parent_id_name', table_name='departments', postgresql_concurrently=True)
+
+    op.execute('ALTER TABLE departments ADD CONSTRAINT parent_id_not_self_check CHECK (parent_id <> id) NOT VALID')
+    op.execute('ALTER TABLE departments VALIDATE CONSTRAINT parent_id_not_self_check')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('parent_id_not_self_check', 'departments', type_='check')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_departments_parent_id_name', 'departments', ['parent_id', 'name'], unique=True, postgresql_concurrently=True)
+        op.drop_constraint('uq_departments_parent_id_name', 'departments', type_='unique')
@@ -0,0 +1,59 @@
+"""Add maintained subtree counters to Department model
+
+Revision ID: c41d7e9f2a68
+Revises: a94f0d6b3e18
+Create Date: 2026-10-19 16:05:12.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7e9f2a68'
+down_revision: Union[str, Sequence[str], None] = 'a94f0d6b3e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Константный DEFAULT не переписывает таблицу
+    op.add_column('departments', sa.Column('direct_employee_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('departments', sa.Column('subtree_employee_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('departments', sa.Column('subtree_department_count', sa.Integer(), server_default='0', nullable=False))
+    # Начальные значения, тот же пересчёт, что и в data/counters.py rebuild
+    op.execute(
+        """
+        WITH RECURSIVE closure AS (
+            SELECT id AS ancestor_id, id AS descendant_id FROM departments
+            UNION ALL
+            SELECT closure.ancestor_id, departments.id
+            FROM departments JOIN closure ON departments.parent_id = closure.descendant_id
+        ),
+        expected AS (
+            SELECT
+                closure.ancestor_id AS id,
+                count(employees.id) FILTER (WHERE closure.descendant_id = closure.ancestor_id) AS direct_employee_count,
+                count(employees.id) AS subtree_employee_count,
+                count(DISTINCT closure.descendant_id) - 1 AS subtree_department_count
+            FROM closure LEFT JOIN employees ON employees.department_id = closure.descendant_id
+            GROUP BY closure.ancestor_id
+        )
+        UPDATE departments
+        SET direct_employee_count = expected.direct_employee_count,
+            subtree_employee_count = expected.subtree_employee_count,
+            subtree_department_count = expected.subtree_department_count
+        FROM expected
+        WHERE departments.id = expected.id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('departments', 'subtree_department_count')
+    op.drop_column('departments', 'subtree_employee_count')
+    op.drop_column('departments', 'direct_employee_count')
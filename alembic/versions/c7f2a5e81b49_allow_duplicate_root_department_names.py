@@ -0,0 +1,30 @@
+"""Allow duplicate root department names
+
+Revision ID: c7f2a5e81b49
+Revises: b5e0c9a7d312
+Create Date: 2026-10-20 10:12:37.804119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2a5e81b49'
+down_revision: Union[str, Sequence[str], None] = 'b5e0c9a7d312'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('uq_departments_parent_id_name', table_name='departments')
+    op.create_index('uq_departments_parent_id_name', 'departments', ['parent_id', 'name'], unique=True, postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_departments_parent_id_name', table_name='departments')
+    op.create_index('uq_departments_parent_id_name', 'departments', ['parent_id', 'name'], unique=True, postgresql_nulls_not_distinct=True, postgresql_where=sa.text('deleted_at IS NULL'))
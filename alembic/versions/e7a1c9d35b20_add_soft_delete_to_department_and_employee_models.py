@@ -0,0 +1,79 @@
+"""Add soft delete to Department and Employee models
+
+Revision ID: e7a1c9d35b20
+Revises: 5b8e3f0c71d2
+Create Date: 2026-10-19 21:08:42.517304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a1c9d35b20'
+down_revision: Union[str, Sequence[str], None] = '5b8e3f0c71d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SUMMARY_VIEW = """
+    CREATE MATERIALIZED VIEW department_summary AS
+    WITH RECURSIVE tree AS (
+        SELECT id, name, parent_id, ARRAY[id] AS path_ids, name::text AS path, 0 AS depth,
+            direct_employee_count, subtree_employee_count, subtree_department_count
+        FROM departments
+        WHERE parent_id IS NULL{roots}
+        UNION ALL
+        SELECT departments.id, departments.name, departments.parent_id,
+            tree.path_ids || departments.id, tree.path || ' / ' || departments.name,
+            tree.depth + 1, departments.direct_employee_count,
+            departments.subtree_employee_count, departments.subtree_department_count
+        FROM departments JOIN tree ON departments.parent_id = tree.id{children}
+    )
+    SELECT id, name, parent_id, path, path_ids, depth,
+        direct_employee_count AS headcount,
+        subtree_employee_count AS subtree_headcount,
+        subtree_department_count AS subtree_size
+    FROM tree
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('departments', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('employees', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_departments_deleted_at', 'departments', ['deleted_at'], unique=False, postgresql_concurrently=True, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+        op.create_index('ix_employees_deleted_at', 'employees', ['deleted_at'], unique=False, postgresql_concurrently=True, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+        # Уникальность только среди неудалённых: частичный индекс вместо ограничения
+        op.create_index('uq_departments_parent_id_name_alive', 'departments', ['parent_id', 'name'], unique=True, postgresql_concurrently=True, postgresql_nulls_not_distinct=True, postgresql_where=sa.text('deleted_at IS NULL'))
+    op.drop_constraint('uq_departments_parent_id_name', 'departments', type_='unique')
+    op.execute('ALTER INDEX uq_departments_parent_id_name_alive RENAME TO uq_departments_parent_id_name')
+
+    # Тот же запрос, что и в data/summary.py CREATE_VIEW
+    op.execute('DROP MATERIALIZED VIEW department_summary')
+    op.execute(SUMMARY_VIEW.format(roots=' AND deleted_at IS NULL', children='\n        WHERE departments.deleted_at IS NULL'))
+    op.create_index('ix_department_summary_id', 'department_summary', ['id'], unique=True)
+    op.create_index('ix_department_summary_path_ids', 'department_summary', ['path_ids'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP MATERIALIZED VIEW department_summary')
+    # Удалённые строки перестанут быть скрытыми, поэтому удаляются окончательно. Их
+    # потомки и сотрудники удаляются каскадом внешних ключей, а счётчики уже учитывают удаление
+    op.execute('DELETE FROM employees WHERE deleted_at IS NOT NULL')
+    op.execute('DELETE FROM departments WHERE deleted_at IS NOT NULL')
+    op.execute(SUMMARY_VIEW.format(roots='', children=''))
+    op.create_index('ix_department_summary_id', 'department_summary', ['id'], unique=True)
+    op.create_index('ix_department_summary_path_ids', 'department_summary', ['path_ids'], unique=False, postgresql_using='gin')
+
+    op.drop_index('uq_departments_parent_id_name', table_name='departments')
+    op.create_unique_constraint('uq_departments_parent_id_name', 'departments', ['parent_id', 'name'], postgresql_nulls_not_distinct=True)
+    op.drop_index('ix_employees_deleted_at', table_name='employees')
+    op.drop_index('ix_departments_deleted_at', table_name='departments')
+    op.drop_column('employees', 'deleted_at')
+    op.drop_column('departments', 'deleted_at')
@@ -0,0 +1,107 @@
+"""
+Сравнение планов горячих запросов с индексами по `departments.parent_id` и
+`employees.department_id` и без них. Запускается на тестовой БД, т.к. пересоздаёт таблицы:
+
+    PYTHONPATH=src/organization_api python benchmarks/index_plans.py > bench_output.txt
+"""
+
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from config import env
+from data.sql_models import Base
+
+TEST_DB_URL = (
+    f"postgresql+asyncpg://{env.postgres_user}:"
+    f"{env.postgres_password}"
+    f"@{env.postgres_test_host}:{env.postgres_test_port}/{env.postgres_test_db}"
+)
+
+DEPARTMENTS = 20_000
+EMPLOYEES = 200_000
+FANOUT = 8
+
+INDEXES = (
+    "ix_departments_parent_id",
+    "ix_employees_department_id_full_name",
+)
+# Уникальность имён соседей: ограничение или уникальный индекс, удаляется в любом виде
+UNIQUE_SIBLING_NAMES = "uq_departments_parent_id_name"
+
+SEED = (
+    f"""
+    INSERT INTO departments (id, name, parent_id)
+    SELECT id, 'Department ' || id, CASE WHEN id = 1 THEN NULL ELSE (id - 2) / {FANOUT} + 1 END
+    FROM generate_series(1, {DEPARTMENTS}) AS id
+    """,
+    f"""
+    INSERT INTO employees (department_id, full_name, position)
+    SELECT 1 + (id * 7919) % {DEPARTMENTS}, 'Employee ' || md5(id::text), 'Engineer'
+    FROM generate_series(1, {EMPLOYEES}) AS id
+    """,
+    "ANALYZE departments",
+    "ANALYZE employees",
+)
+
+QUERIES = {
+    "children lookup (selectin children)": (
+        "SELECT id, name, parent_id, created_at FROM departments "
+        "WHERE parent_id IN (2, 3, 4)"
+    ),
+    "employees of departments (selectin employees)": (
+        "SELECT id, department_id, full_name, position, hired_at, created_at "
+        "FROM employees WHERE department_id IN (2, 3, 4) ORDER BY full_name"
+    ),
+    "cascade delete of a subtree": "DELETE FROM departments WHERE id = 30",
+}
+
+
+async def main() -> None:
+    engine = create_async_engine(TEST_DB_URL)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+            await connection.run_sync(Base.metadata.create_all)
+            for statement in SEED:
+                await connection.execute(text(statement))
+
+        async with engine.connect() as connection:
+            for title, query in QUERIES.items():
+                print(f"=== {title} ===")
+                print("--- without indexes ---")
+                print(await explain(connection, query, drop_indexes=True))
+                print("--- with indexes ---")
+                print(await explain(connection, query, drop_indexes=False))
+
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+    finally:
+        await engine.dispose()
+
+
+async def explain(connection: AsyncConnection, query: str, drop_indexes: bool) -> str:
+    # Всё выполняется в транзакции, которая откатывается: и DROP INDEX, и DELETE
+    transaction = await connection.begin()
+    try:
+        if drop_indexes:
+            for index in INDEXES:
+                await connection.execute(text(f"DROP INDEX {index}"))
+            await connection.execute(
+                text(
+                    "ALTER TABLE departments "
+                    f"DROP CONSTRAINT IF EXISTS {UNIQUE_SIBLING_NAMES}"
+                )
+            )
+            await connection.execute(text(f"DROP INDEX IF EXISTS {UNIQUE_SIBLING_NAMES}"))
+        result = await connection.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {query}")
+        )
+        return "\n".join(row[0] for row in result)
+    finally:
+        await transaction.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Микробенчмарк выборки подразделения по ID: новая конструкция `select()` с опциями
+загрузки на каждый вызов против заранее собранной (см. data/repositories.py), с кэшем
+подготовленных выражений asyncpg и без него. Запускается на тестовой БД, т.к.
+пересоздаёт таблицы:
+
+    PYTHONPATH=src/organization_api python benchmarks/prebuilt_statements.py
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import env
+from data.repositories import DEPARTMENT_WITH_EMPLOYEES, DepartmentRepository
+from data.sql_models import Base, Department
+
+TEST_DB_URL = (
+    f"postgresql+asyncpg://{env.postgres_user}:"
+    f"{env.postgres_password}"
+    f"@{env.postgres_test_host}:{env.postgres_test_port}/{env.postgres_test_db}"
+)
+
+DEPARTMENTS = 1_000
+EMPLOYEES = 10_000
+FANOUT = 8
+ITERATIONS = 2_000
+
+SEED = (
+    f"""
+    INSERT INTO departments (id, name, parent_id)
+    SELECT id, 'Department ' || id, CASE WHEN id = 1 THEN NULL ELSE (id - 2) / {FANOUT} + 1 END
+    FROM generate_series(1, {DEPARTMENTS}) AS id
+    """,
+    f"""
+    INSERT INTO employees (department_id, full_name, position)
+    SELECT 1 + (id * 7919) % {DEPARTMENTS}, 'Employee ' || md5(id::text), 'Engineer'
+    FROM generate_series(1, {EMPLOYEES}) AS id
+    """,
+    "ANALYZE departments",
+    "ANALYZE employees",
+)
+
+
+async def fresh_select(session: AsyncSession, id: int) -> None:
+    """Как было до сборки выражений заранее"""
+    statement = (
+        select(Department)
+        .options(
+            selectinload(Department.employees),
+            selectinload(Department.children),
+        )
+        .where(Department.id == id)
+    )
+    await session.execute(statement)
+
+
+async def prebuilt(session: AsyncSession, id: int) -> None:
+    await session.execute(DEPARTMENT_WITH_EMPLOYEES, {"id": id})
+
+
+async def repository(session: AsyncSession, id: int) -> None:
+    await DepartmentRepository(session).get_with_employees(id)
+
+
+async def measure(
+    session_maker: async_sessionmaker[AsyncSession],
+    query: Callable[[AsyncSession, int], Awaitable[None]],
+) -> float:
+    async with session_maker() as session:
+        # Прогрев: компиляция SQL и подготовка выражений на соединении
+        await query(session, 1)
+        started = time.perf_counter()
+        for iteration in range(ITERATIONS):
+            await query(session, 1 + iteration % DEPARTMENTS)
+            # Без этого identity map разрастается и меряется уже не запрос
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+    return elapsed / ITERATIONS * 1_000_000
+
+
+async def main() -> None:
+    engine = create_async_engine(TEST_DB_URL)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+        for statement in SEED:
+            await connection.execute(text(statement))
+    await engine.dispose()
+
+    for cache_size in (0, env.db_prepared_statement_cache_size):
+        engine = create_async_engine(
+            TEST_DB_URL,
+            pool_size=1,
+            connect_args={"prepared_statement_cache_size": cache_size},
+        )
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+        print(f"=== prepared_statement_cache_size={cache_size} ===")
+        for query in (fresh_select, prebuilt, repository):
+            microseconds = await measure(session_maker, query)
+            print(f"{query.__name__:>14}: {microseconds:8.1f} us/call")
+        await engine.dispose()
+
+    engine = create_async_engine(TEST_DB_URL)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Контроль допуска для тяжёлых чтений дерева. Каждый запрос занимает из общей ёмкости столько
+единиц, сколько подразделений (и сотрудников) он загрузит. Если ёмкости не хватает, запрос
+ждёт в ограниченной очереди, а при её переполнении или по таймауту отклоняется с 503
+"""
+
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from collections.abc import AsyncGenerator
+
+from config import env
+from exceptions import AdmissionRejected
+from metrics import Counter, Gauge
+
+queue_depth = Gauge("admission_queue_depth", "Requests waiting for admission")
+in_flight_cost = Gauge("admission_in_flight_cost", "Cost units currently admitted")
+admitted_total = Counter("admission_admitted_total", "Admitted requests")
+shed_total = Counter("admission_shed_total", "Rejected requests by reason")
+
+Waiter = tuple[int, asyncio.Future]
+
+EMPLOYEES_PER_COST_UNIT = 50
+
+
+def estimate_cost(departments: int, employees: int) -> int:
+    """Единица стоимости примерно равна загрузке одного подразделения"""
+    return departments + employees // EMPLOYEES_PER_COST_UNIT
+
+
+class AdmissionController:
+    def __init__(self, capacity: int, max_queue: int, queue_timeout_s: float) -> None:
+        self.capacity = capacity
+        self.available = capacity
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._waiters: deque[Waiter] = deque()
+
+    @asynccontextmanager
+    async def admit(self, cost: int) -> AsyncGenerator[None, None]:
+        # Запрос дороже всей ёмкости всё равно можно выполнить, но только в одиночку
+        cost = min(max(cost, 1), self.capacity)
+        await self._acquire(cost)
+        admitted_total.inc()
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+    async def _acquire(self, cost: int) -> None:
+        if not self._waiters and self.available >= cost:
+            self._take(cost)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full")
+
+        waiter = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        queue_depth.set(len(self._waiters))
+        try:
+            async with asyncio.timeout(self.queue_timeout_s):
+                await waiter[1]
+        except BaseException as exc:
+            self._abandon(waiter)
+            if isinstance(exc, TimeoutError):
+                self._shed("queue_timeout")
+            raise
+        finally:
+            queue_depth.set(len(self._waiters))
+
+    def _abandon(self, waiter: Waiter) -> None:
+        cost, future = waiter
+        if future.done() and not future.cancelled():
+            # Ёмкость выдана одновременно с таймаутом/отменой, возвращаем её
+            self._release(cost)
+        elif waiter in self._waiters:
+            self._waiters.remove(waiter)
+            self._wake()
+
+    def _release(self, cost: int) -> None:
+        self.available += cost
+        in_flight_cost.set(self.capacity - self.available)
+        self._wake()
+
+    def _wake(self) -> None:
+        # FIFO: дорогой запрос в голове очереди не обгоняется дешёвыми
+        while self._waiters and self._waiters[0][0] <= self.available:
+            cost, future = self._waiters.popleft()
+            if not future.done():
+                self._take(cost)
+                future.set_result(None)
+
+    def _take(self, cost: int) -> None:
+        self.available -= cost
+        in_flight_cost.set(self.capacity - self.available)
+
+    def _shed(self, reason: str) -> None:
+        shed_total.inc(reason=reason)
+        retry_after = math.ceil(self.queue_timeout_s)
+        raise AdmissionRejected("Server is busy, retry later", retry_after)
+
+
+admission_controller = AdmissionController(
+    env.admission_capacity, env.admission_max_queue, env.admission_queue_timeout_s
+)
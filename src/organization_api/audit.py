@@ -0,0 +1,123 @@
+"""
+Журнал изменений организации. Синхронная запись добавила бы запрос к каждой мутации,
+поэтому события кладутся в ограниченную очередь процесса, а фоновый писатель сбрасывает их
+многострочным INSERT по `batch_size` событий или через `flush_interval_ms` после первого
+события пакета. Переполненная очередь притормаживает мутации (backpressure), а не теряет
+события. При остановке lifespan дописывает остаток очереди
+"""
+
+import asyncio
+from collections.abc import Mapping
+from datetime import UTC, datetime
+from typing import Any
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import background
+from config import env
+from metrics import Counter
+from data.repositories import AuditRepository
+from data.db_connection import get_session_maker
+
+audit_events_written_total = Counter(
+    "audit_events_written_total", "Audit events written to the database"
+)
+audit_events_dropped_total = Counter(
+    "audit_events_dropped_total", "Audit events lost because a batch insert failed"
+)
+audit_backpressure_total = Counter(
+    "audit_backpressure_total", "Mutations that waited for room in the audit queue"
+)
+
+# Сигнал писателю дописать пакет и завершиться
+_STOP: Mapping[str, Any] = {}
+
+
+class AuditLog:
+    def __init__(self, max_queue: int, batch_size: int, flush_interval_ms: float) -> None:
+        # None: основной движок приложения, тесты подставляют свой
+        self.session_maker: async_sessionmaker[AsyncSession] | None = None
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_ms / 1000
+        self._writer: asyncio.Task | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        self._queue: asyncio.Queue[Mapping[str, Any]] = asyncio.Queue(self.max_queue)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def record(
+        self, action: str, entity: str, entity_id: int, **details: Any
+    ) -> None:
+        event = {
+            "occurred_at": datetime.now(UTC),
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "details": details,
+        }
+        if self._queue.full():
+            audit_backpressure_total.inc()
+        await self._queue.put(event)
+
+    def start(self) -> None:
+        self._writer = background.spawn(self._run())
+
+    async def close(self) -> None:
+        """Остановка писателя без потери пакета и запись того, что осталось в очереди"""
+        if self._writer is not None:
+            await self._queue.put(_STOP)
+            await self._writer
+            self._writer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                event = self._queue.get_nowait()
+                if event is not _STOP:
+                    batch.append(event)
+            await self._write(batch)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_s
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            stopping = batch[-1] is _STOP
+            await self._write([event for event in batch if event is not _STOP])
+            if stopping:
+                return
+
+    async def _write(self, batch: list[Mapping[str, Any]]) -> None:
+        if not batch:
+            return
+        session_maker = self.session_maker or get_session_maker()
+        try:
+            async with session_maker() as session:
+                await AuditRepository(session).insert_many(batch)
+        except Exception:
+            # Журнал не должен ронять писателя: пакет теряется, но это видно в метриках
+            logger.exception(f"Failed to write {len(batch)} audit events")
+            audit_events_dropped_total.inc(len(batch))
+        else:
+            audit_events_written_total.inc(len(batch))
+
+
+audit_log = AuditLog(
+    env.audit_max_queue, env.audit_batch_size, env.audit_flush_interval_ms
+)
@@ -0,0 +1,70 @@
+"""
+Фоновые задачи внутри процесса. Ссылки на задачи хранятся здесь, иначе asyncio может
+собрать их сборщиком мусора до завершения.
+
+Задача запускается в пустом контексте, а не в копии контекста запроса, который её
+породил: иначе она унаследовала бы, например, `statement_timeout_ms` по бюджету маршрута
+"""
+
+import asyncio
+import contextvars
+from collections.abc import Awaitable, Callable, Coroutine
+
+from loguru import logger
+
+tasks: set[asyncio.Task] = set()
+
+
+def spawn(
+    coroutine: Coroutine, context: contextvars.Context | None = None
+) -> asyncio.Task:
+    """`context`: явно переданный контекст, например копия контекста запроса"""
+    if context is None:
+        context = contextvars.Context()
+    task = asyncio.get_running_loop().create_task(coroutine, context=context)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
+async def cancel_all() -> None:
+    """При остановке: отложенные задачи не должны работать с уже закрытым движком"""
+    for task in list(tasks):
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class Debouncer:
+    """
+    Вызывает `callback` через `delay_s` после последнего `trigger()`. Уже запущенный
+    вызов не прерывается, а параллельно не выполняется больше одного вызова
+    """
+
+    def __init__(self, delay_s: float, callback: Callable[[], Awaitable[None]]) -> None:
+        self.delay_s = delay_s
+        self.callback = callback
+        self._waiting: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> bool:
+        return self._waiting is not None
+
+    def trigger(self) -> None:
+        if self._waiting is not None:
+            self._waiting.cancel()
+        self._waiting = spawn(self._wait_and_run())
+
+    def cancel(self) -> None:
+        if self._waiting is not None:
+            self._waiting.cancel()
+            self._waiting = None
+
+    async def _wait_and_run(self) -> None:
+        await asyncio.sleep(self.delay_s)
+        self._waiting = None
+        async with self._lock:
+            try:
+                await self.callback()
+            except Exception:
+                logger.exception(f"Debounced {self.callback.__qualname__} failed")
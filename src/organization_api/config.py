@@ -23,6 +23,73 @@ class Env(BaseSettings):
 
     pythonpath: str
 
+    db_pool_size: int = 5
+    # Кэш подготовленных выражений asyncpg на каждом соединении (LRU по тексту SQL)
+    db_prepared_statement_cache_size: int = 500
+    # Прогрев при старте, см. lifespan.py: все соединения пула, индекс и снимок
+    warm_up_preload: bool = True
+
+    slow_query_threshold_ms: float = 200
+    slow_query_explain_interval_s: float = 300
+
+    admission_capacity: int = 100
+    admission_max_queue: int = 50
+    admission_queue_timeout_s: float = 5
+    subtree_size_cache_ttl_s: float = 30
+
+    # Бюджеты времени по имени маршрута, см. middleware.RequestBudgetMiddleware
+    default_route_timeout_s: float = 10
+    route_timeouts_s: dict[str, float] = {
+        "get_department": 5,
+        "change_department": 5,
+        "delete_department": 30,
+        "export_organization": 600,
+        "stream_changes": 960,
+    }
+
+    export_batch_size: int = 1000
+
+    # Как часто индекс data/org_graph.py догоняет записи других процессов
+    org_graph_sync_interval_s: float = 1
+
+    snapshot_debounce_s: float = 1
+    # Как долго снимок верит прочитанной голове ленты изменений, см. snapshot.py
+    snapshot_head_ttl_s: float = 1
+
+    summary_refresh_debounce_s: float = 5
+
+    # Мягко удалённое можно восстановить в течение `soft_delete_retention_s`, потом
+    # services.PurgeWorker удаляет строки порциями, но только в часы `purge_window_utc`
+    # ([начало, конец), может переходить через полночь, например [22, 6])
+    soft_delete_retention_s: float = 7 * 24 * 3600
+    purge_interval_s: float = 600
+    purge_batch_size: int = 500
+    purge_window_utc: tuple[int, int] = (0, 24)
+    jobs_retained: int = 1000
+
+    # Журнал изменений, см. audit.py: пакет сбрасывается по числу событий или по времени
+    audit_max_queue: int = 10_000
+    audit_batch_size: int = 500
+    audit_flush_interval_ms: float = 200
+
+    # Лента изменений, см. data/changes.py. SSE-поток будится записями этого процесса, а
+    # записи других процессов подхватывает опросом; поток закрывается через
+    # `changes_stream_max_s` (раньше бюджета маршрута), клиент переподключается с Last-Event-ID
+    changes_poll_interval_s: float = 5
+    changes_stream_max_s: float = 900
+
+    # Ответы на POST с Idempotency-Key, см. idempotency.py. Таблица `idempotency_keys`
+    # переживает перезапуск и видна всем процессам, но добавляет запросы к каждой записи
+    idempotency_max_entries: int = 10_000
+    idempotency_ttl_s: float = 24 * 3600
+    idempotency_persist: bool = False
+    idempotency_prune_interval_s: float = 3600
+    # Заглушка выполняющегося запроса живёт не дольше `idempotency_lease_s` (процесс мог
+    # упасть), а дубль ждёт его ответ не дольше `idempotency_wait_s`, потом получает 409
+    idempotency_lease_s: float = 60
+    idempotency_wait_s: float = 5
+    idempotency_poll_interval_s: float = 0.05
+
     model_config = SettingsConfigDict(env_file=ENV)
 
 
@@ -0,0 +1,48 @@
+"""
+Лента изменений для зеркал. Каждая запись репозиториев в той же транзакции добавляет в
+`changes` строки с номером из последовательности для затронутых подразделений и
+сотрудников, а зеркало забирает только их после своего последнего номера (GET /changes),
+то есть синхронизируется за O(изменений), а не O(организации).
+
+Номер выдаётся при вставке, а виден после фиксации, и без блокировки транзакция с меньшим
+номером могла бы зафиксироваться позже большего: читатель сдвинул бы курсор и пропустил
+её. Поэтому номера выдаются под транзакционной advisory-блокировкой, которая держится до
+фиксации, и порядок номеров совпадает с порядком фиксаций. Запись изменений идёт последней
+в транзакции, чтобы блокировка держалась недолго.
+
+Счётчики предков (data/counters.py) производные и в ленту не попадают
+"""
+
+from collections.abc import Collection
+
+from sqlalchemy import Executable, Integer, func, insert, literal, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from data.sql_models import Change
+
+DEPARTMENT = "department"
+EMPLOYEE = "employee"
+
+# Ключ pg_advisory_xact_lock, общий для всех пишущих ленту процессов
+SEQUENCE_LOCK_KEY = 0x6368616E676573
+
+
+def recorded(
+    departments: Collection[int] = (), employees: Collection[int] = ()
+) -> list[Executable]:
+    """Выражения, добавляющие в ленту изменения подразделений и сотрудников по ID"""
+    rows = [
+        # Один параметр-массив вместо строки VALUES на ID: размер поддерева не упирается
+        # в лимит параметров запроса
+        select(literal(entity), func.unnest(literal(list(ids), ARRAY(Integer))))
+        for entity, ids in ((DEPARTMENT, departments), (EMPLOYEE, employees))
+        if ids
+    ]
+    if not rows:
+        return []
+    return [
+        select(func.pg_advisory_xact_lock(SEQUENCE_LOCK_KEY)),
+        insert(Change).from_select(
+            ["entity", "entity_id"], rows[0] if len(rows) == 1 else union_all(*rows)
+        ),
+    ]
@@ -0,0 +1,229 @@
+"""
+Поддерживаемые счётчики подразделений: `direct_employee_count`, `subtree_employee_count`
+и `subtree_department_count` (потомки без самого подразделения). Репозитории меняют их
+дельтами вдоль цепочки предков в той же транзакции, что и саму запись, поэтому численность
+читается из одной строки, без обхода поддерева.
+
+Расхождения (ручные правки в БД, гонки параллельных переносов) находятся и исправляются
+пересчётом с нуля:
+
+    python3 src/organization_api/data/counters.py verify
+    python3 src/organization_api/data/counters.py rebuild
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import (
+    CTE,
+    ColumnElement,
+    Executable,
+    RowMapping,
+    ScalarSelect,
+    Subquery,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data.sql_models import Department, Employee
+from data.db_connection import get_session_maker
+
+Delta = int | ColumnElement | ScalarSelect
+
+
+def shift_subtree_counts(
+    id: int | None, employees: Delta = 0, departments: Delta = 0
+) -> list[Executable]:
+    """Сдвиг счётчиков поддерева у подразделения `id` и всех его предков"""
+    if id is None:
+        return []
+    chain = ancestors_cte(id)
+    statement = (
+        update(Department)
+        .where(Department.id.in_(select(chain.c.id)))
+        .values(
+            subtree_employee_count=Department.subtree_employee_count + employees,
+            subtree_department_count=Department.subtree_department_count + departments,
+        )
+    )
+    return [statement]
+
+
+def shift_direct_count(id: int, employees: Delta) -> list[Executable]:
+    statement = (
+        update(Department)
+        .where(Department.id == id)
+        .values(direct_employee_count=Department.direct_employee_count + employees)
+    )
+    return [statement]
+
+
+def employee_created(department_id: int) -> list[Executable]:
+    return [
+        *shift_direct_count(department_id, 1),
+        *shift_subtree_counts(department_id, employees=1),
+    ]
+
+
+def department_created(parent_id: int | None) -> list[Executable]:
+    return shift_subtree_counts(parent_id, departments=1)
+
+
+def department_moved(
+    id: int, old_parent_id: int | None, new_parent_id: int | None
+) -> list[Executable]:
+    employees, departments = _subtree_size(id)
+    return [
+        *shift_subtree_counts(old_parent_id, -employees, -(departments + 1)),
+        *shift_subtree_counts(new_parent_id, employees, departments + 1),
+    ]
+
+
+def department_deleted(id: int, parent_id: int | None) -> list[Executable]:
+    employees, departments = _subtree_size(id)
+    return shift_subtree_counts(parent_id, -employees, -(departments + 1))
+
+
+def department_restored(id: int, parent_id: int | None) -> list[Executable]:
+    """Отмена мягкого удаления: поддерево возвращается со счётчиками на момент удаления"""
+    employees, departments = _subtree_size(id)
+    return shift_subtree_counts(parent_id, employees, departments + 1)
+
+
+def department_dissolved(
+    id: int, parent_id: int | None, reassign_id: int
+) -> list[Executable]:
+    """Удаление с переносом: дети и сотрудники `id` переходят к `reassign_id`"""
+    employees, departments = _subtree_size(id)
+    direct = (
+        select(Department.direct_employee_count)
+        .where(Department.id == id)
+        .scalar_subquery()
+    )
+    return [
+        *department_deleted(id, parent_id),
+        *shift_subtree_counts(reassign_id, employees, departments),
+        *shift_direct_count(reassign_id, direct),
+    ]
+
+
+async def verify(session: AsyncSession) -> list[RowMapping]:
+    """Подразделения, у которых сохранённые счётчики расходятся с пересчитанными"""
+    expected = _expected_counts()
+    statement = (
+        select(
+            Department.id,
+            Department.direct_employee_count,
+            expected.c.direct_employee_count.label("expected_direct_employee_count"),
+            Department.subtree_employee_count,
+            expected.c.subtree_employee_count.label("expected_subtree_employee_count"),
+            Department.subtree_department_count,
+            expected.c.subtree_department_count.label(
+                "expected_subtree_department_count"
+            ),
+        )
+        .join(expected, Department.id == expected.c.id)
+        .where(
+            or_(
+                Department.direct_employee_count != expected.c.direct_employee_count,
+                Department.subtree_employee_count != expected.c.subtree_employee_count,
+                Department.subtree_department_count
+                != expected.c.subtree_department_count,
+            )
+        )
+        .order_by(Department.id)
+    )
+    result = await session.execute(statement)
+    return list(result.mappings().all())
+
+
+async def rebuild(session: AsyncSession) -> None:
+    expected = _expected_counts()
+    statement = (
+        update(Department)
+        .where(Department.id == expected.c.id)
+        .values(
+            direct_employee_count=expected.c.direct_employee_count,
+            subtree_employee_count=expected.c.subtree_employee_count,
+            subtree_department_count=expected.c.subtree_department_count,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(statement)
+    await session.commit()
+
+
+def ancestors_cte(id: int) -> CTE:
+    """Подразделение `id` и все его предки"""
+    chain = (
+        select(Department.id, Department.parent_id)
+        .where(Department.id == id)
+        .cte("chain", recursive=True)
+    )
+    parents = select(Department.id, Department.parent_id).join(
+        chain, Department.id == chain.c.parent_id
+    )
+    return chain.union_all(parents)
+
+
+def _subtree_size(id: int) -> tuple[ScalarSelect, ScalarSelect]:
+    # Отдельный алиас, чтобы подзапрос не коррелировал с обновляемыми строками
+    subtree = aliased(Department)
+    employees = (
+        select(subtree.subtree_employee_count)
+        .where(subtree.id == id)
+        .scalar_subquery()
+    )
+    departments = (
+        select(subtree.subtree_department_count)
+        .where(subtree.id == id)
+        .scalar_subquery()
+    )
+    return employees, departments
+
+
+def _expected_counts() -> Subquery:
+    """Пересчёт с нуля: замыкание связывает каждое подразделение со всеми потомками"""
+    closure = select(
+        Department.id.label("ancestor_id"), Department.id.label("descendant_id")
+    ).cte("closure", recursive=True)
+    descendants = select(closure.c.ancestor_id, Department.id).join(
+        closure, Department.parent_id == closure.c.descendant_id
+    )
+    closure = closure.union_all(descendants)
+
+    is_direct = closure.c.descendant_id == closure.c.ancestor_id
+    return (
+        select(
+            closure.c.ancestor_id.label("id"),
+            func.count(Employee.id).filter(is_direct).label("direct_employee_count"),
+            func.count(Employee.id).label("subtree_employee_count"),
+            (func.count(func.distinct(closure.c.descendant_id)) - 1).label(
+                "subtree_department_count"
+            ),
+        )
+        .outerjoin(Employee, Employee.department_id == closure.c.descendant_id)
+        .group_by(closure.c.ancestor_id)
+        .subquery("expected")
+    )
+
+
+async def main(command: str) -> None:
+    async with get_session_maker()() as session:
+        drift = await verify(session)
+        for row in drift:
+            print(dict(row))
+        print(f"Departments with drifted counters: {len(drift)}")
+        if command == "rebuild" and drift:
+            await rebuild(session)
+            print("Counters rebuilt")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    asyncio.run(main(parser.parse_args().command))
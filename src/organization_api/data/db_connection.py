@@ -1,12 +1,18 @@
 from collections.abc import AsyncGenerator
+from contextvars import ContextVar
+from functools import cache
 
+from sqlalchemy import Connection, event
+from sqlalchemy.orm import Session, SessionTransaction
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     create_async_engine,
     async_sessionmaker,
 )
 
 from config import env
+from data.slow_query_log import SlowQueryLog
 
 DB_URL = (
     f"postgresql+asyncpg://{env.postgres_user}:"
@@ -14,10 +20,45 @@ DB_URL = (
     f"@{env.postgres_host}:{env.postgres_port}/{env.postgres_db}"
 )
 
-engine = create_async_engine(DB_URL, echo=True)
-async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+# Движок создаётся при первом обращении, а не при импорте: create_async_engine тянет
+# диалект и asyncpg, а скрипты и тесты, которым БД не нужна, за это не платят
+@cache
+def get_engine() -> AsyncEngine:
+    engine = create_async_engine(
+        DB_URL,
+        echo=True,
+        pool_size=env.db_pool_size,
+        connect_args={
+            "prepared_statement_cache_size": env.db_prepared_statement_cache_size
+        },
+    )
+    SlowQueryLog(
+        engine, env.slow_query_threshold_ms, env.slow_query_explain_interval_s
+    ).install()
+    return engine
+
+
+@cache
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(get_engine(), expire_on_commit=False)
+
+
+# Выставляется в middleware.RequestBudgetMiddleware по бюджету маршрута
+statement_timeout_ms: ContextVar[int | None] = ContextVar(
+    "statement_timeout_ms", default=None
+)
+
+
+@event.listens_for(Session, "after_begin")
+def set_statement_timeout(
+    session: Session, transaction: SessionTransaction, connection: Connection
+) -> None:
+    timeout_ms = statement_timeout_ms.get()
+    if timeout_ms is not None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
+    async with get_session_maker()() as session:
         yield session
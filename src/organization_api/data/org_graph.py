@@ -0,0 +1,164 @@
+"""
+Структура организации в памяти процесса для проверки существования и списка детей без
+запросов к БД. Всё хранится в `array('i')`, индексированных ID подразделения (ID выдаёт
+serial, поэтому массивы почти плотные):
+
+- `parent`: родитель, `ROOT` для корня, `ABSENT` для несуществующего ID
+- `child_offsets`/`child_ids`: дети в формате CSR, дети `id` это
+  `child_ids[child_offsets[id]:child_offsets[id + 1]]`
+
+Источник истины БД. Индекс догоняет ленту изменений (data/changes.py) с последнего
+учтённого номера: одним запросом номер головы и ID изменённых подразделений, вторым их
+`parent_id`. Догоняет не на каждом чтении, а после записи этого процесса (`mark_stale`)
+или раз в `sync_interval_s`, поэтому записи других процессов видны с такой задержкой.
+Запросы идут без блокировки, одновременные чтения не ждут друг друга. Производные массивы
+перестраиваются в памяти при следующем чтении после изменения (O(n), без запросов к БД)
+"""
+
+import asyncio
+import time
+from array import array
+from collections.abc import Iterable
+
+from sqlalchemy import distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import env
+from data import changes
+from data.sql_models import Change, Department
+
+ROOT = -1
+ABSENT = -2
+
+
+class OrgGraph:
+    def __init__(self, sync_interval_s: float) -> None:
+        self.sync_interval_s = sync_interval_s
+        self._lock = asyncio.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.loaded = False
+        self.parent = array("i")
+        # Номер в ленте изменений, до которого индекс совпадает с БД
+        self.version = 0
+        self._stale = False
+        self._synced_at = 0.0
+        self._dirty = True
+
+    def mark_stale(self) -> None:
+        """Запись этого процесса: следующее чтение догонит ленту сразу"""
+        self._stale = True
+
+    async def get(self, session: AsyncSession) -> "OrgGraph":
+        """Индекс, загруженный из БД при первом обращении и догоняющий ленту изменений"""
+        if not self.loaded:
+            # Загрузка одна на процесс, остальные ждут её, а не грузят параллельно
+            async with self._lock:
+                if not self.loaded:
+                    await self.load(session)
+        elif self._stale or self._synced_at + self.sync_interval_s <= time.monotonic():
+            try:
+                await self.sync(session)
+            except BaseException:
+                self._stale = True  # Следующее чтение попробует снова
+                raise
+        return self
+
+    async def load(self, session: AsyncSession) -> None:
+        self._synced_at = time.monotonic()
+        # Голова читается до строк: изменения после неё применятся повторно, это
+        # безопасно, а пропустить ни одно нельзя
+        version = await session.scalar(select(func.coalesce(func.max(Change.seq), 0)))
+        result = await session.execute(select(Department.id, Department.parent_id))
+        self.load_rows(result.all())
+        self.version = version
+
+    async def sync(self, session: AsyncSession) -> None:
+        # Отметка до запросов: запись во время них снова пометит индекс устаревшим
+        self._stale = False
+        self._synced_at = time.monotonic()
+        since = self.version
+        statement = select(
+            func.max(Change.seq),
+            func.array_agg(distinct(Change.entity_id)).filter(
+                Change.entity == changes.DEPARTMENT
+            ),
+        ).where(Change.seq > since)
+        version, ids = (await session.execute(statement)).one()
+        if version is None:
+            return
+        rows = []
+        if ids:
+            # Удалённые подразделения скрыты, их ID просто не вернутся
+            statement = select(Department.id, Department.parent_id).where(
+                Department.id.in_(ids)
+            )
+            rows = (await session.execute(statement)).all()
+        # Параллельное чтение могло уже применить более свежее состояние
+        if version > self.version:
+            self.apply(ids or [], rows)
+            self.version = version
+
+    def load_rows(self, rows: Iterable[tuple[int, int | None]]) -> None:
+        rows = list(rows)
+        size = max((id for id, _ in rows), default=0) + 1
+        self.parent = array("i", [ABSENT]) * size
+        for id, parent_id in rows:
+            self.parent[id] = ROOT if parent_id is None else parent_id
+        self._dirty = True
+        self.loaded = True
+
+    def apply(
+        self, ids: Iterable[int], rows: Iterable[tuple[int, int | None]]
+    ) -> None:
+        """Новое состояние изменённых `ids`: строки из БД, для кого строки нет, удалены"""
+        parents = {id: ABSENT for id in ids}
+        parents.update(
+            (id, ROOT if parent_id is None else parent_id) for id, parent_id in rows
+        )
+        top = max(parents, default=-1)
+        if top >= len(self.parent):
+            self.parent.extend(array("i", [ABSENT]) * (top + 1 - len(self.parent)))
+        for id, parent in parents.items():
+            self.parent[id] = parent
+        self._dirty = True
+
+    # Чтение
+
+    def contains(self, id: int) -> bool:
+        return 0 <= id < len(self.parent) and self.parent[id] != ABSENT
+
+    def children(self, id: int) -> array:
+        """Дети по возрастанию ID"""
+        if not self.contains(id):
+            return array("i")
+        if self._dirty:
+            self._build()
+        return self.child_ids[self.child_offsets[id] : self.child_offsets[id + 1]]
+
+    def _build(self) -> None:
+        parent = self.parent
+        size = len(parent)
+
+        # CSR: подсчёт детей, префиксные суммы, раскладка. ID перебираются по
+        # возрастанию, поэтому дети тоже упорядочены по ID
+        offsets = array("i", [0]) * (size + 1)
+        for id in range(size):
+            if parent[id] >= 0:
+                offsets[parent[id] + 1] += 1
+        for id in range(size):
+            offsets[id + 1] += offsets[id]
+        child_ids = array("i", [0]) * offsets[size]
+        cursor = offsets[:-1]
+        for id in range(size):
+            if parent[id] >= 0:
+                child_ids[cursor[parent[id]]] = id
+                cursor[parent[id]] += 1
+
+        self.child_offsets = offsets
+        self.child_ids = child_ids
+        self._dirty = False
+
+
+org_graph = OrgGraph(env.org_graph_sync_interval_s)
@@ -1,48 +1,194 @@
-from collections.abc import Sequence, Mapping
+from collections.abc import AsyncGenerator, Collection, Sequence, Mapping
+from datetime import datetime
+from functools import cache
 from typing import Generic, TypeVar, TypeAlias, override
 
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy.sql import Select
+from sqlalchemy import (
+    CTE,
+    ColumnElement,
+    Executable,
+    Row,
+    RowMapping,
+    and_,
+    bindparam,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, lazyload, load_only, noload, selectinload
+from sqlalchemy.sql import Delete, Select
+from sqlalchemy.sql.dml import UpdateBase
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from data.sql_models import Department, Employee
+from data import changes, counters
+from data.summary import REFRESH_VIEW, department_summary
+from data.sql_models import AuditEvent, Change, Department, Employee, IdempotencyKey
 
 T = TypeVar("T")
 DepartmentCreation: TypeAlias = Mapping[str, str | int]
 
 
+# Горячие выборки по ID собираются один раз, ID передаётся параметром `id`. SQLAlchemy не
+# строит конструкцию с опциями загрузки и не считает ключ кэша компиляции на каждый
+# запрос, а неизменный текст SQL попадает в кэш подготовленных выражений asyncpg на
+# соединении, поэтому Postgres не разбирает и не планирует его заново
+@cache
+def _select_by_id(model: type) -> Select:
+    return select(model).where(model.id == bindparam("id"))
+
+
+@cache
+def _exists_by_id(model: type) -> Select:
+    # Колонка сущности, а не literal: иначе критерий мягкого удаления не применится
+    return select(model.id).where(model.id == bindparam("id"))
+
+
+DEPARTMENT_WITH_CHILDREN = _select_by_id(Department).options(
+    selectinload(Department.children)
+)
+DEPARTMENT_WITH_EMPLOYEES = _select_by_id(Department).options(
+    selectinload(Department.employees), selectinload(Department.children)
+)
+DEPARTMENT_WITHOUT_EMPLOYEES = _select_by_id(Department).options(
+    noload(Department.employees),
+    selectinload(Department.children).noload(Department.employees),
+)
+DEPARTMENT_NODE = {
+    include_employees: _select_by_id(Department)
+    .options(
+        noload(Department.children),
+        selectinload(Department.employees)
+        if include_employees
+        else noload(Department.employees),
+    )
+    .execution_options(populate_existing=True)
+    for include_employees in (False, True)
+}
+
+
 class BaseRepository(Generic[T]):
     def __init__(self, session: AsyncSession, model: type[T]) -> None:
         self.session = session
         self.model = model
 
     async def get(self, id: int) -> T | None:
-        statement = select(self.model).where(self.model.id == id)
-        entry = await self._get_single(statement)
+        entry = await self._get_single(_select_by_id(self.model), {"id": id})
         return entry
 
+    async def exists(self, id: int) -> bool:
+        result = await self.session.execute(_exists_by_id(self.model), {"id": id})
+        return result.scalar_one_or_none() is not None
+
     async def get_all(self) -> list[T]:
         entries = await self.session.execute(select(self.model))
         result = list(entries.scalars().all())
         return result
 
+    async def get_page(
+        self,
+        cursor: int | None,
+        limit: int,
+        columns: Sequence[ColumnElement] | None = None,
+        criteria: Sequence[ColumnElement] = (),
+    ) -> list[RowMapping]:
+        """
+        Keyset-пагинация по ID. Выбираются только колонки, а не сущности, поэтому
+        selectin-загрузка связей не срабатывает
+        """
+        columns = columns or self._scalar_columns()
+        statement = select(*columns).where(*criteria).order_by(self.model.id).limit(limit)
+        if cursor is not None:
+            statement = statement.where(self.model.id > cursor)
+        result = await self.session.execute(statement)
+        return list(result.mappings().all())
+
+    async def get_rows(
+        self, *criteria: ColumnElement, order_by: Sequence[ColumnElement] = ()
+    ) -> list[RowMapping]:
+        """Колонки записей без загрузки связей, по умолчанию в порядке ID"""
+        statement = (
+            select(*self._scalar_columns())
+            .where(*criteria)
+            .order_by(*order_by or (self.model.id,))
+        )
+        result = await self.session.execute(statement)
+        return list(result.mappings().all())
+
+    async def stream_batches(
+        self, batch_size: int
+    ) -> AsyncGenerator[Sequence[RowMapping], None]:
+        """
+        Все записи пачками по `batch_size` через серверный курсор. В памяти держится только
+        текущая пачка, а сущности не создаются, поэтому identity map не растёт
+        """
+        statement = (
+            select(*self._scalar_columns())
+            .order_by(self.model.id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await self.session.stream(statement)
+        async for batch in result.mappings().partitions():
+            yield batch
+
+    def _scalar_columns(self) -> list[ColumnElement]:
+        return [getattr(self.model, col.name) for col in self.model.__table__.columns]
+
     async def bulk_create(self, data: Sequence[Mapping]) -> None:
         for entry in data:
             await self.create(entry)
 
     async def create(self, data: Mapping) -> T:
         entry = self.model(**data)
-        await self._add(entry)
+        await self._add(entry, *self._counter_updates_on_create(entry))
+        if "id" in data:
+            await self._sync_id_sequence()
         return entry
 
-    async def _add(self, entry: T) -> None:
+    def _counter_updates_on_create(self, entry: T) -> list[Executable]:
+        return []
+
+    def _changes_on_create(self, entry: T) -> list[Executable]:
+        return []
+
+    async def _add(self, entry: T, *statements: Executable) -> None:
+        """
+        `statements` выполняются в той же транзакции, что и запись `entry`, последней
+        идёт запись в ленту изменений, см. data/changes.py
+        """
         self.session.add(entry)
-        await self.session.commit()
+        try:
+            await self.session.flush()  # ID нужен ленте изменений
+            for statement in (*statements, *self._changes_on_create(entry)):
+                await self.session.execute(statement)
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
         await self.session.refresh(entry)
 
-    async def _get_single(self, statement: Select) -> T | None:
-        result = await self.session.execute(statement)
+    async def _sync_id_sequence(self) -> None:
+        """Записи с явным ID (фикстуры) не сдвигают serial-последовательность"""
+        table = self.model.__tablename__
+        statement = text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT max(id) FROM {table}))"
+        )
+        await self.session.execute(statement)
+        await self.session.commit()
+
+    async def _get_single(
+        self, statement: Select, params: Mapping[str, object] | None = None
+    ) -> T | None:
+        result = await self.session.execute(statement, params)
         entry = result.scalar_one_or_none()
         return entry
 
@@ -58,35 +204,185 @@ class DepartmentRepository(BaseRepository):
         self.session = session
 
     async def reassign_delete(self, id: int, reassign_id: int) -> None:
-        department = await self.get_with_employees(id)
-
-        if department.children:
-            await self._reassign_children(department.children, reassign_id)
-
-        if department.employees:
-            await self._reassign_employees(department.employees, reassign_id)
+        """
+        Дети и сотрудники переносятся и подразделение удаляется массовыми запросами в одной
+        транзакции, без загрузки связей и без ORM-каскада по `children`
+        """
+        parent_id = await self.get_parent_id(id)
+        statements = [
+            *counters.department_dissolved(id, parent_id, reassign_id),
+            update(self.model)
+            .where(self.model.parent_id == id)
+            .values(parent_id=reassign_id)
+            .returning(literal(changes.DEPARTMENT), self.model.id),
+            update(Employee)
+            .where(Employee.department_id == id)
+            .values(department_id=reassign_id)
+            .returning(literal(changes.EMPLOYEE), Employee.id),
+            delete(self.model)
+            .where(self.model.id == id)
+            .returning(literal(changes.DEPARTMENT), self.model.id),
+        ]
+        await self._execute_recording_changes(statements)
 
-        await self._delete(department)
+    async def cascade_delete(self, id: int) -> None:
+        """
+        Мягкое удаление: поддерево и его сотрудники помечаются одной меткой времени
+        (`now()` одинаков в транзакции) двумя UPDATE по рекурсивному CTE вдоль индекса
+        `parent_id`. Время не зависит от числа строк, а до очистки удаление можно отменить
+        """
+        parent_id = await self.get_parent_id(id)
+        subtree_ids = select(self._subtree_cte(id).c.id)
+        statements = [
+            # Счётчики до пометки, пока поддерево ещё видно
+            *counters.department_deleted(id, parent_id),
+            update(Employee)
+            .where(Employee.department_id.in_(subtree_ids))
+            .values(deleted_at=func.now())
+            .returning(literal(changes.EMPLOYEE), Employee.id)
+            .execution_options(synchronize_session=False),
+            update(self.model)
+            .where(self.model.id.in_(subtree_ids))
+            .values(deleted_at=func.now())
+            .returning(literal(changes.DEPARTMENT), self.model.id)
+            .execution_options(synchronize_session=False),
+        ]
+        await self._execute_recording_changes(statements)
+
+    async def get_parent_id(self, id: int) -> int | None:
+        """Одна колонка: `get` догрузил бы детей и сотрудников через selectin"""
+        statement = select(self.model.parent_id).where(self.model.id == id)
+        result = await self.session.execute(statement)
+        return result.scalar_one_or_none()
 
-    async def _reassign_children(
-        self, children: list[Department], reassign_id: int
+    async def get_deleted(self, id: int) -> Row | None:
+        """`parent_id` и `deleted_at` мягко удалённого подразделения"""
+        statement = (
+            select(self.model.parent_id, self.model.deleted_at)
+            .where(self.model.id == id, self.model.deleted_at.is_not(None))
+            .execution_options(include_deleted=True)
+        )
+        result = await self.session.execute(statement)
+        return result.one_or_none()
+
+    async def restore(
+        self, id: int, parent_id: int | None, deleted_at: datetime
+    ) -> Department:
+        """
+        Отмена удаления: возвращается всё, что было помечено вместе с `id`. Части
+        поддерева, удалённые раньше отдельно, остаются удалёнными
+        """
+        restored = (
+            select(self.model.id)
+            .where(self.model.id == id)
+            .cte("restored", recursive=True)
+        )
+        restored = restored.union_all(
+            select(self.model.id)
+            .join(restored, self.model.parent_id == restored.c.id)
+            .where(self.model.deleted_at == deleted_at)
+        )
+        # Сотрудники первыми: CTE идёт по ещё помеченным подразделениям
+        statements = [
+            update(Employee)
+            .where(
+                Employee.department_id.in_(select(restored.c.id)),
+                Employee.deleted_at == deleted_at,
+            )
+            .values(deleted_at=None)
+            .returning(literal(changes.EMPLOYEE), Employee.id)
+            .execution_options(synchronize_session=False, include_deleted=True),
+            update(self.model)
+            .where(self.model.id.in_(select(restored.c.id)))
+            .values(deleted_at=None)
+            .returning(literal(changes.DEPARTMENT), self.model.id)
+            .execution_options(synchronize_session=False, include_deleted=True),
+            # Счётчики после снятия пометки, когда поддерево снова видно
+            *counters.department_restored(id, parent_id),
+        ]
+        await self._execute_recording_changes(statements)
+        return await self.get(id)
+
+    async def _execute_recording_changes(
+        self, statements: Sequence[UpdateBase]
     ) -> None:
-        for child in children:
-            child.parent_id = reassign_id
-            await self._add(child)
+        """
+        Выполнение в одной транзакции. Строки `(сущность, ID)` из `RETURNING` попадают в
+        ленту изменений последним выражением, см. data/changes.py
+        """
+        changed: dict[str, list[int]] = {changes.DEPARTMENT: [], changes.EMPLOYEE: []}
+        try:
+            for statement in statements:
+                result = await self.session.execute(statement)
+                if statement.exported_columns:  # Есть RETURNING
+                    for entity, entity_id in result:
+                        changed[entity].append(entity_id)
+            for statement in changes.recorded(
+                changed[changes.DEPARTMENT], changed[changes.EMPLOYEE]
+            ):
+                await self.session.execute(statement)
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+
+    async def count_purgeable(self, deleted_before: datetime) -> int:
+        total = 0
+        for model in (self.model, Employee):
+            statement = (
+                select(func.count())
+                .select_from(model)
+                .where(model.deleted_at < deleted_before)
+                .execution_options(include_deleted=True)
+            )
+            total += (await self.session.execute(statement)).scalar_one()
+        return total
+
+    async def purge_employees(self, deleted_before: datetime, limit: int) -> int:
+        """Физически удаляет не больше `limit` сотрудников в короткой транзакции"""
+        chunk = (
+            select(Employee.id)
+            .where(Employee.deleted_at < deleted_before)
+            .limit(limit)
+            .scalar_subquery()
+        )
+        statement = delete(Employee).where(Employee.id.in_(chunk))
+        return await self._purge(statement)
+
+    async def purge_departments(self, deleted_before: datetime, limit: int) -> int:
+        """
+        Только подразделения без детей, поэтому повторные вызовы удаляют поддерево от
+        листьев к корню, а каскад внешних ключей не срабатывает
+        """
+        children = aliased(self.model)
+        chunk = (
+            select(self.model.id)
+            .where(
+                self.model.deleted_at < deleted_before,
+                ~exists().where(children.parent_id == self.model.id),
+            )
+            .limit(limit)
+            .scalar_subquery()
+        )
+        statement = delete(self.model).where(self.model.id.in_(chunk))
+        return await self._purge(statement)
 
-    async def _reassign_employees(self, employees: list[Employee], reassign_id) -> None:
-        for employee in employees:
-            employee.department_id = reassign_id
-            await self._add(employee)
+    async def _purge(self, statement: Delete) -> int:
+        statement = statement.returning(literal(True)).execution_options(
+            synchronize_session=False, include_deleted=True
+        )
+        result = await self.session.execute(statement)
+        purged = len(result.all())
+        await self.session.commit()
+        return purged
 
-    async def cascade_delete(self, id: int) -> None:
-        department = await self.get(id)
-        await self._delete(department)
+    @override
+    def _counter_updates_on_create(self, entry: Department) -> list[Executable]:
+        return counters.department_created(entry.parent_id)
 
-    async def _delete(self, department: Department) -> None:
-        await self.session.delete(department)
-        await self.session.commit()
+    @override
+    def _changes_on_create(self, entry: Department) -> list[Executable]:
+        return changes.recorded(departments=[entry.id])
 
     @override
     async def create(self, data: DepartmentCreation) -> Department | None:
@@ -94,48 +390,256 @@ class DepartmentRepository(BaseRepository):
         department = await self.get(department.id)
         return department
 
-    async def get_with_children(self, id: int) -> Department | None:
+    async def get_filtered_page(
+        self,
+        cursor: int | None,
+        limit: int,
+        parent_id: int | None = None,
+        name_prefix: str | None = None,
+        ids_only: bool = False,
+    ) -> list[RowMapping]:
+        criteria = []
+        if parent_id is not None:
+            criteria.append(self.model.parent_id == parent_id)
+        if name_prefix:
+            criteria.append(self.model.name.startswith(name_prefix, autoescape=True))
+        columns = [self.model.id] if ids_only else None
+        return await self.get_page(cursor, limit, columns, criteria)
+
+    async def get_root_ids(self) -> list[int]:
         statement = (
-            select(self.model)
-            .options(selectinload(self.model.children))
+            select(self.model.id)
+            .where(self.model.parent_id.is_(None))
+            .order_by(self.model.id)
+        )
+        result = await self.session.execute(statement)
+        return list(result.scalars().all())
+
+    async def count_subtree(self, id: int, depth: int) -> tuple[int, int]:
+        """Количество подразделений и сотрудников в поддереве глубиной `depth`"""
+        subtree = self._subtree_cte(id, depth)
+        departments = select(func.count()).select_from(subtree).scalar_subquery()
+        employees = (
+            select(func.count())
+            .select_from(Employee)
+            .where(Employee.department_id.in_(select(subtree.c.id)))
+            .scalar_subquery()
+        )
+        result = await self.session.execute(select(departments, employees))
+        departments_count, employees_count = result.one()
+        return departments_count, employees_count
+
+    async def get_ancestors(self, id: int) -> list[RowMapping]:
+        """Цепочка от корня до подразделения `id` включительно одним рекурсивным запросом"""
+        ancestors = (
+            select(
+                self.model.id,
+                self.model.name,
+                self.model.parent_id,
+                literal(0).label("level"),
+            )
             .where(self.model.id == id)
+            .cte("ancestors", recursive=True)
         )
-        department = await self._get_single(statement)
+        parents = select(
+            self.model.id,
+            self.model.name,
+            self.model.parent_id,
+            ancestors.c.level + 1,
+        ).join(ancestors, self.model.id == ancestors.c.parent_id)
+        ancestors = ancestors.union_all(parents)
+
+        statement = select(
+            ancestors.c.id, ancestors.c.name, ancestors.c.parent_id
+        ).order_by(ancestors.c.level.desc())
+        result = await self.session.execute(statement)
+        return list(result.mappings().all())
+
+    async def get_subtree_stats(self, id: int, depth: int) -> list[RowMapping]:
+        """
+        Численность и даты найма по каждому подразделению поддерева глубиной `depth`.
+        Итоги считаются по всем потомкам, в том числе глубже `depth`: замыкание связывает
+        каждый узел со всеми его потомками, после чего сотрудники агрегируются в GROUP BY
+        """
+        nodes = self._subtree_cte(id, depth)
+        closure = (
+            select(
+                nodes.c.id.label("ancestor_id"), nodes.c.id.label("descendant_id")
+            )
+            .cte("closure", recursive=True)
+        )
+        descendants = select(closure.c.ancestor_id, self.model.id).join(
+            closure, self.model.parent_id == closure.c.descendant_id
+        )
+        closure = closure.union_all(descendants)
+
+        is_direct = closure.c.descendant_id == closure.c.ancestor_id
+        stats = (
+            select(
+                closure.c.ancestor_id,
+                func.count(Employee.id).filter(is_direct).label("direct_employees"),
+                func.count(Employee.id).label("total_employees"),
+                (func.count(func.distinct(closure.c.descendant_id)) - 1).label(
+                    "total_departments"
+                ),
+                func.min(Employee.hired_at).label("earliest_hired_at"),
+                func.max(Employee.hired_at).label("latest_hired_at"),
+            )
+            .outerjoin(Employee, Employee.department_id == closure.c.descendant_id)
+            .group_by(closure.c.ancestor_id)
+            .subquery("stats")
+        )
+
+        statement = (
+            select(
+                self.model.id,
+                self.model.name,
+                self.model.parent_id,
+                nodes.c.level,
+                stats.c.direct_employees,
+                stats.c.total_employees,
+                stats.c.total_departments,
+                stats.c.earliest_hired_at,
+                stats.c.latest_hired_at,
+            )
+            .join(nodes, self.model.id == nodes.c.id)
+            .join(stats, self.model.id == stats.c.ancestor_id)
+            .order_by(nodes.c.level, self.model.id)
+        )
+        result = await self.session.execute(statement)
+        return list(result.mappings().all())
+
+    def select_subtree_ids(self, id: int) -> Select:
+        subtree = self._subtree_cte(id)
+        return select(subtree.c.id)
+
+    def _subtree_cte(self, id: int, depth: int | None = None) -> CTE:
+        subtree = (
+            select(self.model.id, literal(0).label("level"))
+            .where(self.model.id == id)
+            .cte("subtree", recursive=True)
+        )
+        children = select(self.model.id, subtree.c.level + 1).join(
+            subtree, self.model.parent_id == subtree.c.id
+        )
+        if depth is not None:
+            children = children.where(subtree.c.level < depth)
+        return subtree.union_all(children)
+
+    async def get_with_children(self, id: int) -> Department | None:
+        department = await self._get_single(DEPARTMENT_WITH_CHILDREN, {"id": id})
         return department
 
-    async def get_with_employees(self, id: int) -> Department | None:
+    async def get_node(self, id: int, include_employees: bool) -> Department | None:
+        """Без детей: их ID берутся из data/org_graph.py"""
+        statement = DEPARTMENT_NODE[include_employees]
+        department = await self._get_single(statement, {"id": id})
+        return department
+
+    async def get_without_employees(self, id: int) -> Department | None:
+        """Сотрудники загружаются отдельно постранично, см. EmployeeRepository.get_page_by_departments"""
+        department = await self._get_single(DEPARTMENT_WITHOUT_EMPLOYEES, {"id": id})
+        return department
+
+    async def get_sparse(
+        self,
+        id: int,
+        department_fields: Collection[str],
+        employee_fields: Collection[str] | None,
+    ) -> Department | None:
+        """
+        Загружаются только запрошенные колонки. Для детей нужен лишь ID, остальное
+        загрузится на следующем шаге рекурсии. `populate_existing` нужен потому, что дети
+        уже лежат в identity map с пустыми `children` и `employees`
+        """
+        options = [
+            load_only(
+                self.model.id,
+                *(getattr(self.model, field) for field in department_fields),
+            ),
+            selectinload(self.model.children).options(
+                load_only(self.model.id),
+                noload(self.model.children),
+                noload(self.model.employees),
+            ),
+        ]
+        if employee_fields:
+            columns = (getattr(Employee, field) for field in employee_fields)
+            options.append(selectinload(self.model.employees).load_only(*columns))
+        else:
+            options.append(noload(self.model.employees))
+
         statement = (
             select(self.model)
-            .options(
-                selectinload(self.model.employees),
-                selectinload(self.model.children),
-            )
+            .options(*options)
             .where(self.model.id == id)
+            .execution_options(populate_existing=True)
         )
         department = await self._get_single(statement)
         return department
 
-    async def change(self, id: int, data: DepartmentCreation) -> Department | None:
-        department = await self.get(id)
-        if department:
-            await self._update(department, data)
+    async def get_with_employees(self, id: int) -> Department | None:
+        department = await self._get_single(DEPARTMENT_WITH_EMPLOYEES, {"id": id})
         return department
 
-    async def _update(self, department: Department, data: DepartmentCreation) -> None:
-        for field, value in data.items():
-            if hasattr(department, field) and value:
-                setattr(department, field, value)
-        await self._add(department)
-
-    async def _get_new_department_id(self) -> int:
-        """Используется в validators.validate_department_creation_data. Вычисляет значения следующего созданного ID"""
-        departments = await self.get_all()
-        if departments:
-            last_department = departments[len(departments) - 1]
-            new_department_id = last_department.id + 1
-        else:
-            new_department_id = 1
-        return new_department_id
+    async def change(
+        self, id: int, data: DepartmentCreation
+    ) -> tuple[Department, int | None] | None:
+        """
+        Одно `UPDATE ... RETURNING` без предварительного чтения, возвращает подразделение
+        и прежний `parent_id`. Родитель и перенос в собственное поддерево проверяются по
+        цепочке предков нового родителя, поэтому `None` означает отсутствие подразделения
+        или родителя либо такой перенос
+        """
+        values = {field: value for field, value in data.items() if value}
+        if not values:
+            department = await self.get(id)
+            return (department, department.parent_id) if department else None
+        new_parent_id = values.get("parent_id")
+
+        statement = (
+            update(self.model)
+            .where(self.model.id == id)
+            .values(**values)
+            .returning(self.model)
+            # Ответу нужны только колонки, связи не догружаются
+            .options(lazyload(self.model.children), lazyload(self.model.employees))
+        )
+        if new_parent_id:
+            # Строка из FROM видна в состоянии до обновления
+            old = aliased(self.model)
+            chain = counters.ancestors_cte(new_parent_id)
+            # Цепочка пуста, если родитель удалён (в том числе мягко)
+            statement = statement.where(
+                old.id == self.model.id,
+                exists().where(chain.c.id == new_parent_id),
+                ~exists().where(chain.c.id == id),
+            ).returning(old.parent_id)
+
+        try:
+            result = await self.session.execute(statement)
+            row = result.one_or_none()
+            if row is None:
+                await self.session.rollback()
+                return None
+            department = row[0]
+            old_parent_id = row[1] if new_parent_id else department.parent_id
+            moved = new_parent_id and old_parent_id != new_parent_id
+            statements = [
+                *(
+                    counters.department_moved(id, old_parent_id, new_parent_id)
+                    if moved
+                    else []
+                ),
+                *changes.recorded(departments=[id]),
+            ]
+            for statement in statements:
+                await self.session.execute(statement)
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+        return department, old_parent_id
 
 
 class EmployeeRepository(BaseRepository):
@@ -143,3 +647,208 @@ class EmployeeRepository(BaseRepository):
 
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
+
+    @override
+    def _counter_updates_on_create(self, entry: Employee) -> list[Executable]:
+        return counters.employee_created(entry.department_id)
+
+    @override
+    def _changes_on_create(self, entry: Employee) -> list[Executable]:
+        return changes.recorded(employees=[entry.id])
+
+    async def get_page_by_departments(
+        self,
+        department_ids: Sequence[int] | Select,
+        after: tuple[str, int] | None,
+        limit: int,
+    ) -> list[Employee]:
+        """Keyset-пагинация по `(full_name, id)`, тот же порядок, что у Department.employees"""
+        statement = (
+            select(self.model)
+            .where(self.model.department_id.in_(department_ids))
+            .order_by(self.model.full_name, self.model.id)
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(
+                tuple_(self.model.full_name, self.model.id) > tuple_(*after)
+            )
+        result = await self.session.execute(statement)
+        return list(result.scalars().all())
+
+
+class DepartmentSummaryRepository:
+    """Чтение материализованного представления `department_summary`, см. data/summary.py"""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        self.table = department_summary
+
+    async def get_page(
+        self,
+        cursor: int | None,
+        limit: int,
+        root_id: int | None = None,
+        max_depth: int | None = None,
+    ) -> list[RowMapping]:
+        statement = select(self.table).order_by(self.table.c.id).limit(limit)
+        if cursor is not None:
+            statement = statement.where(self.table.c.id > cursor)
+        if root_id is not None:  # Поддерево по GIN-индексу на path_ids
+            statement = statement.where(self.table.c.path_ids.contains([root_id]))
+        if max_depth is not None:
+            statement = statement.where(self.table.c.depth <= max_depth)
+        result = await self.session.execute(statement)
+        return list(result.mappings().all())
+
+    async def refresh(self) -> None:
+        await self.session.execute(REFRESH_VIEW)
+        await self.session.commit()
+
+
+class AuditRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        self.model = AuditEvent
+
+    async def insert_many(self, events: Sequence[Mapping]) -> None:
+        """Один многострочный INSERT на пакет"""
+        await self.session.execute(insert(self.model).values(list(events)))
+        await self.session.commit()
+
+    async def get_page(
+        self,
+        after: tuple[datetime, int] | None,
+        limit: int,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        entity: str | None = None,
+        entity_id: int | None = None,
+    ) -> list[AuditEvent]:
+        """Keyset-пагинация по `(occurred_at, id)`, интервал `[since, until)`"""
+        statement = (
+            select(self.model)
+            .order_by(self.model.occurred_at, self.model.id)
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(
+                tuple_(self.model.occurred_at, self.model.id) > tuple_(*after)
+            )
+        if since is not None:
+            statement = statement.where(self.model.occurred_at >= since)
+        if until is not None:
+            statement = statement.where(self.model.occurred_at < until)
+        if entity is not None:
+            statement = statement.where(self.model.entity == entity)
+        if entity_id is not None:
+            statement = statement.where(self.model.entity_id == entity_id)
+        result = await self.session.execute(statement)
+        return list(result.scalars().all())
+
+
+class ChangeRepository:
+    """Лента изменений для зеркал, см. data/changes.py"""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        self.model = Change
+
+    async def get_since(self, since: int, limit: int) -> list[Change]:
+        statement = (
+            select(self.model)
+            .where(self.model.seq > since)
+            .order_by(self.model.seq)
+            .limit(limit)
+        )
+        result = await self.session.execute(statement)
+        return list(result.scalars().all())
+
+    async def get_head(self) -> int:
+        """Последний выданный номер, с него зеркало начинает после полной выгрузки"""
+        statement = select(func.coalesce(func.max(self.model.seq), 0))
+        result = await self.session.execute(statement)
+        return result.scalar_one()
+
+
+class IdempotencyKeyRepository:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+        self.model = IdempotencyKey
+
+    async def get(
+        self, key: str, created_after: datetime, pending_after: datetime
+    ) -> IdempotencyKey | None:
+        """Ответ новее `created_after` или заглушка новее `pending_after`"""
+        statement = select(self.model).where(
+            self.model.key == key,
+            self.model.created_at > created_after,
+            or_(
+                self.model.status_code.is_not(None),
+                self.model.created_at > pending_after,
+            ),
+        )
+        return await self.session.scalar(statement)
+
+    async def claim(
+        self,
+        key: str,
+        fingerprint: str,
+        expired_before: datetime,
+        abandoned_before: datetime,
+    ) -> bool:
+        """
+        Вставка заглушки без ответа. Ключ уникален, поэтому из одновременных запросов
+        с одним ключом заглушку вставит только один, в том числе в разных процессах.
+        Устаревшая запись и заглушка старше `abandoned_before` заменяются
+        """
+        statement = pg_insert(self.model).values(key=key, fingerprint=fingerprint)
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.model.key],
+            set_={
+                "fingerprint": statement.excluded.fingerprint,
+                "status_code": None,
+                "headers": None,
+                "body": None,
+                "created_at": func.now(),
+            },
+            where=or_(
+                self.model.created_at <= expired_before,
+                and_(
+                    self.model.status_code.is_(None),
+                    self.model.created_at <= abandoned_before,
+                ),
+            ),
+        ).returning(self.model.key)
+        result = await self.session.execute(statement)
+        await self.session.commit()
+        return result.scalar_one_or_none() is not None
+
+    async def save(self, values: Mapping, expired_before: datetime) -> None:
+        """Ответ заменяет заглушку или устаревшую запись, но не сохранённый ответ"""
+        statement = pg_insert(self.model).values(**values)
+        excluded = {name: statement.excluded[name] for name in values}
+        statement = statement.on_conflict_do_update(
+            index_elements=[self.model.key],
+            set_={**excluded, "created_at": func.now()},
+            where=or_(
+                self.model.status_code.is_(None),
+                self.model.created_at <= expired_before,
+            ),
+        )
+        await self.session.execute(statement)
+        await self.session.commit()
+
+    async def release(self, key: str) -> None:
+        """Удаление заглушки, сохранённый ответ остаётся"""
+        statement = delete(self.model).where(
+            self.model.key == key, self.model.status_code.is_(None)
+        )
+        await self.session.execute(statement)
+        await self.session.commit()
+
+    async def delete_expired(self, created_before: datetime) -> int:
+        statement = delete(self.model).where(self.model.created_at <= created_before)
+        result = await self.session.execute(statement)
+        await self.session.commit()
+        return result.rowcount
@@ -7,6 +7,7 @@ from typing import TypeAlias, Sequence, Mapping
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import BASE_DIR
+from data import counters
 from data.repositories import BaseRepository
 from data.sql_models import Department, Employee
 from data.db_connection import get_async_session
@@ -35,6 +36,8 @@ async def seed_db(session: AsyncSession) -> None:
         data = get_data_from_fixture(fixture_name)
         check_date_fields(data)
         await BaseRepository(session, model).bulk_create(data)
+    # BaseRepository не ведёт счётчики подразделений, пересчитываем их один раз в конце
+    await counters.rebuild(session)
 
 
 def get_data_from_fixture(fixture_name: str) -> list[dict]:
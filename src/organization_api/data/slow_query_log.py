@@ -0,0 +1,119 @@
+"""
+Лог медленных запросов. Запрос дольше порога пишется в отдельный sink, а его план
+один раз (не чаще `explain_interval_s` для одного отпечатка) снимается на отдельном
+соединении. `EXPLAIN (ANALYZE, BUFFERS)` выполняет запрос, поэтому он используется только
+для чистого чтения, а записи, блокировки и функции с побочными эффектами (изменяющие CTE,
+`FOR UPDATE`, `pg_advisory_xact_lock`, `setval`) получают план без выполнения
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+from collections.abc import Sequence
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+slow_query_logger = logger.bind(slow_query=True)
+
+EXPLAIN_ANALYZE_PREFIX = "EXPLAIN (ANALYZE, BUFFERS) "
+EXPLAIN_PREFIX = "EXPLAIN "
+PLANNABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+# Что угодно из этого в тексте делает запрос не только чтением. Ложное срабатывание
+# (например, слово в строковом литерале) стоит только плана без ANALYZE
+SIDE_EFFECTS = re.compile(
+    r"\b(insert|update|delete|merge|for\s+(no\s+key\s+|key\s+)?share|setval|nextval"
+    r"|pg_(try_)?advisory\w*|pg_notify)\b",
+    re.IGNORECASE,
+)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+(?:::\w+)?|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Отпечаток запроса без учёта литералов, параметров и пробелов"""
+    normalized = LITERALS.sub("?", statement)
+    normalized = WHITESPACE.sub(" ", normalized).strip().lower()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def explain_prefix(statement: str) -> str | None:
+    """Префикс EXPLAIN для запроса или `None`, если у запроса нет плана (SET, DDL)"""
+    head = statement.lstrip().upper()
+    if not head.startswith(PLANNABLE):
+        return None
+    if head.startswith(("SELECT", "WITH")) and not SIDE_EFFECTS.search(statement):
+        return EXPLAIN_ANALYZE_PREFIX
+    return EXPLAIN_PREFIX
+
+
+class SlowQueryLog:
+    def __init__(
+        self, engine: AsyncEngine, threshold_ms: float, explain_interval_s: float
+    ) -> None:
+        self.engine = engine
+        self.threshold_ms = threshold_ms
+        self.explain_interval_s = explain_interval_s
+        self._last_explained: dict[str, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def install(self) -> None:
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._start)
+        event.listen(self.engine.sync_engine, "after_cursor_execute", self._finish)
+        event.listen(self.engine.sync_engine, "handle_error", self._fail)
+
+    def _start(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _fail(self, context) -> None:
+        # Для упавшего запроса after_cursor_execute не вызывается
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+    def _finish(self, connection, cursor, statement, parameters, context, executemany):
+        started = connection.info["query_start"].pop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if elapsed_ms < self.threshold_ms or statement.startswith("EXPLAIN"):
+            return
+
+        key = fingerprint(statement)
+        slow_query_logger.warning(
+            f"Slow statement {key} took {elapsed_ms:.1f} ms: {statement}"
+        )
+
+        prefix = explain_prefix(statement)
+        if not executemany and prefix and self.should_explain(key):
+            self._schedule_explain(key, prefix + statement, parameters)
+
+    def should_explain(self, key: str) -> bool:
+        now = time.monotonic()
+        last_explained = self._last_explained.get(key)
+        if last_explained is not None and now - last_explained < self.explain_interval_s:
+            return False
+        self._last_explained[key] = now
+        return True
+
+    def _schedule_explain(self, key: str, statement: str, parameters: Sequence) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # Синхронный вызов вне event loop (например, alembic)
+            return
+        task = loop.create_task(self._explain(key, statement, parameters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, key: str, statement: str, parameters: Sequence) -> None:
+        try:
+            async with self.engine.connect() as connection:
+                result = await connection.exec_driver_sql(statement, tuple(parameters))
+                plan = "\n".join(row[0] for row in result)
+                await connection.rollback()
+        except Exception as exc:
+            slow_query_logger.error(f"Could not explain statement {key}: {exc}")
+        else:
+            slow_query_logger.info(f"Plan for statement {key}:\n{plan}")
@@ -1,21 +1,30 @@
 from datetime import date, datetime
 
 from sqlalchemy import (
+    BigInteger,
     Integer,
     Date,
     DateTime,
     String,
     CheckConstraint,
     ForeignKey,
+    Index,
+    LargeBinary,
+    event,
     func,
+    text,
 )
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    ORMExecuteState,
+    Session,
     mapped_column,
     relationship,
     attributes,
+    with_loader_criteria,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
 
@@ -23,6 +32,10 @@ class DefaultField:
     MIN_TITLE_LEN = 1
     MAX_TITLE_LEN = 200
     MAX_DEPTH = 5
+    DEFAULT_DEPTH = 1
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    MAX_BATCH_SIZE = 100
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -34,6 +47,11 @@ class BaseMixin:
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
+    # Мягкое удаление: строка скрыта от всех ORM-запросов, а физически удаляется позже,
+    # см. services.PurgeWorker
+    deleted_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
 
 
 class Department(BaseMixin, Base):
@@ -45,12 +63,24 @@ class Department(BaseMixin, Base):
     parent_id: Mapped[int | None] = mapped_column(
         Integer, ForeignKey("departments.id", ondelete="CASCADE"), nullable=True
     )
+    # Поддерживаются репозиториями дельтами, см. data/counters.py
+    direct_employee_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    subtree_employee_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    subtree_department_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
     parent: Mapped["Department"] = relationship(
         "Department", remote_side="Department.id", back_populates="children"
     )
     children: Mapped[list["Department"]] = relationship(
         "Department",
+        # Порядок как у индекса data/org_graph.py, иначе ответы зависят от пути загрузки
+        order_by="Department.id",
         back_populates="parent",
         lazy="selectin",
         cascade="all, delete",
@@ -70,6 +100,22 @@ class Department(BaseMixin, Base):
             f"char_length(name) >= {DefaultField.MIN_TITLE_LEN} AND char_length(name) <= {DefaultField.MAX_TITLE_LEN}",
             name="name_length_check",
         ),
+        CheckConstraint("parent_id <> id", name="parent_id_not_self_check"),
+        Index("ix_departments_parent_id", "parent_id"),
+        # Уникальность среди детей одного родителя, корневые имена могут повторяться.
+        # Удалённые не мешают создать подразделение с тем же именем
+        Index(
+            "uq_departments_parent_id_name",
+            "parent_id",
+            "name",
+            unique=True,
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_departments_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
     )
 
     def __repr__(self) -> str:
@@ -103,4 +149,78 @@ class Employee(BaseMixin, Base):
             f"char_length(position) >= {DefaultField.MIN_TITLE_LEN} AND char_length(position) <= {DefaultField.MAX_TITLE_LEN}",
             name="position_length_check",
         ),
+        Index("ix_employees_department_id_full_name", "department_id", "full_name"),
+        Index(
+            "ix_employees_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
+
+
+class AuditEvent(Base):
+    """Журнал изменений организации, пишется пакетами, см. audit.py"""
+
+    __tablename__ = "audit_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # Время изменения в процессе, а не вставки пакета
+    occurred_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    action: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    details: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default="{}")
+
+    __table_args__ = (
+        Index("ix_audit_events_occurred_at_id", "occurred_at", "id"),
+        Index("ix_audit_events_entity_entity_id", "entity", "entity_id"),
+    )
+
+
+class Change(Base):
+    """Лента изменений для синхронизации зеркал, см. data/changes.py"""
+
+    __tablename__ = "changes"
+
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    changed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class IdempotencyKey(Base):
+    """Сохранённые ответы на запросы с Idempotency-Key, см. idempotency.py"""
+
+    __tablename__ = "idempotency_keys"
+
+    # Путь запроса и значение заголовка
+    key: Mapped[str] = mapped_column(String(600), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Пусто у заглушки: запрос выполняется или его исход неизвестен
+    status_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    headers: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (Index("ix_idempotency_keys_created_at", "created_at"),)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted(state: ORMExecuteState) -> None:
+    """
+    Удалённые строки скрываются во всех ORM-запросах, включая загрузку связей.
+    Очистка и восстановление видят их с `execution_options(include_deleted=True)`
+    """
+    if state.is_column_load or state.is_relationship_load:
+        return  # Критерий уже передан из исходного запроса
+    if state.execution_options.get("include_deleted", False):
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(
+            BaseMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True
+        )
     )
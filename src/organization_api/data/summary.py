@@ -0,0 +1,63 @@
+"""
+Материализованное представление `department_summary` для отчётов: путь от корня, глубина,
+численность и размер поддерева по каждому подразделению. Отчётные запросы читают только
+его и не нагружают таблицы, с которыми работает API.
+
+Представление не входит в `Base.metadata`, создаётся миграцией (а в тестах через
+`CREATE_VIEW`) и обновляется `REFRESH MATERIALIZED VIEW CONCURRENTLY`, которому нужен
+уникальный индекс
+"""
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+department_summary = Table(
+    "department_summary",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("parent_id", Integer),
+    Column("path", Text),
+    Column("path_ids", ARRAY(Integer)),
+    Column("depth", Integer),
+    Column("headcount", Integer),
+    Column("subtree_headcount", Integer),
+    Column("subtree_size", Integer),
+)
+
+# Численность берётся из поддерживаемых счётчиков, см. data/counters.py. Мягко удалённые
+# подразделения в отчёт не попадают
+CREATE_VIEW = (
+    text(
+        """
+        CREATE MATERIALIZED VIEW department_summary AS
+        WITH RECURSIVE tree AS (
+            SELECT id, name, parent_id, ARRAY[id] AS path_ids, name::text AS path, 0 AS depth,
+                direct_employee_count, subtree_employee_count, subtree_department_count
+            FROM departments
+            WHERE parent_id IS NULL AND deleted_at IS NULL
+            UNION ALL
+            SELECT departments.id, departments.name, departments.parent_id,
+                tree.path_ids || departments.id, tree.path || ' / ' || departments.name,
+                tree.depth + 1, departments.direct_employee_count,
+                departments.subtree_employee_count, departments.subtree_department_count
+            FROM departments JOIN tree ON departments.parent_id = tree.id
+            WHERE departments.deleted_at IS NULL
+        )
+        SELECT id, name, parent_id, path, path_ids, depth,
+            direct_employee_count AS headcount,
+            subtree_employee_count AS subtree_headcount,
+            subtree_department_count AS subtree_size
+        FROM tree
+        """
+    ),
+    text("CREATE UNIQUE INDEX ix_department_summary_id ON department_summary (id)"),
+    text(
+        "CREATE INDEX ix_department_summary_path_ids "
+        "ON department_summary USING gin (path_ids)"
+    ),
+)
+
+DROP_VIEW = text("DROP MATERIALIZED VIEW IF EXISTS department_summary")
+
+REFRESH_VIEW = text("REFRESH MATERIALIZED VIEW CONCURRENTLY department_summary")
@@ -1,11 +1,30 @@
 from typing import NoReturn
 
 from fastapi import HTTPException, status
+from sqlalchemy.exc import DBAPIError, IntegrityError
 
 
 class DepartmentDoesNotExist(BaseException): ...
 
 
+class JobDoesNotExist(BaseException): ...
+
+
+class AdmissionRejected(BaseException):
+    def __init__(self, msg: str, retry_after: int) -> None:
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
 def raise_unprocessable_content() -> NoReturn:
     msg = "Provide valid query params"
     raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=msg)
+
+
+def get_constraint_name(exc: IntegrityError) -> str | None:
+    # asyncpg кладёт исходную ошибку с именем ограничения в __cause__
+    return getattr(exc.orig.__cause__, "constraint_name", None)
+
+
+def get_sqlstate(exc: DBAPIError) -> str | None:
+    return getattr(exc.orig.__cause__, "sqlstate", None)
@@ -0,0 +1,429 @@
+"""
+Повторы POST с заголовком Idempotency-Key. Первый ответ (статус, заголовки и тело)
+сохраняется в ограниченном LRU процесса, а при `idempotency_persist` ещё и в таблице
+`idempotency_keys`, и повтор получает его байт в байт, не выполняя запрос снова.
+Ключ действует в пределах пути, тот же ключ с другим телом отклоняется с 422.
+
+Перед выполнением ключ занимается заглушкой без ответа, при `idempotency_persist`
+строкой в таблице, уникальной по ключу, поэтому запрос не выполняется параллельно даже
+в разных процессах. Дубль ждёт ответ первого запроса: в процессе на блокировке ключа,
+затем опрашивая хранилище раз в `idempotency_poll_interval_s`. Если ответа нет за
+`idempotency_wait_s`, дубль получает 409.
+
+Обработчик с ключом выполняется в отдельной задаче, которую RequestBudgetMiddleware не
+прерывает ни по бюджету (клиент получает 504), ни при отключении клиента: ответ всё равно
+сохраняется, и повтор получает его. Задачу ограничивает `idempotency_lease_s`, столько же
+живёт заглушка упавшего процесса. Ответы 5xx и 429 не сохраняются: заглушка снимается, и
+повтор выполняется заново. Так же при исключении, если обработчик ничего не зафиксировал
+в БД, иначе заглушка остаётся до истечения `idempotency_lease_s`
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import background
+from config import env
+from metrics import Counter
+from data.repositories import IdempotencyKeyRepository
+from data.db_connection import get_session_maker
+
+HEADER = b"idempotency-key"
+MAX_KEY_LEN = 255
+
+idempotent_replays_total = Counter(
+    "idempotent_replays_total", "Responses replayed for a repeated Idempotency-Key"
+)
+idempotent_waits_total = Counter(
+    "idempotent_waits_total", "Requests that waited for an in-flight duplicate"
+)
+idempotent_conflicts_total = Counter(
+    "idempotent_conflicts_total",
+    "Requests rejected against an in-flight or unfinished duplicate",
+)
+
+# Фиксации в БД за время обработчика с ключом, см. IdempotencyMiddleware._run
+commits: ContextVar[list[Session] | None] = ContextVar(
+    "idempotency_commits", default=None
+)
+
+
+@event.listens_for(Session, "after_commit")
+def count_commit(session: Session) -> None:
+    session_commits = commits.get()
+    if session_commits is not None:
+        session_commits.append(session)
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    # None у заглушки: запрос выполняется или его исход неизвестен
+    status: int | None
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+
+    @property
+    def pending(self) -> bool:
+        return self.status is None
+
+    @property
+    def cacheable(self) -> bool:
+        return (
+            self.status is not None
+            and self.status < 500
+            and self.status != status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+
+class IdempotencyStore:
+    def __init__(
+        self, max_entries: int, ttl_s: float, lease_s: float, persist: bool
+    ) -> None:
+        # None: основной движок приложения, тесты подставляют свой
+        self.session_maker: async_sessionmaker[AsyncSession] | None = None
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.lease_s = lease_s
+        self.persist = persist
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._holders: dict[str, int] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self._entries: OrderedDict[str, tuple[float, StoredResponse]] = OrderedDict()
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncGenerator[None, None]:
+        """Блокировка ключа живёт, пока её держат или ждут"""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            idempotent_waits_total.inc()
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                del self._locks[key]
+
+    async def get(self, key: str) -> StoredResponse | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, response = entry
+            ttl_s = self.lease_s if response.pending else self.ttl_s
+            if time.monotonic() - stored_at < ttl_s:
+                self._entries.move_to_end(key)
+                return response
+            del self._entries[key]
+        if not self.persist:
+            return None
+
+        try:
+            async with self._session_maker()() as session:
+                repository = IdempotencyKeyRepository(session)
+                row = await repository.get(
+                    key, self._expired_before(), self._abandoned_before()
+                )
+        except Exception:
+            # Без таблицы остаётся LRU: запрос выполнится, как если бы ключа не было
+            logger.exception(f"Failed to read idempotency key {key}")
+            return None
+        if row is None:
+            return None
+        if row.status_code is None:
+            # Заглушку другого процесса не запоминаем: его ответ появится в таблице
+            return StoredResponse(row.fingerprint, None, [], b"")
+        headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in row.headers
+        ]
+        response = StoredResponse(row.fingerprint, row.status_code, headers, row.body)
+        self._remember(key, response)
+        return response
+
+    async def claim(self, key: str, fingerprint: str) -> StoredResponse | None:
+        """
+        Занятие ключа заглушкой. None: ключ занят этим запросом, иначе сохранённый ответ
+        или чужая заглушка
+        """
+        stored = await self.get(key)
+        if stored is not None:
+            return stored
+        pending = StoredResponse(fingerprint, None, [], b"")
+        if self.persist:
+            try:
+                async with self._session_maker()() as session:
+                    repository = IdempotencyKeyRepository(session)
+                    claimed = await repository.claim(
+                        key,
+                        fingerprint,
+                        self._expired_before(),
+                        self._abandoned_before(),
+                    )
+            except Exception:
+                # Без таблицы ключ защищён только в этом процессе
+                logger.exception(f"Failed to claim idempotency key {key}")
+                claimed = True
+            if not claimed:
+                # Другой процесс занял ключ между чтением и вставкой
+                return await self.get(key) or pending
+        self._remember(key, pending)
+        return None
+
+    async def release(self, key: str) -> None:
+        """Снятие заглушки: запрос завершился без результата, повтор выполнит его заново"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1].pending:
+            del self._entries[key]
+        if not self.persist:
+            return
+
+        try:
+            async with self._session_maker()() as session:
+                await IdempotencyKeyRepository(session).release(key)
+        except Exception:
+            logger.exception(f"Failed to release idempotency key {key}")
+
+    async def save(self, key: str, response: StoredResponse) -> None:
+        self._remember(key, response)
+        if not self.persist:
+            return
+
+        values = {
+            "key": key,
+            "fingerprint": response.fingerprint,
+            "status_code": response.status,
+            "headers": [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in response.headers
+            ],
+            "body": response.body,
+        }
+        try:
+            async with self._session_maker()() as session:
+                repository = IdempotencyKeyRepository(session)
+                await repository.save(values, self._expired_before())
+        except Exception:
+            logger.exception(f"Failed to persist idempotency key {key}")
+
+    async def run_periodically(self, interval_s: float) -> None:
+        """Удаление устаревших ключей из таблицы, LRU вытесняет их сам"""
+        while True:
+            await asyncio.sleep(interval_s)
+            async with self._session_maker()() as session:
+                deleted = await IdempotencyKeyRepository(session).delete_expired(
+                    self._expired_before()
+                )
+            logger.info(f"Deleted {deleted} expired idempotency keys")
+
+    def _remember(self, key: str, response: StoredResponse) -> None:
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _expired_before(self) -> datetime:
+        return datetime.now(UTC) - timedelta(seconds=self.ttl_s)
+
+    def _abandoned_before(self) -> datetime:
+        return datetime.now(UTC) - timedelta(seconds=self.lease_s)
+
+    def _session_maker(self) -> async_sessionmaker[AsyncSession]:
+        return self.session_maker or get_session_maker()
+
+
+idempotency_store = IdempotencyStore(
+    env.idempotency_max_entries,
+    env.idempotency_ttl_s,
+    env.idempotency_lease_s,
+    env.idempotency_persist,
+)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        key = self._get_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not 0 < len(key) <= MAX_KEY_LEN:
+            detail = f"Idempotency-Key must be 1 to {MAX_KEY_LEN} characters long"
+            await self._reject(status.HTTP_400_BAD_REQUEST, detail, scope, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        store_key = f"{scope['path']}:{key}"
+        deadline = time.monotonic() + env.idempotency_wait_s
+        waited = False
+        while True:
+            async with idempotency_store.lock(store_key):
+                stored = await idempotency_store.claim(store_key, fingerprint)
+                if stored is None:
+                    await self._run(scope, body, fingerprint, store_key, receive, send)
+                    return
+
+            if stored.fingerprint != fingerprint:
+                detail = (
+                    "Idempotency-Key was already used with a different request body"
+                )
+                status_code = status.HTTP_422_UNPROCESSABLE_CONTENT
+                await self._reject(status_code, detail, scope, send)
+                return
+            if not stored.pending:
+                break
+            if time.monotonic() >= deadline:
+                idempotent_conflicts_total.inc()
+                detail = (
+                    "A request with this Idempotency-Key is still in progress or its "
+                    "outcome is unknown"
+                )
+                headers = {"Retry-After": "1"}
+                await self._reject(
+                    status.HTTP_409_CONFLICT, detail, scope, send, headers
+                )
+                return
+            # Первый запрос выполняется в другом процессе или уже без клиента: его ответ
+            # появится в хранилище, а снятую заглушку займёт этот запрос
+            if not waited:
+                idempotent_waits_total.inc()
+                waited = True
+            await asyncio.sleep(env.idempotency_poll_interval_s)
+
+        idempotent_replays_total.inc()
+        headers = [*stored.headers, (b"idempotent-replayed", b"true")]
+        await send(
+            {"type": "http.response.start", "status": stored.status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": stored.body})
+
+    @staticmethod
+    def _get_key(scope: Scope) -> str | None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return None
+        for name, value in scope["headers"]:
+            if name == HEADER:
+                return value.decode("latin-1").strip()
+        return None
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Клиент отключился, обработчик увидит это в своём receive
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    async def _run(
+        self,
+        scope: Scope,
+        body: bytes,
+        fingerprint: str,
+        store_key: str,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        """
+        Выполнение запроса с уже прочитанным телом, ответ уходит клиенту и копируется.
+        Отмена (бюджет запроса, отключение клиента) отсоединяет клиента, но обработчик
+        дорабатывает в фоне и сохраняет ответ
+        """
+        body_sent = False
+        attached = True
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # До последнего фрагмента: повтор, отправленный сразу после
+                    # ответа, уже найдёт его в хранилище
+                    await self._save(store_key, fingerprint, start, b"".join(chunks))
+            if attached:
+                await send(message)
+
+        async def execute() -> None:
+            session_commits: list[Session] = []
+            commits.set(session_commits)
+            try:
+                async with asyncio.timeout(env.idempotency_lease_s):
+                    await self.app(scope, replay_receive, send_wrapper)
+            except Exception:
+                if not attached:
+                    logger.exception(f"Detached request {store_key} failed")
+                if not session_commits:
+                    # Ничего не зафиксировано, повтор может выполнить запрос заново
+                    await idempotency_store.release(store_key)
+                raise
+
+        # Копия контекста запроса: обработчику нужен `statement_timeout_ms`
+        task = background.spawn(execute(), copy_context())
+        try:
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            attached = False
+            raise
+
+    @staticmethod
+    async def _save(
+        store_key: str, fingerprint: str, start: Message, body: bytes
+    ) -> None:
+        headers = [(bytes(name), bytes(value)) for name, value in start["headers"]]
+        response = StoredResponse(fingerprint, start["status"], headers, body)
+        if response.cacheable:
+            await idempotency_store.save(store_key, response)
+        else:
+            await idempotency_store.release(store_key)
+
+    @staticmethod
+    async def _reject(
+        status_code: int,
+        detail: str,
+        scope: Scope,
+        send: Send,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        response = JSONResponse(
+            {"detail": detail}, status_code=status_code, headers=headers
+        )
+        await response(scope, IdempotencyMiddleware._receive_nothing, send)
+
+    @staticmethod
+    async def _receive_nothing() -> Message:
+        return {"type": "http.disconnect"}
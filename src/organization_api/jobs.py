@@ -0,0 +1,88 @@
+"""
+Длительные фоновые операции, например очистка мягко удалённых строк. Состояние задач
+хранится в памяти процесса и читается через GET /jobs/{id}, завершённые задачи
+вытесняются по мере появления новых
+"""
+
+import asyncio
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from uuid import uuid4
+
+from loguru import logger
+
+import background
+from config import env
+
+
+@dataclass
+class Job:
+    kind: str
+    # Сколько строк (подразделений и сотрудников) предстоит обработать, оценка на старте
+    total: int
+    id: str = field(default_factory=lambda: uuid4().hex)
+    status: str = "pending"  # pending, running, done, failed, cancelled
+    processed: int = 0
+    error: str | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    finished_at: datetime | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+
+class JobRegistry:
+    def __init__(self, retained: int) -> None:
+        self.retained = retained
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def get(self, id: str) -> Job | None:
+        return self._jobs.get(id)
+
+    def start(
+        self, kind: str, total: int, work: Callable[[Job], Awaitable[None]]
+    ) -> Job:
+        job = Job(kind, total)
+        self._jobs[job.id] = job
+        self._evict()
+        task = background.spawn(self._run(job, work))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def wait(self, id: str) -> None:
+        task = self._tasks.get(id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    def reset(self) -> None:
+        self._jobs.clear()
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable[None]]) -> None:
+        job.status = "running"
+        try:
+            await work(job)
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as exc:
+            logger.exception(f"Job {job.kind} {job.id} failed")
+            job.status = "failed"
+            job.error = str(exc)
+        else:
+            job.status = "done"
+        finally:
+            job.finished_at = datetime.now(UTC)
+
+    def _evict(self) -> None:
+        # Незавершённые задачи не вытесняются, иначе их статус будет не узнать
+        excess = max(len(self._jobs) - self.retained, 0)
+        for id in [id for id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[id]
+
+
+job_registry = JobRegistry(env.jobs_retained)
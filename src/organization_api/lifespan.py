@@ -0,0 +1,86 @@
+"""
+Прогрев при старте. Без него первые запросы после деплоя платят за открытие соединений
+пула, интроспекцию типов asyncpg, подготовку выражений и компиляцию SQL в SQLAlchemy.
+Прогрев идёт фоновой задачей после старта, когда сервер уже принимает соединения, а
+готовность (`/ready`) выставляется только после него
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import background
+from audit import audit_log
+from config import env
+from idempotency import idempotency_store
+from services import org_snapshot, purge_worker
+from data.org_graph import org_graph
+from data.repositories import DepartmentRepository, EmployeeRepository
+from data.db_connection import get_engine, get_session_maker
+
+# Несуществующий ID: запросы проходят весь путь до БД, но ничего не возвращают
+WARM_UP_ID = 0
+
+
+async def warm_up_connection(session_maker: async_sessionmaker[AsyncSession]) -> None:
+    async with session_maker() as session:
+        departments = DepartmentRepository(session)
+        employees = EmployeeRepository(session)
+        await departments.exists(WARM_UP_ID)
+        await departments.get_node(WARM_UP_ID, include_employees=True)
+        await departments.get_with_employees(WARM_UP_ID)
+        await departments.get_filtered_page(None, 1)
+        await departments.get_ancestors(WARM_UP_ID)
+        await departments.count_subtree(WARM_UP_ID, 1)
+        await employees.get_page_by_departments([WARM_UP_ID], None, 1)
+        await session.rollback()
+
+
+async def warm_up(
+    session_maker: async_sessionmaker[AsyncSession], connections: int, preload: bool
+) -> None:
+    started = time.perf_counter()
+    # Сессии работают одновременно, поэтому каждая берёт из пула своё соединение, а
+    # подготовленные выражения asyncpg кэшируются на каждом из них
+    await asyncio.gather(
+        *(warm_up_connection(session_maker) for _ in range(connections))
+    )
+    if preload:
+        async with session_maker() as session:
+            await org_graph.get(session)
+        await org_snapshot.rebuild()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Warm-up of {connections} connections took {elapsed_ms:.0f} ms")
+
+
+async def warm_up_and_mark_ready(app: FastAPI) -> None:
+    try:
+        await warm_up(get_session_maker(), env.db_pool_size, env.warm_up_preload)
+    except Exception:
+        # Прогрев только ускоряет первые запросы, без него кэши заполнятся по ходу
+        logger.exception("Warm-up failed")
+    app.state.ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    app.state.ready = False
+    # Ожидание здесь задержало бы старт сервера, и /ready было бы некому ответить 503
+    app.state.warm_up = background.spawn(warm_up_and_mark_ready(app))
+    background.spawn(purge_worker.run_periodically())
+    if idempotency_store.persist:
+        background.spawn(
+            idempotency_store.run_periodically(env.idempotency_prune_interval_s)
+        )
+    audit_log.start()
+    yield
+    app.state.ready = False
+    # До отмены фоновых задач, иначе пакет писателя журнала потеряется
+    await audit_log.close()
+    await background.cancel_all()
+    await get_engine().dispose()
@@ -5,14 +5,18 @@ from loguru import logger
 from config import BASE_DIR
 
 LOG_DIR = BASE_DIR / "logs"
-LOG_DIR.mkdir(exist_ok=True)
 
 FORMAT = (
     "[{level}]:    '{message}' at {name}:{function}    ({time:YYYY-MM-DD HH:mm:ss})"
 )
 
 
+def is_slow_query(record: dict) -> bool:
+    return "slow_query" in record["extra"]
+
+
 def setup_logger():
+    LOG_DIR.mkdir(exist_ok=True)
     logger.remove()
 
     logger.add(sys.stdout, level="DEBUG", format=FORMAT)
@@ -27,4 +31,16 @@ def setup_logger():
         enqueue=True,
         backtrace=True,
         diagnose=False,
+        filter=lambda record: not is_slow_query(record),
+    )
+
+    logger.add(
+        LOG_DIR / "slow_queries.log",
+        level="INFO",
+        format=FORMAT,
+        rotation="10 MB",
+        retention="7 days",
+        compression="zip",
+        enqueue=True,
+        filter=is_slow_query,
     )
@@ -1,10 +1,47 @@
+"""
+Приложение собирается фабрикой `create_app()`: настройка логгера (каталог логов, потоки
+для `enqueue`) и движок БД создаются не при импорте, а при сборке и первом запросе.
+Для uvicorn: `uvicorn main:create_app --factory`. `main.app` собирается при первом
+обращении и нужен тем, кто импортирует готовое приложение
+"""
+
 from fastapi import FastAPI
 
+from idempotency import IdempotencyMiddleware
+from lifespan import lifespan
 from logger_config import setup_logger
-from web import router
+from middleware import RequestBudgetMiddleware
+from web import (
+    router,
+    metrics_router,
+    export_router,
+    reports_router,
+    jobs_router,
+    audit_router,
+    changes_router,
+)
+
+
+def create_app() -> FastAPI:
+    setup_logger()
+
+    app = FastAPI(lifespan=lifespan)
 
-setup_logger()
+    app.include_router(router)
+    app.include_router(metrics_router)
+    app.include_router(export_router)
+    app.include_router(reports_router)
+    app.include_router(jobs_router)
+    app.include_router(audit_router)
+    app.include_router(changes_router)
+    # Внутри бюджета: дубль, ждущий первый запрос, ограничен тем же таймаутом
+    app.add_middleware(IdempotencyMiddleware)
+    app.add_middleware(RequestBudgetMiddleware)
+    return app
 
-app = FastAPI()
 
-app.include_router(router)
+def __getattr__(name: str) -> FastAPI:
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    app = globals()["app"] = create_app()
+    return app
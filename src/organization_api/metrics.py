@@ -0,0 +1,55 @@
+"""
+Минимальный реестр метрик в текстовом формате Prometheus. Отдельная клиентская библиотека
+ради нескольких счётчиков не нужна, а процесс один на контейнер
+"""
+
+from collections.abc import Iterator
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+class Metric:
+    type: str
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.values: dict[LabelKey, float] = {}
+        registry.append(self)
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, value in self.values.items():
+            labels = ",".join(f'{name}="{label}"' for name, label in key)
+            yield f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}"
+
+    @staticmethod
+    def _key(labels: dict[str, str]) -> LabelKey:
+        return tuple(sorted(labels.items()))
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[self._key(labels)] = value
+
+
+registry: list[Metric] = []
+
+
+def render_metrics() -> str:
+    lines = [line for metric in registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,119 @@
+"""
+Бюджет времени на запрос. Для каждого маршрута из `config` берётся таймаут, который
+ограничивает и корутину обработчика (`asyncio.timeout`), и каждую транзакцию в БД
+(`SET LOCAL statement_timeout`). Если клиент отключился, обработчик отменяется сразу,
+чтобы соединение вернулось в пул, а не дорабатывало рекурсивные запросы впустую
+"""
+
+import asyncio
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import env
+from exceptions import get_sqlstate
+from metrics import Counter
+from data.db_connection import statement_timeout_ms
+
+QUERY_CANCELED = "57014"
+
+timeouts_total = Counter("request_timeouts_total", "Requests cut by their time budget")
+disconnects_total = Counter(
+    "request_disconnects_total", "Requests cancelled after the client disconnected"
+)
+
+
+def get_route_name(scope: Scope) -> str | None:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.name
+    return None
+
+
+def get_route_timeout(name: str | None) -> float:
+    return env.route_timeouts_s.get(name, env.default_route_timeout_s)
+
+
+class RequestBudgetMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = get_route_name(scope) or "unknown"
+        timeout = get_route_timeout(route)
+        token = statement_timeout_ms.set(max(int(timeout * 1000), 1))
+        try:
+            await self._run(scope, receive, send, route, timeout)
+        finally:
+            statement_timeout_ms.reset(token)
+
+    async def _run(
+        self, scope: Scope, receive: Receive, send: Send, route: str, timeout: float
+    ) -> None:
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+        disconnected = False
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, messages.get, send_wrapper))
+
+        async def listen_for_disconnect() -> None:
+            # Тело запроса пересылается обработчику через очередь, а после него
+            # receive() блокируется до отключения клиента
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected = not app_task.done()
+                    app_task.cancel()
+                    return
+
+        listener = asyncio.create_task(listen_for_disconnect())
+        try:
+            async with asyncio.timeout(timeout):
+                await app_task
+        except TimeoutError:
+            await self._respond_timeout(route, "budget", response_started, scope, send)
+        except DBAPIError as exc:
+            if get_sqlstate(exc) != QUERY_CANCELED:
+                raise
+            await self._respond_timeout(
+                route, "statement_timeout", response_started, scope, send
+            )
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            disconnects_total.inc(route=route)
+        finally:
+            listener.cancel()
+            app_task.cancel()
+
+    async def _respond_timeout(
+        self, route: str, reason: str, response_started: bool, scope: Scope, send: Send
+    ) -> None:
+        timeouts_total.inc(route=route, reason=reason)
+        if response_started:
+            return
+        response = JSONResponse(
+            {"detail": "Request timed out"},
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+        await response(scope, self._receive_nothing, send)
+
+    @staticmethod
+    async def _receive_nothing() -> Message:
+        return {"type": "http.disconnect"}
@@ -1,4 +1,5 @@
 from datetime import datetime, date
+from typing import ClassVar
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
@@ -34,15 +35,162 @@ class DepartmentOut(DepartmentBase):
     id: int
     children: list["DepartmentOut"] | None = None
     employees: list["EmployeeOut"] | None = None
+    # Курсор для GET /departments/{id}/employees/, если сотрудники обрезаны max_employees
+    employees_next_cursor: str | None = None
+    # Численность из поддерживаемых счётчиков, без обхода поддерева
+    direct_employee_count: int = 0
+    subtree_employee_count: int = 0
+    subtree_department_count: int = 0
     created_at: datetime
 
     model_config = {"from_attributes": True}
 
 
+class FieldSelection(BaseModel):
+    """
+    Разобранный параметр `fields`, например `id,name,employees.full_name`. Дочерние
+    подразделения выводятся всегда, их количество задаёт `depth`
+    """
+
+    DEPARTMENT_FIELDS: ClassVar[frozenset[str]] = frozenset(
+        (
+            "id",
+            "name",
+            "parent_id",
+            "direct_employee_count",
+            "subtree_employee_count",
+            "subtree_department_count",
+            "created_at",
+        )
+    )
+    EMPLOYEE_FIELDS: ClassVar[frozenset[str]] = frozenset(
+        ("id", "department_id", "full_name", "position", "hired_at", "created_at")
+    )
+
+    department: frozenset[str]
+    employees: frozenset[str] | None = None
+
+    @classmethod
+    def parse(cls, fields: str) -> "FieldSelection":
+        department, employees = set(), None
+        for field in filter(None, (field.strip() for field in fields.split(","))):
+            relation, _, employee_field = field.partition(".")
+            if field == "children":
+                continue
+            elif field == "employees":
+                employees = set(cls.EMPLOYEE_FIELDS)
+            elif relation == "employees" and employee_field in cls.EMPLOYEE_FIELDS:
+                employees = (employees or set()) | {employee_field}
+            elif field in cls.DEPARTMENT_FIELDS:
+                department.add(field)
+            else:
+                raise ValueError(f"Unknown field {field}")
+        return cls(department=department, employees=employees)
+
+
 class DepartmentGetData(BaseModel):
     id: int
     depth: int = Field(ge=1, le=DefaultField.MAX_DEPTH)
     include_employees: bool
+    max_employees: int | None = Field(default=None, ge=1, le=DefaultField.MAX_PAGE_SIZE)
+    fields: FieldSelection | None = None
+
+    @model_validator(mode="after")
+    def validate_fields(self):
+        if self.fields and self.max_employees:
+            raise ValueError("max_employees can not be combined with fields")
+        return self
+
+
+class DepartmentBatchData(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=DefaultField.MAX_BATCH_SIZE)
+    depth: int = Field(ge=1, le=DefaultField.MAX_DEPTH)
+    include_employees: bool
+
+    @field_validator("ids", mode="after")
+    @classmethod
+    def deduplicate(cls, value: list[int]) -> list[int]:
+        return list(dict.fromkeys(value))
+
+
+class DepartmentBatchItem(BaseModel):
+    # Заполняется либо department, либо error
+    id: int
+    department: DepartmentOut | None = None
+    error: str | None = None
+
+
+class DepartmentBatch(BaseModel):
+    items: list[DepartmentBatchItem]
+
+
+class DepartmentListData(BaseModel):
+    cursor: int | None = None
+    limit: int = Field(ge=1, le=DefaultField.MAX_PAGE_SIZE)
+    parent_id: int | None = None
+    name_prefix: str | None = Field(default=None, max_length=DefaultField.MAX_TITLE_LEN)
+    ids_only: bool
+
+
+class DepartmentListItem(BaseModel):
+    # В режиме ids_only заполняется только id, остальные поля не попадают в ответ
+    id: int
+    name: str | None = None
+    parent_id: int | None = None
+    created_at: datetime | None = None
+
+
+class DepartmentAncestor(BaseModel):
+    id: int
+    name: str
+    parent_id: int | None = None
+
+
+class DepartmentStatsData(BaseModel):
+    id: int
+    depth: int = Field(ge=0, le=DefaultField.MAX_DEPTH)
+
+
+class DepartmentStats(BaseModel):
+    # level считается от запрошенного подразделения, total_* включают всех потомков
+    id: int
+    name: str
+    parent_id: int | None = None
+    level: int
+    direct_employees: int
+    total_employees: int
+    total_departments: int
+    earliest_hired_at: date | None = None
+    latest_hired_at: date | None = None
+
+
+class DepartmentSummaryData(BaseModel):
+    cursor: int | None = None
+    limit: int = Field(ge=1, le=DefaultField.MAX_PAGE_SIZE)
+    root_id: int | None = None
+    max_depth: int | None = Field(default=None, ge=0)
+
+
+class DepartmentSummary(BaseModel):
+    id: int
+    name: str
+    parent_id: int | None = None
+    path: str
+    path_ids: list[int]
+    depth: int
+    headcount: int
+    subtree_headcount: int
+    subtree_size: int
+
+
+class DepartmentSummaryPage(BaseModel):
+    items: list[DepartmentSummary]
+    next_cursor: int | None = None
+
+
+class DepartmentPage(BaseModel):
+    items: list[DepartmentListItem]
+    next_cursor: int | None = None
 
 
 class DepartmentDeleteData(BaseModel):
@@ -64,6 +212,49 @@ class DepartmentDeleteData(BaseModel):
         return self
 
 
+class JobOut(BaseModel):
+    model_config = {"from_attributes": True}
+
+    id: str
+    kind: str
+    status: str
+    total: int
+    processed: int
+    error: str | None = None
+    created_at: datetime
+    finished_at: datetime | None = None
+
+
+class AuditListData(BaseModel):
+    since: datetime | None = None
+    until: datetime | None = None
+    after: tuple[datetime, int] | None = None
+    limit: int = Field(ge=1, le=DefaultField.MAX_PAGE_SIZE)
+    entity: str | None = None
+    entity_id: int | None = None
+
+
+class AuditEventOut(BaseModel):
+    model_config = {"from_attributes": True}
+
+    id: int
+    occurred_at: datetime
+    action: str
+    entity: str
+    entity_id: int
+    details: dict
+
+
+class AuditPage(BaseModel):
+    items: list[AuditEventOut]
+    next_cursor: str | None = None
+
+
+class ChangeListData(BaseModel):
+    since: int = Field(ge=0)
+    limit: int = Field(ge=1, le=DefaultField.MAX_PAGE_SIZE)
+
+
 class EmployeeBase(BaseModel):
     department_id: int
     full_name: str = Field(
@@ -82,3 +273,32 @@ class EmployeeIn(EmployeeBase):
 class EmployeeOut(EmployeeBase):
     id: int
     created_at: datetime
+
+
+class EmployeeListData(BaseModel):
+    department_id: int
+    after: tuple[str, int] | None = None
+    limit: int = Field(ge=1, le=DefaultField.MAX_PAGE_SIZE)
+    include_subtree: bool
+
+
+class EmployeePage(BaseModel):
+    items: list[EmployeeOut]
+    next_cursor: str | None = None
+
+
+class ChangeFeed(BaseModel):
+    """
+    Текущее состояние подразделений и сотрудников, изменённых после `since`. Затронутые
+    несколько раз приходят один раз, удалённые (в том числе мягко) перечислены по ID
+    """
+
+    since: int
+    # Курсор следующего запроса
+    next_since: int
+    has_more: bool
+    head: int
+    departments: list[DepartmentListItem]
+    employees: list[EmployeeOut]
+    deleted_department_ids: list[int]
+    deleted_employee_ids: list[int]
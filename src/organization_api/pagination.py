@@ -0,0 +1,22 @@
+"""
+Непрозрачные курсоры для keyset-пагинации по составному ключу, например `(full_name, id)`
+"""
+
+import base64
+import json
+from typing import Any
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as exc:  # binascii.Error и JSONDecodeError наследуют ValueError
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
@@ -4,28 +4,76 @@
 чтобы функции и методы в других модулях не разрастались
 """
 
+import asyncio
+import time
+from datetime import UTC, datetime, timedelta
+from collections import defaultdict
+from collections.abc import AsyncGenerator
+
 from loguru import logger
+from pydantic_core import to_json
 from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import decl_api
 
 from models import (
+    AuditEventOut,
+    AuditListData,
+    AuditPage,
+    ChangeFeed,
+    ChangeListData,
     DepartmentIn,
     DepartmentOut,
     DepartmentChange,
     EmployeeIn,
     EmployeeOut,
     DepartmentGetData,
+    DepartmentAncestor,
+    DepartmentBatch,
+    DepartmentBatchData,
+    DepartmentBatchItem,
+    DepartmentStats,
+    DepartmentStatsData,
+    DepartmentSummary,
+    DepartmentSummaryData,
+    DepartmentSummaryPage,
+    DepartmentListData,
+    DepartmentListItem,
+    DepartmentPage,
     DepartmentDeleteData,
+    EmployeeListData,
+    EmployeePage,
+    FieldSelection,
 )
+from pagination import encode_cursor
 from validators import (
-    validate_department_creation_data,
-    validate_department_change_data,
     check_department_exists,
+    check_integrity_error,
+    check_reassign_target_outside_subtree,
+)
+from admission import estimate_cost
+from background import Debouncer
+from jobs import Job, job_registry
+from audit import audit_log
+from exceptions import DepartmentDoesNotExist, JobDoesNotExist
+from config import env
+from metrics import Counter
+from snapshot import OrgSnapshot, SnapshotEntry
+from data.repositories import (
+    AuditRepository,
+    ChangeRepository,
+    DepartmentRepository,
+    DepartmentSummaryRepository,
+    EmployeeRepository,
+)
+from data.org_graph import OrgGraph, org_graph
+from data.sql_models import Department, Employee, DefaultField
+from data.db_connection import get_async_session, get_session_maker
+
+summary_refreshes_total = Counter(
+    "summary_refreshes_total", "Finished department_summary refreshes"
 )
-from data.repositories import DepartmentRepository, EmployeeRepository
-from data.sql_models import Department, Employee
-from data.db_connection import get_async_session
 
 
 class RecursiveDepartmentLoader:
@@ -39,9 +87,15 @@ class RecursiveDepartmentLoader:
         self,
         include_employees: bool,
         session: AsyncSession = Depends(get_async_session),
+        max_employees: int | None = None,
+        graph: OrgGraph | None = None,
     ) -> None:
         self.include_employees = include_employees
+        self.max_employees = max_employees
+        # С индексом структуры дети берутся из него, а не отдельным selectin-запросом
+        self.graph = graph
         self.department_repository = DepartmentRepository(session)
+        self.employee_repository = EmployeeRepository(session)
 
     async def exec(self, id: int, depth: int) -> DepartmentOut | None:
         department = await self._get_department(id)
@@ -49,34 +103,56 @@ class RecursiveDepartmentLoader:
         if not department:
             return
 
+        employees = await self._get_employees(department)
+
         if depth == 0:
-            return self._serialize_child(department)
+            return self._serialize_child(department, employees)
 
         children = await self._get_children(depth, department)  # Вызов рекурсии
 
-        result = self._serialize_result(department, children)
+        result = self._serialize_result(department, children, employees)
 
         return result
 
     async def _get_department(self, id) -> Department | None:
-        if self.include_employees:
+        if self.graph:
+            include_employees = self.include_employees and not self.max_employees
+            department = await self.department_repository.get_node(
+                id, include_employees
+            )
+        elif self.include_employees and not self.max_employees:
             department = await self.department_repository.get_with_employees(id)
         else:
-            department = await self.department_repository.get_with_children(id)
+            department = await self.department_repository.get_without_employees(id)
         return department
 
-    def _serialize_child(self, department: Department) -> DepartmentOut:
-        department_dumped = self.department_repository.dump(department)
+    async def _get_employees(self, department: Department) -> EmployeePage:
+        if not self.include_employees:
+            return EmployeePage(items=[])
+        if not self.max_employees:
+            employees = self._serialize_employees(department.employees)
+            return EmployeePage(items=employees)
 
-        employees_serialized = self._serialize_employees(department.employees)
+        employees = await self.employee_repository.get_page_by_departments(
+            [department.id], None, self.max_employees + 1
+        )
+        return paginate_employees(employees, self.max_employees)
+
+    def _serialize_child(
+        self, department: Department, employees: EmployeePage
+    ) -> DepartmentOut:
+        department_dumped = self.department_repository.dump(department)
 
         department_serialized = DepartmentOut(
-            **department_dumped, employees=employees_serialized
+            **department_dumped,
+            employees=employees.items,
+            employees_next_cursor=employees.next_cursor,
         )
         return department_serialized
 
+    @staticmethod
     def _serialize_employees(
-        self, employees: list[Employee] | None
+        employees: list[Employee] | None,
     ) -> list[EmployeeOut] | None:
         if employees:
             serialized = [
@@ -90,30 +166,353 @@ class RecursiveDepartmentLoader:
     async def _get_children(
         self, depth: int, department: Department
     ) -> list[DepartmentOut]:
-        children = [
-            await self.exec(child.id, depth - 1) for child in department.children
-        ]
+        if self.graph:
+            ids = self.graph.children(department.id)
+        else:
+            ids = [child.id for child in department.children]
+        children = [await self.exec(id, depth - 1) for id in ids]
         return children
 
     def _serialize_result(
-        self, department: Department, children: list[DepartmentOut] | None
+        self,
+        department: Department,
+        children: list[DepartmentOut] | None,
+        employees: EmployeePage,
     ) -> DepartmentOut:
         department_dumped = self.department_repository.dump(department)
-        employees_serialized = self._serialize_employees((department.employees))
         department_serialized = DepartmentOut(
-            **department_dumped, children=children, employees=employees_serialized
+            **department_dumped,
+            children=children,
+            employees=employees.items,
+            employees_next_cursor=employees.next_cursor,
         )
         return department_serialized
 
 
+class SparseDepartmentLoader(RecursiveDepartmentLoader):
+    """
+    Вариант RecursiveDepartmentLoader для параметра `fields`: из БД читаются только
+    запрошенные колонки, а результат собирается в словари без моделей Pydantic
+    """
+
+    def __init__(
+        self, fields: FieldSelection, include_employees: bool, session: AsyncSession
+    ) -> None:
+        super().__init__(include_employees, session)
+        self.fields = fields
+        self.employee_fields = fields.employees if include_employees else None
+
+    async def _get_department(self, id) -> Department | None:
+        return await self.department_repository.get_sparse(
+            id, self.fields.department, self.employee_fields
+        )
+
+    async def _get_employees(self, department: Department) -> list[dict] | None:
+        if not self.employee_fields:
+            return None
+        return [
+            {field: getattr(employee, field) for field in self.employee_fields}
+            for employee in department.employees
+        ]
+
+    def _serialize_child(
+        self, department: Department, employees: list[dict] | None
+    ) -> dict:
+        serialized = {
+            field: getattr(department, field) for field in self.fields.department
+        }
+        if employees is not None:
+            serialized["employees"] = employees
+        return serialized
+
+    def _serialize_result(
+        self,
+        department: Department,
+        children: list[dict] | None,
+        employees: list[dict] | None,
+    ) -> dict:
+        serialized = self._serialize_child(department, employees)
+        serialized["children"] = children
+        return serialized
+
+
+class BatchDepartmentLoader:
+    """
+    Поддеревья сразу нескольких подразделений обходятся в ширину общими запросами: на каждый
+    уровень один `parent_id IN (...)`, сотрудники всех узлов одним запросом. Каждое
+    подразделение загружается один раз, даже если поддеревья пересекаются
+    """
+
+    def __init__(self, include_employees: bool, session: AsyncSession) -> None:
+        self.include_employees = include_employees
+        self.department_repository = DepartmentRepository(session)
+        self.employee_repository = EmployeeRepository(session)
+        self.departments: dict[int, dict] = {}
+        self.children: dict[int, list[int]] = defaultdict(list)
+        self.employees: dict[int, list[EmployeeOut]] = defaultdict(list)
+
+    async def exec(self, ids: list[int], depth: int) -> dict[int, DepartmentOut]:
+        roots = await self.department_repository.get_rows(Department.id.in_(ids))
+        self._remember(roots)
+
+        # Обход из всех корней одновременно: узел впервые встречается на кратчайшем
+        # расстоянии от запрошенного предка, то есть с наибольшей оставшейся глубиной
+        frontier = [row["id"] for row in roots]
+        for _ in range(depth):
+            if not frontier:
+                break
+            rows = await self.department_repository.get_rows(
+                Department.parent_id.in_(frontier)
+            )
+            for row in rows:
+                self.children[row["parent_id"]].append(row["id"])
+            frontier = [row["id"] for row in rows if row["id"] not in self.departments]
+            self._remember(rows)
+
+        if self.include_employees:
+            await self._load_employees()
+
+        return {id: self._serialize(id, depth) for id in ids if id in self.departments}
+
+    def _remember(self, rows: list) -> None:
+        for row in rows:
+            self.departments.setdefault(row["id"], dict(row))
+
+    async def _load_employees(self) -> None:
+        rows = await self.employee_repository.get_rows(
+            Employee.department_id.in_(list(self.departments)),
+            order_by=(Employee.full_name, Employee.id),
+        )
+        for row in rows:
+            self.employees[row["department_id"]].append(EmployeeOut(**row))
+
+    def _serialize(self, id: int, depth: int) -> DepartmentOut:
+        children = None
+        if depth > 0:
+            children = [
+                self._serialize(child, depth - 1) for child in self.children[id]
+            ]
+        employees = self.employees[id] if self.include_employees else []
+        return DepartmentOut(
+            **self.departments[id], children=children, employees=employees
+        )
+
+
+def paginate_employees(employees: list[Employee], limit: int) -> EmployeePage:
+    """`employees` запрошены с limit + 1, лишняя запись означает наличие следующей страницы"""
+    items = RecursiveDepartmentLoader._serialize_employees(employees[:limit])
+    if len(employees) > limit:
+        last = items[-1]
+        return EmployeePage(items=items, next_cursor=encode_cursor(last.full_name, last.id))
+    return EmployeePage(items=items)
+
+
+async def build_snapshot(session: AsyncSession) -> dict[int, bytes]:
+    """Ответы GET /departments/{id} с параметрами по умолчанию для корневых подразделений"""
+    repository = DepartmentRepository(session)
+    loader = RecursiveDepartmentLoader(True, session)
+    bodies = {}
+    for id in await repository.get_root_ids():
+        department = await loader.exec(id, DefaultField.DEFAULT_DEPTH)
+        if department:
+            bodies[id] = department.model_dump_json().encode()
+    return bodies
+
+
+org_snapshot = OrgSnapshot(
+    build_snapshot, env.snapshot_debounce_s, env.snapshot_head_ttl_s
+)
+
+
+class SummaryRefresher:
+    """
+    Обновляет `department_summary` через `debounce_s` после последней записи: серия
+    изменений даёт одно обновление, а CONCURRENTLY не блокирует чтение отчётов
+    """
+
+    def __init__(self, debounce_s: float) -> None:
+        # None: основной движок приложения, тесты подставляют свой
+        self.session_maker: async_sessionmaker[AsyncSession] | None = None
+        self._debouncer = Debouncer(debounce_s, self.refresh)
+
+    @property
+    def pending(self) -> bool:
+        return self._debouncer.pending
+
+    def request(self) -> None:
+        self._debouncer.trigger()
+
+    def cancel(self) -> None:
+        self._debouncer.cancel()
+
+    async def refresh(self) -> None:
+        session_maker = self.session_maker or get_session_maker()
+        async with session_maker() as session:
+            await DepartmentSummaryRepository(session).refresh()
+        summary_refreshes_total.inc()
+
+
+summary_refresher = SummaryRefresher(env.summary_refresh_debounce_s)
+
+
+class PurgeWorker:
+    """
+    Физическое удаление мягко удалённых строк старше `retention_s`. Сотрудники и
+    подразделения (от листьев к корню) удаляются порциями по `batch_size`, каждая в своей
+    короткой транзакции. Каждый проход с работой виден как задача в GET /jobs/{id}
+    """
+
+    def __init__(
+        self,
+        retention_s: float,
+        interval_s: float,
+        batch_size: int,
+        window_utc: tuple[int, int],
+    ) -> None:
+        # None: основной движок приложения, тесты подставляют свой
+        self.session_maker: async_sessionmaker[AsyncSession] | None = None
+        self.retention_s = retention_s
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.window_utc = window_utc
+
+    def in_window(self, now: datetime) -> bool:
+        start, end = self.window_utc
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    async def run_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            if self.in_window(datetime.now(UTC)):
+                job = await self.start()
+                if job is not None:
+                    await job_registry.wait(job.id)
+
+    async def start(self) -> Job | None:
+        """Задача очистки или `None`, если очищать нечего"""
+        deleted_before = datetime.now(UTC) - timedelta(seconds=self.retention_s)
+        async with self._session_maker()() as session:
+            total = await DepartmentRepository(session).count_purgeable(deleted_before)
+        if not total:
+            return None
+        return job_registry.start(
+            "purge", total, lambda job: self.purge(job, deleted_before)
+        )
+
+    async def purge(self, job: Job, deleted_before: datetime) -> None:
+        async with self._session_maker()() as session:
+            repository = DepartmentRepository(session)
+            for purge_batch in (repository.purge_employees, repository.purge_departments):
+                while purged := await purge_batch(deleted_before, self.batch_size):
+                    job.processed += purged
+        logger.info(f"Purged {job.processed} soft deleted rows")
+
+    def _session_maker(self) -> async_sessionmaker[AsyncSession]:
+        return self.session_maker or get_session_maker()
+
+
+purge_worker = PurgeWorker(
+    env.soft_delete_retention_s,
+    env.purge_interval_s,
+    env.purge_batch_size,
+    env.purge_window_utc,
+)
+
+
+class ChangeNotifier:
+    """
+    Будит SSE-подписчиков ленты после фиксации записи в этом процессе. Подписка берётся до
+    чтения ленты, поэтому запись между чтением и ожиданием не теряется
+    """
+
+    def __init__(self) -> None:
+        self._changed = asyncio.Event()
+
+    def subscribe(self) -> asyncio.Event:
+        return self._changed
+
+    def notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+change_notifier = ChangeNotifier()
+
+
+def notify_organization_changed() -> None:
+    org_graph.mark_stale()
+    org_snapshot.invalidate()
+    summary_refresher.request()
+    change_notifier.notify()
+
+
+class SubtreeSizeCache:
+    """
+    Размеры поддеревьев для оценки стоимости чтения. Неточная оценка влияет только на очередь
+    допуска, поэтому достаточно TTL без инвалидации при записи
+    """
+
+    def __init__(self, ttl_s: float) -> None:
+        self.ttl_s = ttl_s
+        self._sizes: dict[tuple[int, int], tuple[float, int, int]] = {}
+
+    async def get(
+        self, id: int, depth: int, repository: DepartmentRepository
+    ) -> tuple[int, int]:
+        cached = self._sizes.get((id, depth))
+        if cached and cached[0] > time.monotonic():
+            _, departments, employees = cached
+            return departments, employees
+
+        departments, employees = await repository.count_subtree(id, depth)
+        expires_at = time.monotonic() + self.ttl_s
+        self._sizes[(id, depth)] = (expires_at, departments, employees)
+        return departments, employees
+
+    def clear(self) -> None:
+        self._sizes.clear()
+
+
+subtree_size_cache = SubtreeSizeCache(env.subtree_size_cache_ttl_s)
+
+
+async def service_estimate_department_cost(
+    data: DepartmentGetData, session: AsyncSession
+) -> int:
+    repository = DepartmentRepository(session)
+    departments, employees = await subtree_size_cache.get(
+        data.id, data.depth, repository
+    )
+    if not data.include_employees:
+        employees = 0
+    elif data.max_employees:
+        employees = min(employees, departments * data.max_employees)
+    return estimate_cost(departments, employees)
+
+
 async def service_create_department(
     data: DepartmentIn, session=Depends(get_async_session)
 ) -> Department:
     repository = DepartmentRepository(session)
-    await validate_department_creation_data(repository, data)
-    department = await repository.create(data.model_dump())
+    # Внешний ключ не отличает мягко удалённого родителя, отсутствующего он отклонит сам
+    if data.parent_id and await repository.get_deleted(data.parent_id):
+        raise DepartmentDoesNotExist("Parent department does not exist")
+    try:
+        department = await repository.create(data.model_dump())
+    except IntegrityError as exc:
+        check_integrity_error(exc)
 
     logger.info(f"Created department '{department.name}' with ID `{department.id}")
+    await audit_log.record(
+        "create",
+        "department",
+        department.id,
+        name=department.name,
+        parent_id=department.parent_id,
+    )
+    notify_organization_changed()
 
     return department
 
@@ -127,28 +526,168 @@ async def service_create_employee(
     repository = EmployeeRepository(session)
     employee = await repository.create(data.model_dump())
     logger.info(f"Created employee {employee.full_name} with ID {employee.id}")
+    await audit_log.record(
+        "create",
+        "employee",
+        employee.id,
+        full_name=employee.full_name,
+        department_id=employee.department_id,
+    )
+    notify_organization_changed()
 
     return employee
 
 
+async def service_get_department_snapshot(
+    data: DepartmentGetData, session: AsyncSession
+) -> SnapshotEntry | None:
+    is_default = (
+        data.depth == DefaultField.DEFAULT_DEPTH
+        and data.include_employees
+        and data.max_employees is None
+        and data.fields is None
+    )
+    return await org_snapshot.get(data.id, session) if is_default else None
+
+
 async def service_get_department(
     data: DepartmentGetData, session: AsyncSession
-) -> DepartmentOut:
+) -> DepartmentOut | dict:
     repository = DepartmentRepository(session)
-    await check_department_exists(data.id, repository)
+    graph = await check_department_exists(data.id, repository)
 
-    loader = RecursiveDepartmentLoader(data.include_employees, session)
+    if data.fields:
+        loader = SparseDepartmentLoader(data.fields, data.include_employees, session)
+    else:
+        loader = RecursiveDepartmentLoader(
+            data.include_employees, session, data.max_employees, graph
+        )
     department = await loader.exec(data.id, data.depth)
     return department
 
 
+async def service_get_ancestors(
+    id: int, session: AsyncSession
+) -> list[DepartmentAncestor]:
+    repository = DepartmentRepository(session)
+    rows = await repository.get_ancestors(id)
+    if not rows:  # В цепочке всегда есть само подразделение
+        raise DepartmentDoesNotExist(f"Department with id {id} does not exist")
+    return [DepartmentAncestor(**row) for row in rows]
+
+
+async def service_get_department_stats(
+    data: DepartmentStatsData, session: AsyncSession
+) -> list[DepartmentStats]:
+    repository = DepartmentRepository(session)
+    rows = await repository.get_subtree_stats(data.id, data.depth)
+    if not rows:
+        raise DepartmentDoesNotExist(f"Department with id {data.id} does not exist")
+    return [DepartmentStats(**row) for row in rows]
+
+
+async def service_get_department_summary(
+    data: DepartmentSummaryData, session: AsyncSession
+) -> DepartmentSummaryPage:
+    repository = DepartmentSummaryRepository(session)
+    rows = await repository.get_page(
+        data.cursor, data.limit + 1, data.root_id, data.max_depth
+    )
+    items = [DepartmentSummary(**row) for row in rows[: data.limit]]
+    next_cursor = items[-1].id if len(rows) > data.limit else None
+    return DepartmentSummaryPage(items=items, next_cursor=next_cursor)
+
+
+async def service_get_departments_batch(
+    data: DepartmentBatchData, session: AsyncSession
+) -> DepartmentBatch:
+    loader = BatchDepartmentLoader(data.include_employees, session)
+    departments = await loader.exec(data.ids, data.depth)
+    items = [
+        DepartmentBatchItem(id=id, department=departments[id])
+        if id in departments
+        else DepartmentBatchItem(id=id, error=f"Department with id {id} does not exist")
+        for id in data.ids
+    ]
+    return DepartmentBatch(items=items)
+
+
+async def service_list_departments(
+    data: DepartmentListData, session: AsyncSession
+) -> DepartmentPage:
+    repository = DepartmentRepository(session)
+    # Лишняя запись показывает, есть ли следующая страница
+    rows = await repository.get_filtered_page(
+        data.cursor, data.limit + 1, data.parent_id, data.name_prefix, data.ids_only
+    )
+    items = [DepartmentListItem(**row) for row in rows[: data.limit]]
+    next_cursor = items[-1].id if len(rows) > data.limit else None
+    return DepartmentPage(items=items, next_cursor=next_cursor)
+
+
+async def service_list_employees(
+    data: EmployeeListData, session: AsyncSession
+) -> EmployeePage:
+    department_repository = DepartmentRepository(session)
+    await check_department_exists(data.department_id, department_repository)
+
+    if data.include_subtree:
+        department_ids = department_repository.select_subtree_ids(data.department_id)
+    else:
+        department_ids = [data.department_id]
+
+    repository = EmployeeRepository(session)
+    employees = await repository.get_page_by_departments(
+        department_ids, data.after, data.limit + 1
+    )
+    return paginate_employees(employees, data.limit)
+
+
+async def service_export_organization(
+    session: AsyncSession,
+) -> AsyncGenerator[bytes, None]:
+    """
+    NDJSON: по строке на подразделение, затем по строке на сотрудника. Дерево не строится,
+    поэтому нет ни ограничения по глубине, ни роста памяти с размером организации
+    """
+    repositories = {
+        "department": DepartmentRepository(session),
+        "employee": EmployeeRepository(session),
+    }
+    for entity, repository in repositories.items():
+        async for batch in repository.stream_batches(env.export_batch_size):
+            yield b"".join(to_json({"type": entity, **row}) + b"\n" for row in batch)
+
+
 async def service_change_department(
     id: int, data: DepartmentChange, session: AsyncSession
 ) -> dict | None:
     repository = DepartmentRepository(session)
-    await validate_department_change_data(id, data, repository)
-
-    department = await repository.change(id, data.model_dump())
+    try:
+        changed = await repository.change(id, data.model_dump())
+    except IntegrityError as exc:
+        check_integrity_error(exc)
+    if changed is None:
+        # Разбор причины только на пути ошибки, успешное изменение это один запрос
+        if not await repository.exists(id):
+            raise DepartmentDoesNotExist(f"Department with id {id} does not exist")
+        if not await repository.exists(data.parent_id):
+            raise DepartmentDoesNotExist("Parent department does not exist")
+        raise ValueError("Department can not be a parent to itself")
+    department, old_parent_id = changed
+    if data.name:
+        await audit_log.record("rename", "department", id, name=department.name)
+    if department.parent_id != old_parent_id:
+        await audit_log.record(
+            "move",
+            "department",
+            id,
+            old_parent_id=old_parent_id,
+            parent_id=department.parent_id,
+        )
+    # Пустой PATCH ничего не записал, снимок и отчёты остаются актуальными
+    if data.name or data.parent_id:
+        notify_organization_changed()
     department_dumped = repository.dump(department)
 
     return department_dumped
@@ -165,6 +704,124 @@ async def service_delete_deparment(
         logger.info(f"Casacde delition of a department with ID: {data.id}")
 
     else:  # Всего два метода удаления
-        await check_department_exists(data.reassign_to_department_id, repository)
-        await repository.reassign_delete(data.id, data.reassign_to_department_id)
+        reassign_id = data.reassign_to_department_id
+        await check_department_exists(reassign_id, repository)
+        await check_reassign_target_outside_subtree(data.id, reassign_id, repository)
+        try:
+            await repository.reassign_delete(data.id, reassign_id)
+        except IntegrityError as exc:
+            check_integrity_error(exc)
         logger.info(f"Reassign delete of a deparment with ID: {data.id}")
+
+    await audit_log.record(
+        "delete",
+        "department",
+        data.id,
+        mode=data.mode,
+        reassign_to_department_id=data.reassign_to_department_id,
+    )
+    notify_organization_changed()
+
+
+async def service_restore_department(id: int, session: AsyncSession) -> dict:
+    repository = DepartmentRepository(session)
+    deleted = await repository.get_deleted(id)
+    if deleted is None:
+        raise DepartmentDoesNotExist(f"Deleted department with id {id} does not exist")
+    if deleted.parent_id is not None and not await repository.exists(
+        deleted.parent_id
+    ):
+        raise ValueError("Parent department is deleted, restore it first")
+
+    try:
+        department = await repository.restore(id, deleted.parent_id, deleted.deleted_at)
+    except IntegrityError as exc:
+        check_integrity_error(exc)
+    logger.info(f"Restored department with ID: {id}")
+    await audit_log.record("restore", "department", id)
+    notify_organization_changed()
+    return repository.dump(department)
+
+
+def service_get_job(id: str) -> Job:
+    job = job_registry.get(id)
+    if job is None:
+        raise JobDoesNotExist(f"Job with id {id} does not exist")
+    return job
+
+
+async def service_list_audit_events(
+    data: AuditListData, session: AsyncSession
+) -> AuditPage:
+    """Последние события могут ещё лежать в очереди писателя, см. audit.py"""
+    repository = AuditRepository(session)
+    events = await repository.get_page(
+        data.after,
+        data.limit + 1,
+        since=data.since,
+        until=data.until,
+        entity=data.entity,
+        entity_id=data.entity_id,
+    )
+    items = [AuditEventOut.model_validate(event) for event in events[: data.limit]]
+    if len(events) > data.limit:
+        last = items[-1]
+        cursor = encode_cursor(last.occurred_at.isoformat(), last.id)
+        return AuditPage(items=items, next_cursor=cursor)
+    return AuditPage(items=items)
+
+
+async def service_list_changes(data: ChangeListData, session: AsyncSession) -> ChangeFeed:
+    repository = ChangeRepository(session)
+    changes = await repository.get_since(data.since, data.limit + 1)
+    head = await repository.get_head()
+    changes, has_more = changes[: data.limit], len(changes) > data.limit
+    changed: dict[str, set[int]] = defaultdict(set)
+    for change in changes:
+        changed[change.entity].add(change.entity_id)
+
+    departments = await DepartmentRepository(session).get_rows(
+        Department.id.in_(changed["department"])
+    )
+    employees = await EmployeeRepository(session).get_rows(
+        Employee.id.in_(changed["employee"])
+    )
+    return ChangeFeed(
+        since=data.since,
+        next_since=changes[-1].seq if changes else data.since,
+        has_more=has_more,
+        head=head,
+        departments=[DepartmentListItem.model_validate(dict(row)) for row in departments],
+        employees=[EmployeeOut.model_validate(dict(row)) for row in employees],
+        deleted_department_ids=sorted(
+            changed["department"] - {row.id for row in departments}
+        ),
+        deleted_employee_ids=sorted(changed["employee"] - {row.id for row in employees}),
+    )
+
+
+async def service_stream_changes(
+    data: ChangeListData, session_maker: async_sessionmaker[AsyncSession] | None = None
+) -> AsyncGenerator[str, None]:
+    """
+    Server-Sent Events: событие `changes` с телом как у GET /changes и `id`, равным
+    `next_since`, а при простое комментарий keep-alive раз в `changes_poll_interval_s`
+    """
+    session_maker = session_maker or get_session_maker()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + env.changes_stream_max_s
+    while loop.time() < deadline:
+        changed = change_notifier.subscribe()
+        # Короткая сессия на чтение: поток не держит соединение пула между событиями
+        async with session_maker() as session:
+            feed = await service_list_changes(data, session)
+        if feed.next_since > data.since:
+            yield f"id: {feed.next_since}\nevent: changes\ndata: {feed.model_dump_json()}\n\n"
+            data = ChangeListData(since=feed.next_since, limit=data.limit)
+            if feed.has_more:
+                continue
+        timeout = min(env.changes_poll_interval_s, deadline - loop.time())
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except TimeoutError:
+            yield ": keep-alive\n\n"
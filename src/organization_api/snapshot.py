@@ -0,0 +1,100 @@
+"""
+Предварительно сериализованные ответы GET /departments/{id} с параметрами по умолчанию для
+подразделений верхнего уровня. Версия снимка это голова ленты изменений (data/changes.py)
+на начало сборки, поэтому записи любого процесса его устаревают. Голова читается из БД не
+чаще раза в `head_ttl_s` и сразу после записи этого процесса, а чтения не корней в БД за
+ней не ходят. Записи других процессов видны с задержкой до `head_ttl_s`. Устаревший снимок
+не отдаётся, а перестраивается в фоне после паузы в записях
+"""
+
+import gzip
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from background import Debouncer
+from metrics import Counter
+from data.db_connection import get_session_maker
+from data.repositories import ChangeRepository
+
+snapshot_hits_total = Counter("snapshot_hits_total", "Responses served from snapshot")
+snapshot_misses_total = Counter("snapshot_misses_total", "Snapshot lookups that missed")
+snapshot_builds_total = Counter("snapshot_builds_total", "Finished snapshot rebuilds")
+
+SnapshotBuilder = Callable[[AsyncSession], Awaitable[dict[int, bytes]]]
+
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    version: int
+    body: bytes
+    gzipped: bytes
+
+
+class OrgSnapshot:
+    def __init__(
+        self, builder: SnapshotBuilder, debounce_s: float, head_ttl_s: float
+    ) -> None:
+        self.builder = builder
+        self.head_ttl_s = head_ttl_s
+        # None: основной движок приложения, тесты подставляют свой
+        self.session_maker: async_sessionmaker[AsyncSession] | None = None
+        # Голова ленты изменений, на которой собран снимок, -1 пока его нет
+        self.version = -1
+        self._entries: dict[int, SnapshotEntry] = {}
+        self._debouncer = Debouncer(debounce_s, self.rebuild)
+        # Последняя прочитанная голова ленты и когда, None: читать заново
+        self._head: int | None = None
+        self._head_read_at = 0.0
+
+    async def get(self, id: int, session: AsyncSession) -> SnapshotEntry | None:
+        entry = self._entries.get(id)
+        if entry is None:
+            # Не корень или снимок ещё не собран: обычный путь без запроса головы
+            snapshot_misses_total.inc()
+            if self.version < 0 and not self._debouncer.pending:
+                self._debouncer.trigger()
+            return None
+
+        if await self._get_head(session) != entry.version:
+            snapshot_misses_total.inc()
+            if not self._debouncer.pending:
+                self._debouncer.trigger()
+            return None
+        snapshot_hits_total.inc()
+        return entry
+
+    def invalidate(self) -> None:
+        """Своя запись: голова сдвинулась, пересборка без ожидания промаха"""
+        self._head = None
+        self._debouncer.trigger()
+
+    async def _get_head(self, session: AsyncSession) -> int:
+        now = time.monotonic()
+        if self._head is None or now - self._head_read_at >= self.head_ttl_s:
+            self._head = await ChangeRepository(session).get_head()
+            self._head_read_at = now
+        return self._head
+
+    async def rebuild(self) -> None:
+        session_maker = self.session_maker or get_session_maker()
+        async with session_maker() as session:
+            # Голова до данных: запись во время сборки оставит снимок устаревшим, и
+            # следующее чтение его пересоберёт
+            version = await ChangeRepository(session).get_head()
+            bodies = await self.builder(session)
+
+        self._entries = {
+            id: SnapshotEntry(version, body, gzip.compress(body))
+            for id, body in bodies.items()
+        }
+        self.version = version
+        snapshot_builds_total.inc()
+
+    def reset(self) -> None:
+        self._debouncer.cancel()
+        self._entries = {}
+        self.version = -1
+        self._head = None
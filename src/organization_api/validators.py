@@ -1,13 +1,29 @@
+from datetime import datetime
+from typing import NoReturn
+
 from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 
-from exceptions import DepartmentDoesNotExist, raise_unprocessable_content
+from exceptions import (
+    DepartmentDoesNotExist,
+    raise_unprocessable_content,
+    get_constraint_name,
+)
 from models import (
-    DepartmentIn,
-    DepartmentChange,
+    AuditListData,
+    ChangeListData,
     DepartmentGetData,
+    DepartmentBatchData,
+    DepartmentListData,
+    DepartmentStatsData,
+    DepartmentSummaryData,
     DepartmentDeleteData,
+    EmployeeListData,
+    FieldSelection,
 )
+from pagination import decode_cursor
 from data.repositories import DepartmentRepository
+from data.org_graph import OrgGraph, org_graph
 
 
 def validate_department_delete_query_data(
@@ -24,72 +40,170 @@ def validate_department_delete_query_data(
 
 
 def validate_department_get_query_data(
-    id: int, depth: int, include_employees: bool
+    id: int,
+    depth: int,
+    include_employees: bool,
+    max_employees: int | None = None,
+    fields: str | None = None,
 ) -> DepartmentGetData:
     try:
         data = DepartmentGetData(
-            id=id, depth=depth, include_employees=include_employees
+            id=id,
+            depth=depth,
+            include_employees=include_employees,
+            max_employees=max_employees,
+            fields=FieldSelection.parse(fields) if fields else None,
         )
-    except ValidationError:
+    except ValueError:
         raise_unprocessable_content()
     else:
         return data
 
 
-async def validate_department_change_data(
-    id: int, data: DepartmentChange, repository: DepartmentRepository
-) -> None:
-    await check_department_exists(id, repository)
-    if data.parent_id:
-        await check_department_exists(data.parent_id, repository)
-        check_ids_are_eq(id, data.parent_id)
-        await check_new_parent_id_belongs_to_a_child(id, data.parent_id, repository)
+def validate_department_batch_query_data(
+    ids: str, depth: int, include_employees: bool
+) -> DepartmentBatchData:
+    try:
+        data = DepartmentBatchData(
+            ids=[int(id) for id in ids.split(",")],
+            depth=depth,
+            include_employees=include_employees,
+        )
+    except ValueError:
+        raise_unprocessable_content()
+    else:
+        return data
 
 
-async def check_department_exists(id: int, repository: DepartmentRepository) -> None:
-    department = await repository.get(id)
-    if not department:
-        raise DepartmentDoesNotExist(f"Department with id {id} does not exist")
+def validate_department_list_query_data(
+    cursor: int | None,
+    limit: int,
+    parent_id: int | None,
+    name_prefix: str | None,
+    ids_only: bool,
+) -> DepartmentListData:
+    try:
+        data = DepartmentListData(
+            cursor=cursor,
+            limit=limit,
+            parent_id=parent_id,
+            name_prefix=name_prefix,
+            ids_only=ids_only,
+        )
+    except ValidationError:
+        raise_unprocessable_content()
+    else:
+        return data
 
 
-async def check_new_parent_id_belongs_to_a_child(
-    id: int, new_parent_id: int, repository: DepartmentRepository
-) -> None:
-    department = await repository.get_with_children(id)
+def validate_department_stats_query_data(id: int, depth: int) -> DepartmentStatsData:
+    try:
+        data = DepartmentStatsData(id=id, depth=depth)
+    except ValidationError:
+        raise_unprocessable_content()
+    else:
+        return data
+
 
-    for child in department.children:
-        if new_parent_id == child.id:
-            raise ValueError("Department can not be a parent to itself")
-        await check_new_parent_id_belongs_to_a_child(
-            child.id, new_parent_id, repository
+def validate_department_summary_query_data(
+    cursor: int | None, limit: int, root_id: int | None, max_depth: int | None
+) -> DepartmentSummaryData:
+    try:
+        data = DepartmentSummaryData(
+            cursor=cursor, limit=limit, root_id=root_id, max_depth=max_depth
         )
+    except ValidationError:
+        raise_unprocessable_content()
+    else:
+        return data
 
 
-async def validate_department_creation_data(
-    repository: DepartmentRepository, data: DepartmentIn
-) -> None:
-    if data.parent_id:
-        await check_parent_id_eq_new_department_id(repository, data)
-        await check_department_name_is_unique(repository, data)
+def validate_audit_list_query_data(
+    since: datetime | None,
+    until: datetime | None,
+    cursor: str | None,
+    limit: int,
+    entity: str | None,
+    entity_id: int | None,
+) -> AuditListData:
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        data = AuditListData(
+            since=since,
+            until=until,
+            after=after,
+            limit=limit,
+            entity=entity,
+            entity_id=entity_id,
+        )
+    except ValueError:  # ValidationError тоже наследует ValueError
+        raise_unprocessable_content()
+    else:
+        return data
 
 
-async def check_department_name_is_unique(
-    repository: DepartmentRepository, data: DepartmentIn
-) -> None:
-    parent_department = await repository.get_with_children(data.parent_id)
-    if data.name in (dep.name for dep in parent_department.children):
-        raise ValueError(
-            "Department-child name should be unique for a single department-parent"
+def validate_change_list_query_data(since: int, limit: int) -> ChangeListData:
+    try:
+        data = ChangeListData(since=since, limit=limit)
+    except ValueError:
+        raise_unprocessable_content()
+    else:
+        return data
+
+
+def validate_employee_list_query_data(
+    id: int, cursor: str | None, limit: int, include_subtree: bool
+) -> EmployeeListData:
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        data = EmployeeListData(
+            department_id=id, after=after, limit=limit, include_subtree=include_subtree
         )
+    except ValueError:  # ValidationError тоже наследует ValueError
+        raise_unprocessable_content()
+    else:
+        return data
+
+
+async def check_department_exists(
+    id: int, repository: DepartmentRepository
+) -> OrgGraph:
+    """Возвращает индекс, чтобы вызывающий не догонял ленту изменений второй раз"""
+    graph = await org_graph.get(repository.session)
+    # Промах перепроверяется в БД: подразделение могло появиться после чтения ленты
+    if not graph.contains(id) and not await repository.exists(id):
+        raise DepartmentDoesNotExist(f"Department with id {id} does not exist")
+    return graph
 
 
-async def check_parent_id_eq_new_department_id(
-    repository: DepartmentRepository, data: DepartmentIn
+async def check_reassign_target_outside_subtree(
+    id: int, reassign_id: int, repository: DepartmentRepository
 ) -> None:
-    new_department_id = await repository._get_new_department_id()
-    check_ids_are_eq(new_department_id, data.parent_id)
+    """Перенос детей в удаляемое поддерево оторвал бы его от дерева или замкнул цикл"""
+    ancestors = await repository.get_ancestors(reassign_id)
+    if any(row["id"] == id for row in ancestors):
+        raise ValueError(
+            "Cannot reassign to the deleted department or one of its descendants"
+        )
 
 
-def check_ids_are_eq(first: int, second: int) -> None:
-    if first == second:
-        raise ValueError("Department cannot be a parent to itself")
+CONSTRAINT_VIOLATION_MESSAGES = {
+    "uq_departments_parent_id_name": (
+        "Department-child name should be unique for a single department-parent"
+    ),
+    "parent_id_not_self_check": "Department cannot be a parent to itself",
+}
+
+
+def check_integrity_error(exc: IntegrityError) -> NoReturn:
+    """
+    Уникальность имени и запрет ссылаться на самого себя проверяются ограничениями в БД,
+    а не чтением перед записью. Здесь нарушения ограничений переводятся в исключения,
+    которые `web` уже умеет превращать в ответы
+    """
+    constraint = get_constraint_name(exc)
+    if constraint in CONSTRAINT_VIOLATION_MESSAGES:
+        raise ValueError(CONSTRAINT_VIOLATION_MESSAGES[constraint]) from exc
+    if constraint == "departments_parent_id_fkey":
+        raise DepartmentDoesNotExist("Parent department does not exist") from exc
+    raise exc
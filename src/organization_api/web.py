@@ -1,30 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import ValidationError
+from datetime import datetime
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic_core import to_json
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from exceptions import DepartmentDoesNotExist
+from admission import admission_controller
+from exceptions import DepartmentDoesNotExist, AdmissionRejected, JobDoesNotExist
+from metrics import render_metrics
 from models import (
+    AuditPage,
+    ChangeFeed,
     DepartmentIn,
     DepartmentOut,
+    DepartmentAncestor,
+    DepartmentBatch,
+    DepartmentStats,
+    DepartmentSummaryPage,
     DepartmentChange,
     EmployeeIn,
     EmployeeOut,
+    DepartmentPage,
+    EmployeePage,
+    JobOut,
 )
 from validators import (
+    validate_audit_list_query_data,
+    validate_change_list_query_data,
     validate_department_get_query_data,
+    validate_department_batch_query_data,
+    validate_department_list_query_data,
+    validate_department_stats_query_data,
+    validate_department_summary_query_data,
+    validate_employee_list_query_data,
     validate_department_delete_query_data,
 )
 from services import (
     service_create_department,
     service_create_employee,
     service_get_department,
+    service_get_department_snapshot,
+    service_get_ancestors,
+    service_get_departments_batch,
+    service_get_department_stats,
+    service_get_department_summary,
+    service_estimate_department_cost,
+    service_list_departments,
+    service_list_employees,
+    service_export_organization,
     service_change_department,
     service_delete_deparment,
+    service_restore_department,
+    service_get_job,
+    service_list_audit_events,
+    service_list_changes,
+    service_stream_changes,
 )
-from data.sql_models import Department, Employee
+from snapshot import SnapshotEntry
+from data.sql_models import Department, Employee, DefaultField
 from data.db_connection import get_async_session
 
 router = APIRouter(prefix="/departments")
+metrics_router = APIRouter()
+export_router = APIRouter(prefix="/export")
+reports_router = APIRouter(prefix="/reports")
+jobs_router = APIRouter(prefix="/jobs")
+audit_router = APIRouter(prefix="/audit")
+changes_router = APIRouter(prefix="/changes")
 
 
 @router.post(
@@ -41,6 +91,9 @@ async def create_department(
     except ValueError as exc:
         msg = str(exc)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=msg)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
     else:
         return department
 
@@ -60,23 +113,149 @@ async def create_employee(
         return employee
 
 
+@router.get("/{id}/employees/", name="list_employees", status_code=status.HTTP_200_OK)
+async def list_employees(
+    id: int,
+    cursor: str | None = None,
+    limit: int = DefaultField.DEFAULT_PAGE_SIZE,
+    include_subtree: bool = False,
+    session: AsyncSession = Depends(get_async_session),
+) -> EmployeePage:
+    data = validate_employee_list_query_data(id, cursor, limit, include_subtree)
+    try:
+        page = await service_list_employees(data, session)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    else:
+        return page
+
+
+@router.get("/{id}/ancestors", name="get_ancestors", status_code=status.HTTP_200_OK)
+async def get_ancestors(
+    id: int, session: AsyncSession = Depends(get_async_session)
+) -> list[DepartmentAncestor]:
+    try:
+        ancestors = await service_get_ancestors(id, session)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    else:
+        return ancestors
+
+
+@router.get("/{id}/stats", name="get_department_stats", status_code=status.HTTP_200_OK)
+async def get_department_stats(
+    id: int,
+    depth: int = DefaultField.DEFAULT_DEPTH,
+    session: AsyncSession = Depends(get_async_session),
+) -> list[DepartmentStats]:
+    data = validate_department_stats_query_data(id, depth)
+    try:
+        stats = await service_get_department_stats(data, session)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    else:
+        return stats
+
+
+@router.get(
+    "/",
+    name="list_departments",
+    status_code=status.HTTP_200_OK,
+    response_model_exclude_unset=True,
+)
+async def list_departments(
+    cursor: int | None = None,
+    limit: int = DefaultField.DEFAULT_PAGE_SIZE,
+    parent_id: int | None = None,
+    name_prefix: str | None = None,
+    ids_only: bool = False,
+    session: AsyncSession = Depends(get_async_session),
+) -> DepartmentPage:
+    data = validate_department_list_query_data(
+        cursor, limit, parent_id, name_prefix, ids_only
+    )
+    return await service_list_departments(data, session)
+
+
+# Объявлен до /{id}, иначе "batch" будет принят за ID
+@router.get("/batch", name="get_departments_batch", status_code=status.HTTP_200_OK)
+async def get_departments_batch(
+    ids: str,
+    depth: int = DefaultField.DEFAULT_DEPTH,
+    include_employees: bool = True,
+    session: AsyncSession = Depends(get_async_session),
+) -> DepartmentBatch:
+    data = validate_department_batch_query_data(ids, depth, include_employees)
+    return await service_get_departments_batch(data, session)
+
+
 @router.get("/{id}", name="get_department", status_code=status.HTTP_200_OK)
 async def get_department(
     id: int,
-    depth: int = 1,
+    request: Request,
+    depth: int = DefaultField.DEFAULT_DEPTH,
     include_employees: bool = True,
+    max_employees: int | None = None,
+    fields: str | None = None,
     session: AsyncSession = Depends(get_async_session),
 ) -> DepartmentOut:
-    data = validate_department_get_query_data(id, depth, include_employees)
+    data = validate_department_get_query_data(
+        id, depth, include_employees, max_employees, fields
+    )
+
+    snapshot = await service_get_department_snapshot(data, session)
+    if snapshot:
+        return snapshot_response(snapshot, request.headers.get("accept-encoding", ""))
+
     try:
-        department = await service_get_department(data, session)
+        cost = await service_estimate_department_cost(data, session)
+        async with admission_controller.admit(cost):
+            department = await service_get_department(data, session)
     except DepartmentDoesNotExist as exc:
         msg = str(exc)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    except AdmissionRejected as exc:
+        msg = str(exc)
+        headers = {"Retry-After": str(exc.retry_after)}
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=msg, headers=headers
+        )
     else:
+        if data.fields:
+            # Частичный ответ не проходит валидацию DepartmentOut, отдаём его как есть
+            return Response(to_json(department), media_type="application/json")
         return department
 
 
+def snapshot_response(entry: SnapshotEntry, accept_encoding: str) -> Response:
+    """Готовые байты из снимка отдаются без обращения к БД и без Pydantic"""
+    headers = {"ETag": f'"{entry.version}"', "Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzipped, media_type="application/json", headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """`gzip;q=0` запрещает сжатие, `*` разрешает всё, что не перечислено явно"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
 @router.patch("/{id}", name="change_department", status_code=status.HTTP_200_OK)
 async def change_department(
     id: int, data: DepartmentChange, session: AsyncSession = Depends(get_async_session)
@@ -105,8 +284,140 @@ async def delete_department(
     data = validate_department_delete_query_data(id, mode, reassign_to_department_id)
     try:
         await service_delete_deparment(data, session)
-    except ValidationError as exc:
+    except ValueError as exc:
         msg = str(exc)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=msg)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
     else:
         return
+
+
+@router.post(
+    "/{id}/restore", name="restore_department", status_code=status.HTTP_200_OK
+)
+async def restore_department(
+    id: int, session: AsyncSession = Depends(get_async_session)
+) -> DepartmentOut:
+    """Отмена каскадного удаления, пока удалённое не очищено"""
+    try:
+        department = await service_restore_department(id, session)
+    except ValueError as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=msg)
+    except DepartmentDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    else:
+        return department
+
+
+@jobs_router.get("/{id}", name="get_job", status_code=status.HTTP_200_OK)
+async def get_job(id: str) -> JobOut:
+    try:
+        job = service_get_job(id)
+    except JobDoesNotExist as exc:
+        msg = str(exc)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=msg)
+    else:
+        return job
+
+
+@metrics_router.get(
+    "/metrics",
+    name="metrics",
+    status_code=status.HTTP_200_OK,
+    response_class=PlainTextResponse,
+)
+async def metrics() -> str:
+    return render_metrics()
+
+
+@metrics_router.get("/ready", name="ready", status_code=status.HTTP_200_OK)
+async def ready(request: Request) -> dict[str, str]:
+    """Готовность для балансировщика: 503, пока идёт прогрев, запущенный в lifespan"""
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Warming up"
+        )
+    return {"status": "ready"}
+
+
+@export_router.get(
+    "/organization",
+    name="export_organization",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def export_organization(
+    session: AsyncSession = Depends(get_async_session),
+) -> StreamingResponse:
+    return StreamingResponse(
+        service_export_organization(session), media_type="application/x-ndjson"
+    )
+
+
+@reports_router.get(
+    "/department-summary",
+    name="department_summary",
+    status_code=status.HTTP_200_OK,
+)
+async def department_summary(
+    cursor: int | None = None,
+    limit: int = DefaultField.DEFAULT_PAGE_SIZE,
+    root_id: int | None = None,
+    max_depth: int | None = None,
+    session: AsyncSession = Depends(get_async_session),
+) -> DepartmentSummaryPage:
+    """Данные материализованного представления, могут отставать от записей на время обновления"""
+    data = validate_department_summary_query_data(cursor, limit, root_id, max_depth)
+    return await service_get_department_summary(data, session)
+
+
+@audit_router.get("/events", name="list_audit_events", status_code=status.HTTP_200_OK)
+async def list_audit_events(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = DefaultField.DEFAULT_PAGE_SIZE,
+    entity: str | None = None,
+    entity_id: int | None = None,
+    session: AsyncSession = Depends(get_async_session),
+) -> AuditPage:
+    """События по возрастанию времени в интервале `[since, until)`"""
+    data = validate_audit_list_query_data(
+        since, until, cursor, limit, entity, entity_id
+    )
+    return await service_list_audit_events(data, session)
+
+
+@changes_router.get("", name="list_changes", status_code=status.HTTP_200_OK)
+async def list_changes(
+    since: int = 0,
+    limit: int = DefaultField.MAX_PAGE_SIZE,
+    session: AsyncSession = Depends(get_async_session),
+) -> ChangeFeed:
+    """Изменения после номера `since`, зеркало продолжает с `next_since`"""
+    data = validate_change_list_query_data(since, limit)
+    return await service_list_changes(data, session)
+
+
+@changes_router.get(
+    "/stream",
+    name="stream_changes",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def stream_changes(
+    since: int = 0,
+    last_event_id: int | None = Header(None),
+) -> StreamingResponse:
+    """SSE-вариант ленты, при переподключении курсор берётся из Last-Event-ID"""
+    since = last_event_id if last_event_id is not None else since
+    data = validate_change_list_query_data(since, DefaultField.MAX_PAGE_SIZE)
+    return StreamingResponse(
+        service_stream_changes(data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
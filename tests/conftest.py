@@ -15,9 +15,15 @@ from sqlalchemy.ext.asyncio import (
 
 from main import app
 from config import env
+from audit import audit_log
+from idempotency import idempotency_store
+from jobs import job_registry
+from services import change_notifier, org_snapshot, purge_worker, summary_refresher
 from data.seed_db import FIXTURE_DIR, read_fixture, check_date_fields
 from data.repositories import DepartmentRepository, EmployeeRepository
 from data.sql_models import Base, Department, Employee
+from data.summary import CREATE_VIEW, DROP_VIEW
+from data.org_graph import org_graph
 from data.db_connection import get_async_session
 
 FixtureContent: TypeAlias = list[dict[str, str | int | None]]
@@ -40,11 +46,19 @@ async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 @pytest_asyncio.fixture
 async def create_tables() -> AsyncGenerator:
     await run_sync(engine, Base.metadata.create_all)
+    await execute(engine, *CREATE_VIEW)
     yield
+    await execute(engine, DROP_VIEW)
     await run_sync(engine, Base.metadata.drop_all)
     await engine.dispose()
 
 
+async def execute(engine: AsyncEngine, *statements) -> None:
+    async with engine.begin() as connection:
+        for statement in statements:
+            await connection.execute(statement)
+
+
 async def run_sync(engine: AsyncEngine, cmd: Callable) -> None:
     async with engine.begin() as connection:
         await connection.run_sync(cmd)
@@ -66,6 +80,57 @@ def override_session(session):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(autouse=True)
+def reset_snapshot():
+    # БД пересоздаётся для каждого теста, поэтому и снимок тоже
+    org_snapshot.session_maker = async_session_maker
+    yield
+    org_snapshot.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_org_graph():
+    # Индекс загружается из БД при первом запросе теста
+    org_graph.reset()
+    yield
+    org_graph.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_jobs():
+    purge_worker.session_maker = async_session_maker
+    yield
+    job_registry.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_audit_log():
+    audit_log.session_maker = async_session_maker
+    yield
+    audit_log.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_summary_refresher():
+    summary_refresher.session_maker = async_session_maker
+    yield
+    summary_refresher.cancel()
+
+
+@pytest.fixture(autouse=True)
+def reset_idempotency_store():
+    idempotency_store.session_maker = async_session_maker
+    yield
+    idempotency_store.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_change_notifier():
+    yield
+    # Событие привязывается к циклу теста, следующий тест ждёт уже новое
+    change_notifier.notify()
+
+
 @pytest_asyncio.fixture
 async def client():
     transport = ASGITransport(app=app)
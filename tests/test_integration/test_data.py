@@ -1,9 +1,22 @@
+import asyncio
+
 import pytest
+from sqlalchemy import Connection, event, inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from audit import audit_events_written_total, audit_log
+from data import counters
 from data.seed_db import FIXTURE_DIR, read_fixture, seed_db, check_date_fields
-from data.repositories import BaseRepository, DepartmentRepository, EmployeeRepository
-from data.sql_models import Department
+from data.repositories import (
+    AuditRepository,
+    BaseRepository,
+    DepartmentRepository,
+    EmployeeRepository,
+)
+from data.sql_models import Department, Employee
+from data.db_connection import statement_timeout_ms
+from tests.conftest import async_session_maker
 
 
 @pytest.mark.asyncio
@@ -32,3 +45,192 @@ async def test_seed_db(session: AsyncSession) -> None:
 
     assert len(departments) == len(departments_data)
     assert len(employees) == len(employees_data)
+    assert not await counters.verify(session)
+
+
+@pytest.mark.asyncio
+async def test_foreign_keys_are_indexed(session: AsyncSession) -> None:
+    connection = await session.connection()
+    indexes = await connection.run_sync(get_index_columns)
+
+    assert ["parent_id"] in indexes["departments"]
+    assert ["parent_id", "name"] in indexes["departments"]
+    assert ["department_id", "full_name"] in indexes["employees"]
+
+
+def get_index_columns(connection: Connection) -> dict[str, list[list[str]]]:
+    inspector = inspect(connection)
+    return {
+        table: [index["column_names"] for index in inspector.get_indexes(table)]
+        for table in ("departments", "employees")
+    }
+
+
+@pytest.mark.asyncio
+async def test_concurrent_creation_keeps_sibling_names_unique(
+    session: AsyncSession,
+) -> None:
+    parent = await DepartmentRepository(session).create({"name": "parent"})
+    data = {"name": "child", "parent_id": parent.id}
+
+    results = await asyncio.gather(
+        *(create_in_new_session(data) for _ in range(5)), return_exceptions=True
+    )
+
+    assert sum(isinstance(result, Department) for result in results) == 1
+    assert all(
+        isinstance(result, (Department, IntegrityError)) for result in results
+    )
+
+
+async def create_in_new_session(data: dict) -> Department:
+    async with async_session_maker() as session:
+        return await DepartmentRepository(session).create(data)
+
+
+@pytest.mark.asyncio
+async def test_count_subtree(
+    department_repository: DepartmentRepository,
+    created_departments: list[Department],
+) -> None:
+    departments, employees = await department_repository.count_subtree(1, 2)
+    assert departments == 3  # Corporate -> Operations -> Logistics
+    assert employees == 0
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_is_set_for_each_transaction(
+    session: AsyncSession,
+) -> None:
+    token = statement_timeout_ms.set(1500)
+    try:
+        await session.commit()
+        result = await session.execute(text("SHOW statement_timeout"))
+    finally:
+        statement_timeout_ms.reset(token)
+    assert result.scalar_one() == "1500ms"
+
+
+@pytest.mark.asyncio
+async def test_counters_are_maintained_by_repositories(
+    session: AsyncSession,
+    department_repository: DepartmentRepository,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    assert not await counters.verify(session)
+    root = await department_repository.get(1)
+    assert (root.direct_employee_count, root.subtree_employee_count) == (3, 15)
+    assert root.subtree_department_count == 4
+
+    await department_repository.change(7, {"parent_id": 3})  # Engineering -> Logistics
+    assert not await counters.verify(session)
+
+    await department_repository.reassign_delete(3, 2)
+    assert not await counters.verify(session)
+
+    await department_repository.cascade_delete(4)
+    assert not await counters.verify(session)
+
+    session.expunge_all()
+    root = await department_repository.get(1)
+    # +Engineering (3 подразделения, 9 сотрудников), -Logistics, -Procurement с потомком
+    assert root.subtree_employee_count == 15 + 9 - 6
+    assert root.subtree_department_count == 4 + 3 - 1 - 2
+
+
+@pytest.mark.asyncio
+async def test_counters_rebuild_fixes_drift(
+    session: AsyncSession, created_departments: list[Department]
+) -> None:
+    await session.execute(text("UPDATE departments SET subtree_department_count = 0"))
+    await session.commit()
+    assert len(await counters.verify(session)) == 6  # Все, у кого есть потомки
+
+    await counters.rebuild(session)
+    assert not await counters.verify(session)
+
+
+@pytest.mark.asyncio
+async def test_change_is_a_single_update_statement(
+    session: AsyncSession,
+    department_repository: DepartmentRepository,
+    created_departments: list[Department],
+) -> None:
+    statements = []
+    bind = session.bind.sync_engine
+
+    def collect(connection, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", collect)
+    try:
+        department, old_parent_id = await department_repository.change(
+            7, {"name": "R&D"}
+        )
+    finally:
+        event.remove(bind, "before_cursor_execute", collect)
+
+    assert department.name == "R&D"
+    assert old_parent_id == 6
+    # Без предварительного чтения, после UPDATE только запись в ленту изменений
+    assert len(statements) == 3
+    assert statements[0].startswith("UPDATE departments")
+    assert statements[-1].startswith("INSERT INTO changes")
+
+    # Перенос в собственное поддерево и несуществующее подразделение не меняют ничего
+    assert await department_repository.change(7, {"parent_id": 8}) is None
+    assert await department_repository.change(100, {"name": "Ghost"}) is None
+    assert (await department_repository.get(7)).parent_id == 6
+    _, old_parent_id = await department_repository.change(7, {"parent_id": 1})
+    assert old_parent_id == 6
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_batches_and_flushes_on_close(
+    session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(audit_log, "batch_size", 2)
+    monkeypatch.setattr(audit_log, "flush_interval_s", 60)
+    written = audit_events_written_total.get()
+
+    audit_log.start()
+    for id in range(5):
+        await audit_log.record("create", "department", id)
+    while audit_events_written_total.get() < written + 4:
+        await asyncio.sleep(0.01)
+    # Пятое событие ждёт пакета, пока его не допишет остановка
+    assert audit_log.pending == 0
+    await audit_log.close()
+
+    events = await AuditRepository(session).get_page(None, 10)
+    assert [event.entity_id for event in events] == list(range(5))
+    assert audit_events_written_total.get() == written + 5
+
+
+@pytest.mark.asyncio
+async def test_delete_reads_only_parent_id(
+    session: AsyncSession,
+    department_repository: DepartmentRepository,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    statements = []
+    bind = session.bind.sync_engine
+
+    def collect(connection, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", collect)
+    try:
+        await department_repository.cascade_delete(2)
+        await department_repository.reassign_delete(7, 6)
+    finally:
+        event.remove(bind, "before_cursor_execute", collect)
+
+    # Из удаляемого подразделения читается только parent_id, без детей и сотрудников
+    reads = [statement for statement in statements if statement.startswith("SELECT")]
+    assert [read for read in reads if "FROM" in read] == [
+        read for read in reads if read.startswith("SELECT departments.parent_id \n")
+    ]
+    assert len(reads) == 4  # parent_id и pg_advisory_xact_lock на каждое удаление
@@ -1,10 +1,20 @@
+import asyncio
+import json
+
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from services import RecursiveDepartmentLoader
+from config import env
+from models import ChangeListData, DepartmentChange
+from services import (
+    RecursiveDepartmentLoader,
+    service_change_department,
+    service_stream_changes,
+)
 from data.seed_db import check_date_fields
 from data.repositories import DepartmentRepository, EmployeeRepository
-from tests.conftest import FixtureContent
+from data.sql_models import DefaultField, Department
+from tests.conftest import FixtureContent, async_session_maker
 
 
 @pytest.mark.asyncio
@@ -24,3 +34,29 @@ async def test_recursive_department_loader(
     department = await RecursiveDepartmentLoader(True, session).exec(1, 3)
 
     assert department
+
+
+@pytest.mark.asyncio
+async def test_change_stream_wakes_up_on_write(
+    monkeypatch: pytest.MonkeyPatch,
+    session: AsyncSession,
+    created_departments: list[Department],
+) -> None:
+    # Опрос не сработает за время теста, будит только запись
+    monkeypatch.setattr(env, "changes_poll_interval_s", 60)
+    head = len(created_departments)
+    data = ChangeListData(since=head - 1, limit=DefaultField.MAX_PAGE_SIZE)
+    stream = service_stream_changes(data, async_session_maker)
+
+    event = await anext(stream)
+    assert event.startswith(f"id: {head}\nevent: changes\n")
+
+    waiting = asyncio.create_task(anext(stream))
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+    await service_change_department(8, DepartmentChange(name="QA"), session)
+    event = await asyncio.wait_for(waiting, 5)
+    assert event.startswith(f"id: {head + 1}\n")
+    feed = json.loads(event.split("data: ", 1)[1])
+    assert [item["name"] for item in feed["departments"]] == ["QA"]
+    await stream.aclose()
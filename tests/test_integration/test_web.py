@@ -1,14 +1,41 @@
+import asyncio
+import hashlib
+import json
+from datetime import UTC, datetime, timedelta
+
 import pytest
 from loguru import logger
 from fastapi import status
 from httpx import AsyncClient
+from sqlalchemy import func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import web
+import lifespan
 from main import app
+from audit import audit_log
+from idempotency import idempotency_store
+from jobs import job_registry
+from services import (
+    org_snapshot,
+    purge_worker,
+    summary_refresher,
+    RecursiveDepartmentLoader,
+)
+from config import env
+from middleware import RequestBudgetMiddleware, timeouts_total, disconnects_total
+from models import DepartmentIn
+from data import counters
 from data.seed_db import check_date_fields
-from data.repositories import DepartmentRepository, EmployeeRepository
-from data.sql_models import Department
-from tests.conftest import FixtureContent
+from data.repositories import (
+    ChangeRepository,
+    DepartmentRepository,
+    EmployeeRepository,
+    IdempotencyKeyRepository,
+)
+from data.org_graph import org_graph
+from data.sql_models import Department, Employee
+from tests.conftest import FixtureContent, async_session_maker
 
 
 @pytest.mark.asyncio
@@ -46,6 +73,26 @@ async def test_create_department_returns_400_if_parent_id_eq_new_department_id(
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
+@pytest.mark.asyncio
+async def test_create_department_allows_duplicate_root_names(
+    client: AsyncClient,
+) -> None:
+    data = {"name": "test_department"}
+    first = await client.post(app.url_path_for("create_department"), json=data)
+    second = await client.post(app.url_path_for("create_department"), json=data)
+    assert first.status_code == second.status_code == status.HTTP_201_CREATED
+    assert first.json()["id"] != second.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_create_department_returns_404_if_parent_does_not_exist(
+    client: AsyncClient,
+) -> None:
+    data = {"name": "test_department", "parent_id": 100}
+    response = await client.post(app.url_path_for("create_department"), json=data)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 @pytest.mark.parametrize("departments_data", [1], indirect=True)
 @pytest.mark.asyncio
 async def test_create_employee(
@@ -81,6 +128,34 @@ async def test_create_employee_returns_404_for_non_existent_department(
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
+@pytest.mark.asyncio
+async def test_list_departments_paginates_by_cursor(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    ids = []
+    params = {"limit": 4}
+    while True:
+        response = await client.get(app.url_path_for("list_departments"), params=params)
+        assert response.status_code == status.HTTP_200_OK
+        content = response.json()
+        ids.extend(item["id"] for item in content["items"])
+        if content["next_cursor"] is None:
+            break
+        params["cursor"] = content["next_cursor"]
+
+    assert ids == [department.id for department in created_departments]
+
+
+@pytest.mark.asyncio
+async def test_list_departments_filters_and_returns_only_ids(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    params = {"parent_id": 7, "name_prefix": "Plat", "ids_only": True}
+    response = await client.get(app.url_path_for("list_departments"), params=params)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"items": [{"id": 8}], "next_cursor": None}
+
+
 @pytest.mark.asyncio
 async def test_get_department(
     client: AsyncClient,
@@ -103,6 +178,335 @@ async def test_get_department(
     assert content
 
 
+@pytest.mark.parametrize("departments_data", [1], indirect=True)
+@pytest.mark.asyncio
+async def test_get_department_is_counted_by_admission_metrics(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    await client.get(app.url_path_for("get_department", id=1))
+
+    response = await client.get(app.url_path_for("metrics"))
+    assert response.status_code == status.HTTP_200_OK
+    assert "admission_admitted_total" in response.text
+    assert "admission_shed_total" in response.text
+
+
+@pytest.mark.asyncio
+async def test_get_department_returns_504_when_budget_is_exceeded(
+    client: AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def slow_service(*args) -> None:
+        await asyncio.sleep(1)
+
+    monkeypatch.setitem(env.route_timeouts_s, "get_department", 0.01)
+    monkeypatch.setattr(web, "service_get_department", slow_service)
+    timed_out = timeouts_total.get(route="get_department", reason="budget")
+
+    response = await client.get(app.url_path_for("get_department", id=1))
+
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    assert timeouts_total.get(route="get_department", reason="budget") == timed_out + 1
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_request() -> None:
+    cancelled = asyncio.Event()
+
+    async def slow_app(scope, receive, send) -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def receive() -> dict:
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None: ...
+
+    scope = {"type": "http", "app": app, "method": "GET", "path": "/departments/1"}
+    disconnected = disconnects_total.get(route="get_department")
+
+    await asyncio.wait_for(RequestBudgetMiddleware(slow_app)(scope, receive, send), 1)
+
+    assert cancelled.is_set()
+    assert disconnects_total.get(route="get_department") == disconnected + 1
+
+
+@pytest.mark.asyncio
+async def test_list_employees_paginates_subtree_by_full_name(
+    client: AsyncClient,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    names = []
+    params = {"limit": 2, "include_subtree": True}
+    while True:
+        response = await client.get(
+            app.url_path_for("list_employees", id=1), params=params
+        )
+        assert response.status_code == status.HTTP_200_OK
+        content = response.json()
+        names.extend(item["full_name"] for item in content["items"])
+        if content["next_cursor"] is None:
+            break
+        params["cursor"] = content["next_cursor"]
+
+    expected = [
+        employee.full_name
+        for employee in created_employees
+        if employee.department_id in range(1, 6)
+    ]
+    assert names == sorted(expected)
+
+
+@pytest.mark.asyncio
+async def test_list_employees_returns_422_for_invalid_cursor(
+    client: AsyncClient,
+) -> None:
+    params = {"cursor": "invalid"}
+    response = await client.get(app.url_path_for("list_employees", id=1), params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+@pytest.mark.asyncio
+async def test_get_department_caps_employees_per_node(
+    client: AsyncClient,
+    session: AsyncSession,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    session.expunge_all()  # Коллекции children у созданных фикстурами объектов устарели
+    params = {"depth": 2, "max_employees": 1}
+    response = await client.get(app.url_path_for("get_department", id=1), params=params)
+    assert response.status_code == status.HTTP_200_OK
+
+    content = response.json()
+    assert len(content["employees"]) == 1
+    assert content["employees_next_cursor"]
+    assert len(content["children"][0]["employees"]) <= 1
+
+    params = {"cursor": content["employees_next_cursor"]}
+    response = await client.get(app.url_path_for("list_employees", id=1), params=params)
+    rest = [item["full_name"] for item in response.json()["items"]]
+    assert content["employees"][0]["full_name"] not in rest
+
+    params = {"depth": 2, "include_employees": False, "max_employees": 1}
+    response = await client.get(app.url_path_for("get_department", id=1), params=params)
+    content = response.json()
+    assert content["employees"] == []
+    assert content["employees_next_cursor"] is None
+    assert content["children"][0]["employees"] == []
+
+
+@pytest.mark.asyncio
+async def test_get_department_is_served_from_snapshot(
+    client: AsyncClient,
+    session: AsyncSession,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    session.expunge_all()
+    await org_snapshot.rebuild()
+
+    response = await client.get(
+        app.url_path_for("get_department", id=1), headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f'"{org_snapshot.version}"'
+
+    department = await RecursiveDepartmentLoader(True, session).exec(1, 1)
+    assert response.json() == department.model_dump(mode="json")
+
+
+@pytest.mark.parametrize("departments_data", [1], indirect=True)
+@pytest.mark.asyncio
+async def test_write_invalidates_snapshot(
+    client: AsyncClient, session: AsyncSession, created_departments: list[Department]
+) -> None:
+    await org_snapshot.rebuild()
+    data = {"department_id": 1, "full_name": "New Employee", "position": "Tester"}
+    await client.post(app.url_path_for("create_employee", id=1), json=data)
+    session.expunge_all()
+
+    response = await client.get(app.url_path_for("get_department", id=1))
+    assert "etag" not in response.headers
+    assert response.json()["employees"][0]["full_name"] == "New Employee"
+
+
+@pytest.mark.parametrize("departments_data", [1], indirect=True)
+@pytest.mark.asyncio
+async def test_write_of_other_process_invalidates_snapshot(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    await org_snapshot.rebuild()
+    # Запись другого процесса: сюда она не сообщает, но сдвигает ленту изменений
+    async with async_session_maker() as other:
+        department = await DepartmentRepository(other).create(
+            {"name": "Elsewhere", "parent_id": 1}
+        )
+
+    response = await client.get(app.url_path_for("get_department", id=1))
+    assert "etag" not in response.headers
+    assert [child["id"] for child in response.json()["children"]] == [department.id]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_reads_change_feed_head_rarely(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    await org_snapshot.rebuild()
+    get_head = ChangeRepository.get_head
+    calls = []
+
+    async def counting_get_head(self) -> int:
+        calls.append(1)
+        return await get_head(self)
+
+    monkeypatch.setattr(ChangeRepository, "get_head", counting_get_head)
+
+    # 2 не корень: снимок его не содержит, голова не нужна
+    await client.get(app.url_path_for("get_department", id=2))
+    assert calls == []
+    for _ in range(3):
+        response = await client.get(app.url_path_for("get_department", id=1))
+        assert "etag" in response.headers
+    assert calls == [1]
+
+
+@pytest.mark.parametrize("departments_data", [1], indirect=True)
+@pytest.mark.asyncio
+async def test_snapshot_is_not_gzipped_when_client_refuses_gzip(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    await org_snapshot.rebuild()
+    url = app.url_path_for("get_department", id=1)
+
+    response = await client.get(url, headers={"Accept-Encoding": "gzip;q=0, br"})
+    assert "etag" in response.headers
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_department_returns_only_requested_fields(
+    client: AsyncClient,
+    session: AsyncSession,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    session.expunge_all()
+    params = {"depth": 2, "fields": "id,name,employees.full_name"}
+    response = await client.get(app.url_path_for("get_department", id=6), params=params)
+    assert response.status_code == status.HTTP_200_OK
+
+    content = response.json()
+    assert set(content) == {"id", "name", "employees", "children"}
+    assert all(set(employee) == {"full_name"} for employee in content["employees"])
+    engineering = next(
+        child for child in content["children"] if child["name"] == "Engineering"
+    )
+    assert set(engineering) == {"id", "name", "employees", "children"}
+    assert set(engineering["children"][0]) == {"id", "name", "employees"}
+
+
+@pytest.mark.parametrize("fields", ["id,unknown", "employees.unknown"])
+@pytest.mark.asyncio
+async def test_get_department_returns_422_for_unknown_fields(
+    client: AsyncClient, fields: str
+) -> None:
+    params = {"fields": fields}
+    response = await client.get(app.url_path_for("get_department", id=1), params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+@pytest.mark.asyncio
+async def test_get_ancestors_returns_chain_from_root(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    response = await client.get(app.url_path_for("get_ancestors", id=5))
+    assert response.status_code == status.HTTP_200_OK
+
+    content = response.json()
+    assert [department["id"] for department in content] == [1, 2, 3, 4, 5]
+    assert content[0]["parent_id"] is None
+    assert content[-1]["name"] == "Vendor Management"
+
+
+@pytest.mark.asyncio
+async def test_get_ancestors_raises_404_if_does_not_exist(client: AsyncClient) -> None:
+    response = await client.get(app.url_path_for("get_ancestors", id=999))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_get_department_stats_aggregates_whole_subtree(
+    client: AsyncClient,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    params = {"depth": 1}
+    response = await client.get(
+        app.url_path_for("get_department_stats", id=1), params=params
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    root, operations = response.json()
+    assert (root["id"], root["level"]) == (1, 0)
+    assert (root["direct_employees"], root["total_employees"]) == (3, 15)
+    assert root["total_departments"] == 4
+    assert root["earliest_hired_at"] == "2014-03-17"
+    assert root["latest_hired_at"] == "2022-06-14"
+    assert (operations["id"], operations["level"]) == (2, 1)
+    assert (operations["direct_employees"], operations["total_employees"]) == (3, 12)
+
+
+@pytest.mark.asyncio
+async def test_get_department_stats_raises_404_if_does_not_exist(
+    client: AsyncClient,
+) -> None:
+    response = await client.get(app.url_path_for("get_department_stats", id=999))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_get_departments_batch_matches_single_gets(
+    client: AsyncClient,
+    session: AsyncSession,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    session.expunge_all()
+    # 2 входит в поддерево 1, 999 не существует, повтор 1 отбрасывается
+    params = {"ids": "1,2,999,1", "depth": 2}
+    response = await client.get(app.url_path_for("get_departments_batch"), params=params)
+    assert response.status_code == status.HTTP_200_OK
+
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [1, 2, 999]
+    assert items[2]["department"] is None
+    assert items[2]["error"] == "Department with id 999 does not exist"
+
+    for item in items[:2]:
+        session.expunge_all()
+        single = await client.get(
+            app.url_path_for("get_department", id=item["id"]), params={"depth": 2}
+        )
+        assert item["department"] == single.json()
+
+
+@pytest.mark.parametrize("ids", ["", "1,a"])
+@pytest.mark.asyncio
+async def test_get_departments_batch_returns_422_for_invalid_ids(
+    client: AsyncClient, ids: str
+) -> None:
+    params = {"ids": ids}
+    response = await client.get(app.url_path_for("get_departments_batch"), params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
 @pytest.mark.asyncio
 async def test_get_department_raises_404_if_does_not_exist(client: AsyncClient) -> None:
     params = {"depth": 1}
@@ -163,6 +567,20 @@ async def test_change_department_changes_name(
     assert department.name == changed_name
 
 
+@pytest.mark.asyncio
+async def test_change_department_raises_400_if_name_is_not_unique(
+    client: AsyncClient,
+    departments_data: FixtureContent,
+    department_repository: DepartmentRepository,
+) -> None:
+    await department_repository.bulk_create(departments_data)
+    data = {"name": "QA Team"}  # Сосед подразделения Engineering
+    response = await client.patch(
+        app.url_path_for("change_department", id=7), json=data
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 @pytest.mark.asyncio
 async def test_change_department_raises_400_if_id_and_parent_id_are_eq(
     client: AsyncClient,
@@ -179,6 +597,17 @@ async def test_change_department_raises_400_if_id_and_parent_id_are_eq(
     assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
+@pytest.mark.asyncio
+async def test_change_department_raises_400_if_parent_is_a_descendant(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    # 8 внутри поддерева 7, перенос замкнул бы цикл
+    response = await client.patch(
+        app.url_path_for("change_department", id=7), json={"parent_id": 8}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 @pytest.mark.asyncio
 async def test_change_department_raies_404_if_does_not_exist(
     client: AsyncClient,
@@ -237,6 +666,87 @@ async def test_delete_department_in_cascade_mode(
         assert not employee
 
 
+@pytest.mark.asyncio
+async def test_cascade_delete_is_soft_and_can_be_restored(
+    client: AsyncClient,
+    session: AsyncSession,
+    department_repository: DepartmentRepository,
+    employee_repository: EmployeeRepository,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    response = await client.delete(
+        app.url_path_for("delete_department", id=2), params={"mode": "cascade"}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    session.expunge_all()
+    assert not await department_repository.exists(2)
+    assert not await employee_repository.get(created_employees[3].id)
+    root = await department_repository.get_with_children(1)
+    assert root.children == []
+    assert root.subtree_employee_count == 3
+    assert not await counters.verify(session)
+
+    # Имя освобождается сразу, поэтому восстановление конфликтует с новым соседом
+    data = {"name": "Operations", "parent_id": 1}
+    response = await client.post(app.url_path_for("create_department"), json=data)
+    assert response.status_code == status.HTTP_201_CREATED
+    new_id = response.json()["id"]
+    response = await client.post(app.url_path_for("restore_department", id=2))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    await department_repository.cascade_delete(new_id)
+    response = await client.post(app.url_path_for("restore_department", id=2))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["subtree_employee_count"] == 12
+
+    session.expunge_all()
+    assert await department_repository.exists(5)
+    assert len(await employee_repository.get_all()) == 30
+    assert not await department_repository.exists(new_id)
+    assert not await counters.verify(session)
+
+    response = await client.post(app.url_path_for("restore_department", id=2))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_purge_removes_soft_deleted_rows_leaves_first(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    session: AsyncSession,
+    department_repository: DepartmentRepository,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    monkeypatch.setattr(purge_worker, "retention_s", 0)
+    monkeypatch.setattr(purge_worker, "batch_size", 2)
+    assert await purge_worker.start() is None
+
+    await department_repository.cascade_delete(2)
+    job = await purge_worker.start()
+    # Operations с потомками: 4 подразделения и 12 сотрудников
+    assert job.total == 16
+    await job_registry.wait(job.id)
+
+    response = await client.get(app.url_path_for("get_job", id=job.id))
+    assert response.json()["status"] == "done"
+    assert response.json()["processed"] == 16
+    result = await session.execute(
+        select(func.count()).select_from(Department).execution_options(
+            include_deleted=True
+        )
+    )
+    assert result.scalar_one() == 6
+
+
+@pytest.mark.asyncio
+async def test_get_job_returns_404_if_does_not_exist(client: AsyncClient) -> None:
+    response = await client.get(app.url_path_for("get_job", id="missing"))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 @pytest.mark.asyncio
 async def test_delete_returns_422_if_mode_is_invalid(client: AsyncClient) -> None:
     params = {"mode": "invalid"}
@@ -290,3 +800,442 @@ async def test_delete_department_in_reassign_mode(
 
     for employee in emoployees_of_deleted:
         assert employee.department_id == reassign_id
+
+
+@pytest.mark.asyncio
+async def test_reassign_delete_returns_400_and_keeps_department_on_conflict(
+    client: AsyncClient,
+) -> None:
+    url = app.url_path_for("create_department")
+    root = (await client.post(url, json={"name": "Root"})).json()["id"]
+    team = {"name": "Team", "parent_id": root}
+    await client.post(url, json=team)
+    deleted = (await client.post(url, json={"name": "Old", "parent_id": root})).json()
+    child = {"name": "Team", "parent_id": deleted["id"]}
+    child = (await client.post(url, json=child)).json()["id"]
+    grandchild = {"name": "Deep", "parent_id": child}
+    grandchild = (await client.post(url, json=grandchild)).json()["id"]
+
+    delete_url = app.url_path_for("delete_department", id=deleted["id"])
+    # В корне уже есть «Team», и в собственное поддерево переносить нельзя
+    for reassign_id in (root, child, grandchild, deleted["id"]):
+        params = {"mode": "reassign", "reassign_to_department_id": reassign_id}
+        response = await client.delete(delete_url, params=params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = await client.get(app.url_path_for("get_department", id=deleted["id"]))
+    assert [item["id"] for item in response.json()["children"]] == [child]
+
+
+@pytest.mark.asyncio
+async def test_export_organization_streams_ndjson(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    monkeypatch.setattr(env, "export_batch_size", 4)
+
+    response = await client.get(app.url_path_for("export_organization"))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    departments = [line for line in lines if line["type"] == "department"]
+    employees = [line for line in lines if line["type"] == "employee"]
+    assert len(departments) == len(created_departments)
+    assert len(employees) == len(created_employees)
+
+
+@pytest.mark.asyncio
+async def test_department_summary_is_read_after_refresh(
+    client: AsyncClient,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    url = app.url_path_for("department_summary")
+    response = await client.get(url)
+    assert response.json()["items"] == []  # Представление ещё не обновлено
+
+    await summary_refresher.refresh()
+
+    params = {"root_id": 2, "max_depth": 2, "limit": 1}
+    response = await client.get(url, params=params)
+    assert response.status_code == status.HTTP_200_OK
+
+    content = response.json()
+    operations = content["items"][0]
+    assert operations["path"] == "Corporate / Operations"
+    assert operations["path_ids"] == [1, 2]
+    assert (operations["headcount"], operations["subtree_headcount"]) == (3, 12)
+    assert operations["subtree_size"] == 3
+
+    params["cursor"] = content["next_cursor"]
+    response = await client.get(url, params=params)
+    assert [item["id"] for item in response.json()["items"]] == [3]
+
+
+@pytest.mark.asyncio
+async def test_write_schedules_summary_refresh(client: AsyncClient) -> None:
+    assert not summary_refresher.pending
+    data = {"name": "test_department"}
+    await client.post(app.url_path_for("create_department"), json=data)
+    assert summary_refresher.pending
+
+
+@pytest.mark.asyncio
+async def test_org_graph_follows_writes(
+    client: AsyncClient, session: AsyncSession, created_departments: list[Department]
+) -> None:
+    graph = await org_graph.get(session)
+    data = {"name": "New Team", "parent_id": 8}
+    response = await client.post(app.url_path_for("create_department"), json=data)
+    new_id = response.json()["id"]
+    # Своя запись видна сразу, без ожидания интервала
+    await org_graph.get(session)
+    assert list(graph.children(8)) == [new_id]
+
+    response = await client.delete(
+        app.url_path_for("delete_department", id=7), params={"mode": "cascade"}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    await org_graph.get(session)
+    assert list(graph.children(6)) == [10]
+    assert not graph.contains(7) and not graph.contains(new_id)
+
+
+@pytest.mark.asyncio
+async def test_org_graph_sees_writes_of_other_processes(
+    client: AsyncClient,
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    graph = await org_graph.get(session)
+    # Запись другого процесса: индекс этого процесса о ней не знает
+    async with async_session_maker() as other:
+        department = await DepartmentRepository(other).create(
+            {"name": "Elsewhere", "parent_id": 8}
+        )
+
+    # До интервала существование перепроверяется в БД
+    response = await client.get(app.url_path_for("get_department", id=department.id))
+    assert response.status_code == status.HTTP_200_OK
+    assert not graph.contains(department.id)
+
+    monkeypatch.setattr(org_graph, "sync_interval_s", 0)
+    response = await client.get(
+        app.url_path_for("get_department", id=8), params={"depth": 1}
+    )
+    children = [child["id"] for child in response.json()["children"]]
+    assert department.id in children
+
+
+@pytest.mark.asyncio
+async def test_ready_after_lifespan_warm_up(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    monkeypatch.setattr(lifespan, "get_session_maker", lambda: async_session_maker)
+    release = asyncio.Event()
+    warm_up = lifespan.warm_up
+
+    async def gated_warm_up(*args) -> None:
+        await release.wait()
+        await warm_up(*args)
+
+    monkeypatch.setattr(lifespan, "warm_up", gated_warm_up)
+    url = app.url_path_for("ready")
+
+    async with lifespan.lifespan(app):
+        # Сервер уже отвечает, а прогрев ещё идёт
+        assert (await client.get(url)).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        release.set()
+        await app.state.warm_up
+        assert (await client.get(url)).status_code == status.HTTP_200_OK
+        assert org_graph.loaded
+        async with async_session_maker() as session:
+            assert await org_snapshot.get(1, session)
+
+    assert (await client.get(url)).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_list_audit_events_paginates_changes_by_time(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    started = datetime.now(UTC)
+    await client.patch(app.url_path_for("change_department", id=7), json={"name": "R&D"})
+    await client.patch(
+        app.url_path_for("change_department", id=9), json={"parent_id": 6}
+    )
+    await client.delete(
+        app.url_path_for("delete_department", id=10), params={"mode": "cascade"}
+    )
+    await audit_log.flush()
+
+    url = app.url_path_for("list_audit_events")
+    params = {"since": started.isoformat(), "limit": 2}
+    response = await client.get(url, params=params)
+    page = response.json()
+    assert [(item["action"], item["entity_id"]) for item in page["items"]] == [
+        ("rename", 7),
+        ("move", 9),
+    ]
+    assert page["items"][1]["details"] == {"old_parent_id": 7, "parent_id": 6}
+    moved_at = page["items"][1]["occurred_at"]
+
+    response = await client.get(url, params={**params, "cursor": page["next_cursor"]})
+    page = response.json()
+    assert [item["action"] for item in page["items"]] == ["delete"]
+    assert page["next_cursor"] is None
+
+    response = await client.get(url, params={"until": moved_at})
+    assert [item["action"] for item in response.json()["items"]] == ["rename"]
+
+
+@pytest.mark.asyncio
+async def test_list_changes_returns_current_state_of_changed_rows(
+    client: AsyncClient,
+    created_departments: list[Department],
+    created_employees: list[Employee],
+) -> None:
+    url = app.url_path_for("list_changes")
+    head = (await client.get(url, params={"since": 0, "limit": 1})).json()["head"]
+    # Фикстуры записаны через репозитории: каждая строка попала в ленту
+    assert head == len(created_departments) + len(created_employees)
+
+    await client.patch(app.url_path_for("change_department", id=8), json={"name": "QA"})
+    await client.patch(app.url_path_for("change_department", id=8), json={"name": "SRE"})
+    employee = {"full_name": "New Hire", "position": "Engineer", "department_id": 9}
+    response = await client.post(
+        app.url_path_for("create_employee", id=9), json=employee
+    )
+    hired_id = response.json()["id"]
+    await client.delete(
+        app.url_path_for("delete_department", id=10), params={"mode": "cascade"}
+    )
+
+    response = await client.get(url, params={"since": head, "limit": 3})
+    feed = response.json()
+    assert feed["has_more"] is True
+    assert feed["next_since"] == head + 3
+    assert [item["name"] for item in feed["departments"]] == ["SRE"]
+    assert [item["id"] for item in feed["employees"]] == [hired_id]
+
+    response = await client.get(url, params={"since": feed["next_since"]})
+    feed = response.json()
+    deleted_employees = [e.id for e in created_employees if e.department_id == 10]
+    assert feed["has_more"] is False
+    assert feed["next_since"] == feed["head"] == head + 3 + 1 + len(deleted_employees)
+    assert feed["departments"] == feed["employees"] == []
+    assert feed["deleted_department_ids"] == [10]
+    assert feed["deleted_employee_ids"] == sorted(deleted_employees)
+
+    # Перенос при удалении затрагивает детей и сотрудников удаляемого подразделения
+    params = {"mode": "reassign", "reassign_to_department_id": 6}
+    await client.delete(app.url_path_for("delete_department", id=7), params=params)
+    response = await client.get(url, params={"since": feed["next_since"]})
+    feed = response.json()
+    assert [(item["id"], item["parent_id"]) for item in feed["departments"]] == [
+        (8, 6),
+        (9, 6),
+    ]
+    assert {item["department_id"] for item in feed["employees"]} == {6}
+    assert len(feed["employees"]) == 3
+    assert feed["deleted_department_ids"] == [7]
+
+    response = await client.get(url, params={"since": -1})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_first_response(
+    client: AsyncClient,
+    session: AsyncSession,
+    employee_repository: EmployeeRepository,
+    created_departments: list[Department],
+) -> None:
+    url = app.url_path_for("create_employee", id=8)
+    data = {"full_name": "Retried Hire", "position": "Engineer", "department_id": 8}
+    headers = {"Idempotency-Key": "hr-sync-42"}
+
+    # Дубль ждёт первый запрос, а не создаёт второго сотрудника
+    first, duplicate = await asyncio.gather(
+        client.post(url, json=data, headers=headers),
+        client.post(url, json=data, headers=headers),
+    )
+    retry = await client.post(url, json=data, headers=headers)
+    assert first.status_code == status.HTTP_201_CREATED
+    assert first.content == duplicate.content == retry.content
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+    session.expunge_all()
+    employees = await employee_repository.get_all()
+    assert [e.full_name for e in employees].count("Retried Hire") == 1
+
+    response = await client.post(
+        url, json={**data, "position": "Manager"}, headers=headers
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    response = await client.post(url, json=data)
+    assert response.json()["id"] != first.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_idempotency_keys_survive_in_postgres(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    monkeypatch.setattr(idempotency_store, "persist", True)
+    url = app.url_path_for("create_department")
+    data = {"name": "Legal", "parent_id": 1}
+    headers = {"Idempotency-Key": "hr-sync-43"}
+    first = await client.post(url, json=data, headers=headers)
+    assert first.status_code == status.HTTP_201_CREATED
+
+    # Другой процесс или перезапуск: LRU пуст, ответ берётся из таблицы
+    idempotency_store.reset()
+    retry = await client.post(url, json=data, headers=headers)
+    assert retry.content == first.content
+    assert retry.headers["idempotent-replayed"] == "true"
+
+    response = await client.post(url, json=data, headers={"Idempotency-Key": ""})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_waits_for_another_process(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    monkeypatch.setattr(idempotency_store, "persist", True)
+    url = app.url_path_for("create_department")
+    body = json.dumps({"name": "Legal", "parent_id": 1}).encode()
+    headers = {"Idempotency-Key": "hr-sync-44", "Content-Type": "application/json"}
+    fingerprint = hashlib.sha256(body).hexdigest()
+    expired_before = datetime.now(UTC) - timedelta(days=1)
+
+    # Другой процесс занял ключ и ещё выполняет запрос
+    async with async_session_maker() as other:
+        repository = IdempotencyKeyRepository(other)
+        for key in ("hr-sync-44", "hr-sync-46"):
+            assert await repository.claim(
+                f"{url}:{key}", fingerprint, expired_before, expired_before
+            )
+
+    async def finish_elsewhere() -> None:
+        await asyncio.sleep(0.2)
+        values = {
+            "key": f"{url}:hr-sync-44",
+            "fingerprint": fingerprint,
+            "status_code": status.HTTP_201_CREATED,
+            "headers": [("content-type", "application/json")],
+            "body": b'{"id": 100}',
+        }
+        async with async_session_maker() as other:
+            await IdempotencyKeyRepository(other).save(values, expired_before)
+
+    response, _ = await asyncio.gather(
+        client.post(url, content=body, headers=headers), finish_elsewhere()
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.content == b'{"id": 100}'
+    assert response.headers["idempotent-replayed"] == "true"
+    response = await client.post(url, content=body + b" ", headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+    # Ответа нет за `idempotency_wait_s`
+    monkeypatch.setattr(env, "idempotency_wait_s", 0.1)
+    headers["Idempotency-Key"] = "hr-sync-46"
+    response = await client.post(url, content=body, headers=headers)
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.headers["retry-after"] == "1"
+
+    response = await client.get(app.url_path_for("get_department", id=1))
+    assert "Legal" not in [child["name"] for child in response.json()["children"]]
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_outlives_timeout(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    calls = []
+    create_department = web.service_create_department
+
+    async def slow_service(*args) -> Department:
+        calls.append(args)
+        await asyncio.sleep(0.2)
+        return await create_department(*args)
+
+    monkeypatch.setitem(env.route_timeouts_s, "create_department", 0.05)
+    monkeypatch.setattr(web, "service_create_department", slow_service)
+    url = app.url_path_for("create_department")
+    data = {"name": "Legal", "parent_id": 1}
+    headers = {"Idempotency-Key": "hr-sync-45"}
+
+    response = await client.post(url, json=data, headers=headers)
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    # Обработчик дорабатывает без клиента, повтор ждёт его ответ, а не выполняется снова
+    monkeypatch.setitem(env.route_timeouts_s, "create_department", 5)
+    retry = await client.post(url, json=data, headers=headers)
+    assert retry.status_code == status.HTTP_201_CREATED
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_is_released_when_nothing_committed(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    created_departments: list[Department],
+) -> None:
+    calls = []
+    create_department = web.service_create_department
+
+    async def failing_service(
+        data: DepartmentIn, session: AsyncSession
+    ) -> Department:
+        calls.append(data)
+        if len(calls) == 1:
+            try:
+                await session.execute(text("SET LOCAL statement_timeout = 1"))
+                await session.execute(text("SELECT pg_sleep(1)"))
+            finally:
+                # Сессия теста общая для запросов, закрытие сессии запроса откатило бы
+                await session.rollback()
+        return await create_department(data, session)
+
+    monkeypatch.setattr(web, "service_create_department", failing_service)
+    url = app.url_path_for("create_department")
+    data = {"name": "Legal", "parent_id": 1}
+    headers = {"Idempotency-Key": "hr-sync-47"}
+
+    response = await client.post(url, json=data, headers=headers)
+    assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    # Запрос отменён до фиксации: повтор выполняется заново, а не ждёт
+    retry = await client.post(url, json=data, headers=headers)
+    assert retry.status_code == status.HTTP_201_CREATED
+    assert "idempotent-replayed" not in retry.headers
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_noop_move_and_empty_patch_are_not_audited(
+    client: AsyncClient, created_departments: list[Department]
+) -> None:
+    url = app.url_path_for("change_department", id=9)
+    response = await client.patch(url, json={})
+    assert response.status_code == status.HTTP_200_OK
+    assert not summary_refresher.pending
+
+    await client.patch(url, json={"parent_id": 7})
+    await audit_log.flush()
+    response = await client.get(app.url_path_for("list_audit_events"))
+    assert response.json()["items"] == []
@@ -1,7 +1,247 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from admission import AdmissionController
+from audit import AuditLog, audit_backpressure_total
+from background import Debouncer
+from exceptions import AdmissionRejected
+from idempotency import IdempotencyStore, StoredResponse
 from models import DepartmentIn
+from services import PurgeWorker
+from data.db_connection import statement_timeout_ms
+from data.org_graph import OrgGraph
+from data.repositories import DEPARTMENT_NODE, _select_by_id
+from data.sql_models import Department, Employee
+from data.slow_query_log import (
+    EXPLAIN_ANALYZE_PREFIX,
+    EXPLAIN_PREFIX,
+    SlowQueryLog,
+    explain_prefix,
+    fingerprint,
+)
 
 
 def test_strip_name_field() -> None:
     data = {"name": "   whites spaces             "}
     department = DepartmentIn(**data)
     assert not department.name == data["name"]
+
+
+def test_fingerprint_ignores_parameters_and_whitespace() -> None:
+    first = "SELECT * FROM departments WHERE id = $1::INTEGER"
+    second = "select *  FROM departments\n WHERE id = 42"
+    assert fingerprint(first) == fingerprint(second)
+
+
+def test_explain_analyze_runs_only_plain_reads() -> None:
+    read = "WITH RECURSIVE subtree AS (SELECT id FROM departments) SELECT * FROM subtree"
+    assert explain_prefix(read) == EXPLAIN_ANALYZE_PREFIX
+    writes = (
+        "WITH RECURSIVE chain AS (SELECT id FROM departments) UPDATE departments SET x=1",
+        "SELECT pg_advisory_xact_lock($1::BIGINT)",
+        "SELECT setval(pg_get_serial_sequence('departments', 'id'), 1)",
+        "SELECT id FROM departments FOR UPDATE SKIP LOCKED",
+        "INSERT INTO changes (entity, entity_id) SELECT $1, unnest($2)",
+    )
+    assert {explain_prefix(statement) for statement in writes} == {EXPLAIN_PREFIX}
+    assert explain_prefix("SET LOCAL statement_timeout = 100") is None
+
+
+def test_slow_query_log_forgets_start_of_failed_statement() -> None:
+    slow_query_log = SlowQueryLog(engine=None, threshold_ms=0, explain_interval_s=60)
+    connection = SimpleNamespace(info={"query_start": [1.0]})
+    slow_query_log._fail(SimpleNamespace(connection=connection))
+    assert connection.info["query_start"] == []
+
+
+def test_slow_query_log_rate_limits_explain_per_fingerprint() -> None:
+    slow_query_log = SlowQueryLog(engine=None, threshold_ms=0, explain_interval_s=60)
+    assert slow_query_log.should_explain("key")
+    assert not slow_query_log.should_explain("key")
+    assert slow_query_log.should_explain("other_key")
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_rejects_when_queue_is_full() -> None:
+    controller = AdmissionController(capacity=2, max_queue=1, queue_timeout_s=1)
+
+    async with controller.admit(2):
+        waiting = asyncio.create_task(admit(controller, 1))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await admit(controller, 1)
+
+    await waiting
+    assert controller.available == controller.capacity
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_sheds_after_queue_timeout() -> None:
+    controller = AdmissionController(capacity=2, max_queue=1, queue_timeout_s=0.01)
+
+    async with controller.admit(1):
+        with pytest.raises(AdmissionRejected):
+            await admit(controller, 2)
+
+    assert controller.available == controller.capacity
+
+
+async def admit(controller: AdmissionController, cost: int) -> None:
+    async with controller.admit(cost):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_debouncer_runs_callback_once_after_burst() -> None:
+    calls = []
+
+    async def callback() -> None:
+        calls.append(1)
+
+    debouncer = Debouncer(0.01, callback)
+    for _ in range(3):
+        debouncer.trigger()
+    await asyncio.sleep(0.05)
+
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_background_task_does_not_inherit_request_timeout() -> None:
+    timeouts = []
+
+    async def callback() -> None:
+        timeouts.append(statement_timeout_ms.get())
+
+    # Запись в запросе запускает пересборку, у неё не должно быть бюджета маршрута
+    token = statement_timeout_ms.set(5000)
+    try:
+        Debouncer(0.01, callback).trigger()
+    finally:
+        statement_timeout_ms.reset(token)
+    await asyncio.sleep(0.05)
+
+    assert timeouts == [None]
+
+
+# 1 -> 2 -> 3, 1 -> 4, 5 (второй корень)
+ORG_ROWS = [(1, None), (2, 1), (3, 2), (4, 1), (5, None)]
+
+
+def test_org_graph_answers_structural_queries() -> None:
+    graph = OrgGraph(sync_interval_s=1)
+    graph.load_rows(ORG_ROWS)
+
+    assert list(graph.children(1)) == [2, 4]
+    assert list(graph.children(3)) == []
+    assert graph.contains(5) and not graph.contains(6)
+
+
+def test_org_graph_applies_writes() -> None:
+    graph = OrgGraph(sync_interval_s=1)
+    graph.load_rows(ORG_ROWS)
+
+    graph.apply([7, 2], [(7, 5), (2, 5)])
+    assert list(graph.children(5)) == [2, 7]
+    assert list(graph.children(1)) == [4]
+
+    # Строки нет: подразделение удалено
+    graph.apply([2, 3], [(3, 4)])
+    assert list(graph.children(4)) == [3]
+    assert not graph.contains(2)
+    assert list(graph.children(2)) == list(graph.children(100)) == []
+
+
+def test_prebuilt_statements_are_shared_and_bound() -> None:
+    assert _select_by_id(Department) is _select_by_id(Department)
+    assert _select_by_id(Department) is not _select_by_id(Employee)
+    # Один и тот же текст SQL для любого ID, поэтому asyncpg берёт его из кэша
+    compiled = DEPARTMENT_NODE[True].compile()
+    assert compiled.params == {"id": None}
+    assert "departments.id = :id" in str(compiled)
+
+
+# Бюджет с запасом на шумные CI-машины: тест ловит регрессии вроде тяжёлого импорта
+IMPORT_TIME_BUDGET_MS = 2000
+# Драйвер загружается при создании движка, то есть при первом запросе к БД
+DEFERRED_MODULES = {"asyncpg"}
+
+
+def test_import_main_stays_within_budget() -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        check=True,
+    )
+    # Строки вида "import time:   self [us] | cumulative | module", первая из них
+    # заголовок. Предупреждения и прочий вывод в stderr пропускаются
+    cumulative_us = {}
+    lines = [line for line in result.stderr.splitlines() if line.startswith("import time:")]
+    for line in lines[1:]:
+        _, cumulative, module = line.split("|")
+        cumulative_us[module.strip()] = int(cumulative)
+
+    assert not DEFERRED_MODULES & cumulative_us.keys()
+    assert cumulative_us["main"] / 1000 < IMPORT_TIME_BUDGET_MS
+
+
+def test_purge_window_wraps_around_midnight() -> None:
+    night = PurgeWorker(retention_s=0, interval_s=1, batch_size=1, window_utc=(22, 6))
+    assert night.in_window(datetime(2026, 1, 1, 23, tzinfo=UTC))
+    assert night.in_window(datetime(2026, 1, 1, 5, tzinfo=UTC))
+    assert not night.in_window(datetime(2026, 1, 1, 12, tzinfo=UTC))
+
+
+@pytest.mark.asyncio
+async def test_audit_log_applies_backpressure_when_queue_is_full() -> None:
+    log = AuditLog(max_queue=1, batch_size=10, flush_interval_ms=10)
+    waited = audit_backpressure_total.get()
+    await log.record("create", "department", 1)
+
+    recording = asyncio.create_task(log.record("create", "department", 2))
+    await asyncio.sleep(0.01)
+    assert not recording.done()
+    assert audit_backpressure_total.get() == waited + 1
+
+    log._queue.get_nowait()
+    await recording
+    assert log.pending == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_store_evicts_least_recently_used(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    store = IdempotencyStore(max_entries=2, ttl_s=60, lease_s=10, persist=False)
+    response = StoredResponse("fingerprint", 201, [], b"{}")
+    for key in ("a", "b"):
+        await store.save(key, response)
+    assert await store.get("a") == response  # "b" становится самым старым
+    await store.save("c", response)
+    assert await store.get("b") is None
+    assert await store.get("a") == await store.get("c") == response
+
+    # Заглушка держит ключ, пока её не сняли
+    assert await store.claim("d", "fingerprint") is None
+    assert (await store.claim("d", "fingerprint")).pending
+    await store.release("d")
+    assert await store.claim("d", "fingerprint") is None
+
+    # Заглушку упавшего запроса можно занять снова после `lease_s`
+    now = time.monotonic()
+    monkeypatch.setattr("time.monotonic", lambda: now + 30)
+    assert await store.claim("d", "fingerprint") is None
+    assert await store.get("c") == response
+
+    monkeypatch.setattr("time.monotonic", lambda: float("inf"))
+    assert await store.get("a") is None
+    assert not StoredResponse("fingerprint", 503, [], b"").cacheable